@@ -0,0 +1,70 @@
+"""Runs a Python script while timing every module it imports
+
+Python 2 has no -X importtime, so this wraps __import__ instead and writes
+the same kind of breakdown to stderr once the script exits:
+
+    import time: self [us] | cumulative | imported package
+
+Usage: importtime.py <script> [<args>...]
+"""
+
+import __builtin__
+import atexit
+import os
+import runpy
+import sys
+from timeit import default_timer
+
+original_import = __builtin__.__import__
+
+# (module name, nesting depth, self microseconds, cumulative microseconds) in
+# the order the imports finished
+timings = []
+
+# Time spent in nested imports by each import that's still running
+nested_times = [0.0]
+
+
+def timed_import(name, globals=None, locals=None, fromlist=None, level=-1):
+    # Modules that are already loaded cost almost nothing, so only time the
+    # first import of each
+    if name in sys.modules:
+        return original_import(name, globals, locals, fromlist, level)
+
+    depth = len(nested_times)
+    nested_times.append(0.0)
+    start = default_timer()
+
+    try:
+        return original_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = default_timer() - start
+        nested = nested_times.pop()
+        nested_times[-1] += cumulative
+
+        timings.append((name, depth, cumulative - nested, cumulative))
+
+
+def report():
+    sys.stderr.write("import time: self [us] | cumulative | "
+                     "imported package\n")
+
+    for name, depth, self_time, cumulative in timings:
+        sys.stderr.write("import time: {:>9} | {:>10} | {}{}\n".format(
+            int(self_time * 1e6), int(cumulative * 1e6), "  " * (depth - 1),
+            name))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+
+    script = sys.argv[1]
+
+    sys.argv = sys.argv[1:]
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+
+    atexit.register(report)
+    __builtin__.__import__ = timed_import
+
+    runpy.run_path(script, run_name="__main__")
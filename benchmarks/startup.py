@@ -0,0 +1,280 @@
+"""Startup benchmarks for Climesync
+
+Runs Climesync commands in fresh processes against a local stub TimeSync
+server. For each command it reports the median time until the first output
+and until the process exits, how many HTTP requests were sent and over how
+many connections, and how long imports took.
+
+Commands are run twice over: "cold" runs start with an empty home directory
+every time, while "warm" runs reuse the stored token and cached metadata left
+by the run before them. Import times come from one extra run of each command
+under importtime.py, which adds some overhead of its own.
+
+The stub server's data set can be made larger and its responses slower or
+less reliable to see how commands behave on a real network.
+
+Usage: startup.py [-h] [--runs=<n>] [--imports=<n>] [--save=<path>]
+                  [--compare=<path>] [--threshold=<percent>]
+                  [--users=<n>] [--projects=<n>] [--times=<n>]
+                  [--latency=<ms>] [--jitter=<ms>] [--error-rate=<rate>]
+
+Options:
+    -h --help              Show this help message and exit
+    --runs=<n>             Number of times to run each command [default: 5]
+    --imports=<n>          Show the n slowest imports of each command
+                           [default: 0]
+    --save=<path>          Save the results as JSON
+    --compare=<path>       Compare the results with results saved earlier
+                           and exit with status 1 on a regression
+    --threshold=<percent>  How much slower a command may get before it's
+                           considered a regression [default: 20]
+    --users=<n>            Number of users on the server [default: 5]
+    --projects=<n>         Number of projects on the server [default: 10]
+    --times=<n>            Number of times on the server [default: 200]
+    --latency=<ms>         Delay before every response [default: 0]
+    --jitter=<ms>          Largest random delay added to the latency
+                           [default: 0]
+    --error-rate=<rate>    Fraction of requests the server answers with an
+                           error [default: 0]
+
+Examples:
+    python benchmarks/startup.py --save=baseline.json
+
+    python benchmarks/startup.py --compare=baseline.json --imports=10
+
+    python benchmarks/startup.py --projects=500 --latency=80 --jitter=40
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer
+
+from docopt import docopt
+
+from stub_server import StubTimeSync, synthetic_data
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+climesync_script = os.path.join(root, "climesync", "climesync.py")
+importtime_script = os.path.join(root, "benchmarks", "importtime.py")
+
+commands = [
+    ("help",           ["--help"]),
+    ("get-times",      ["get-times"]),
+    ("get-projects",   ["get-projects"]),
+    ("get-activities", ["get-activities"]),
+    ("get-users",      ["get-users"]),
+    ("project-users",  ["get-users", "--project=p0"]),
+    ("create-time",    ["create-time", "1h0m", "p0", "a0"]),
+]
+
+
+def write_config(home, url):
+    with open(os.path.join(home, ".climesyncrc"), "w") as f:
+        f.write("[climesync]\n"
+                "timesync_url = {}\n"
+                "username = user0\n"
+                "password = password\n"
+                "ldap = False\n".format(url))
+
+
+def run_command(args, home, profile_imports=False):
+    """Runs Climesync once and returns the seconds until its first output,
+    the seconds until it exited, and its import time breakdown"""
+
+    env = dict(os.environ, HOME=home, PYTHONIOENCODING="utf-8")
+
+    if profile_imports:
+        argv = [sys.executable, importtime_script, climesync_script] + args
+    else:
+        argv = [sys.executable, climesync_script] + args
+
+    start = default_timer()
+
+    process = subprocess.Popen(argv, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+
+    process.stdout.read(1)
+    first_output = default_timer() - start
+
+    process.stdout.read()
+    errors = process.stderr.read()
+    process.wait()
+
+    wall = default_timer() - start
+
+    return first_output, wall, parse_import_times(errors)
+
+
+def parse_import_times(output):
+    """Returns (module, self microseconds, cumulative microseconds, depth)
+    tuples from import time lines"""
+
+    imports = []
+
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line or \
+                "self [us]" in line:
+            continue
+
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+
+        imports.append((name.strip(), int(self_time), int(cumulative),
+                        depth))
+
+    return imports
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+
+    if len(values) % 2:
+        return values[middle]
+
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def benchmark(server, runs, show_imports):
+    results = {}
+
+    for scenario in ("cold", "warm"):
+        for name, args in commands:
+            first_outputs = []
+            walls = []
+            requests = 0
+            connections = 0
+
+            home = tempfile.mkdtemp()
+
+            try:
+                write_config(home, server.url)
+
+                # Warm runs start from what an earlier run left behind
+                if scenario == "warm":
+                    run_command(args, home)
+
+                for i in range(runs):
+                    if scenario == "cold" and i:
+                        shutil.rmtree(home)
+                        os.mkdir(home)
+                        write_config(home, server.url)
+
+                    server.reset_counts()
+
+                    first_output, wall, _ = run_command(args, home)
+
+                    first_outputs.append(first_output)
+                    walls.append(wall)
+                    requests = server.request_count()
+                    connections = server.connection_count()
+
+                server.reset_counts()
+                imports = run_command(args, home, profile_imports=True)[2]
+            finally:
+                shutil.rmtree(home)
+
+            top_level = [i for i in imports if i[3] <= 1]
+
+            results["{} {}".format(scenario, name)] = {
+                "first_output_ms": round(median(first_outputs) * 1000, 1),
+                "wall_ms": round(median(walls) * 1000, 1),
+                "requests": requests,
+                "connections": connections,
+                "import_ms": round(sum(i[2] for i in top_level) / 1000.0, 1),
+                "slowest_imports": [
+                    [module, round(cumulative / 1000.0, 1)]
+                    for module, self_time, cumulative, depth in sorted(
+                        top_level, key=lambda i: -i[2])[:show_imports]
+                ]
+            }
+
+    return results
+
+
+def print_results(results):
+    print "{:<24} {:>14} {:>10} {:>10} {:>9} {:>12}".format(
+        "command", "first output", "wall", "imports", "requests",
+        "connections")
+
+    for key in sorted(results):
+        result = results[key]
+
+        print ("{:<24} {:>11.1f} ms {:>7.1f} ms {:>7.1f} ms {:>9} "
+               "{:>12}").format(
+            key, result["first_output_ms"], result["wall_ms"],
+            result["import_ms"], result["requests"],
+            result.get("connections", ""))
+
+        for module, cumulative in result["slowest_imports"]:
+            print "    {:<34} {:>7.1f} ms".format(module, cumulative)
+
+
+def compare_results(results, baseline, threshold):
+    """Returns a description of every command that got slower by more than
+    threshold percent or sends more requests than in baseline"""
+
+    regressions = []
+
+    for key, old in sorted(baseline.iteritems()):
+        new = results.get(key)
+
+        if new is None:
+            continue
+
+        if new["wall_ms"] > old["wall_ms"] * (1 + threshold / 100.0):
+            regressions.append("{}: {:.1f} ms -> {:.1f} ms".format(
+                key, old["wall_ms"], new["wall_ms"]))
+
+        if new["requests"] > old["requests"]:
+            regressions.append("{}: {} -> {} requests".format(
+                key, old["requests"], new["requests"]))
+
+    return regressions
+
+
+def main():
+    args = docopt(__doc__)
+
+    data = synthetic_data(users=int(args["--users"]),
+                          projects=int(args["--projects"]),
+                          times=int(args["--times"]))
+
+    server = StubTimeSync(data, latency=float(args["--latency"]) / 1000,
+                          jitter=float(args["--jitter"]) / 1000,
+                          error_rate=float(args["--error-rate"])).start()
+
+    try:
+        results = benchmark(server, int(args["--runs"]),
+                            int(args["--imports"]))
+    finally:
+        server.stop()
+
+    print_results(results)
+
+    if args["--save"]:
+        with open(args["--save"], "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args["--compare"]:
+        with open(args["--compare"]) as f:
+            baseline = json.load(f)
+
+        regressions = compare_results(results, baseline,
+                                      float(args["--threshold"]))
+
+        if regressions:
+            print "\nRegressions:"
+
+            for regression in regressions:
+                print "    " + regression
+
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,451 @@
+"""A minimal stand-in for a TimeSync server, for benchmarking Climesync
+
+The server keeps a synthetic set of users, projects, activities and times in
+memory, answers the requests Pymesync sends, and counts them. To imitate a
+real network it can delay every response and fail some of them, either with
+an error status or by closing the connection without answering.
+
+Responses to GET requests carry an ETag, and requests whose If-None-Match
+header matches it are answered with 304 Not Modified, unless the server is
+started with --no-validators.
+
+Usage: stub_server.py [-h] [--port=<port>] [--users=<n>] [--projects=<n>]
+                      [--activities=<n>] [--times=<n>] [--latency=<ms>]
+                      [--jitter=<ms>] [--error-rate=<rate>]
+                      [--error-status=<status>] [--drop-rate=<rate>]
+                      [--seed=<seed>] [--no-validators]
+
+Options:
+    -h --help                Show this help message and exit
+    --port=<port>            Port to listen on [default: 8000]
+    --users=<n>              Number of users [default: 5]
+    --projects=<n>           Number of projects [default: 10]
+    --activities=<n>         Number of activities [default: 5]
+    --times=<n>              Number of times [default: 200]
+    --latency=<ms>           Delay before every response [default: 0]
+    --jitter=<ms>            Largest random delay added to the latency
+                             [default: 0]
+    --error-rate=<rate>      Fraction of requests answered with an error
+                             [default: 0]
+    --error-status=<status>  HTTP status of those errors [default: 500]
+    --drop-rate=<rate>       Fraction of requests whose connection is closed
+                             without an answer [default: 0]
+    --seed=<seed>            Seed for choosing delays and failed requests
+                             [default: 0]
+    --no-validators          Don't send ETags or answer 304 Not Modified
+
+Examples:
+    python benchmarks/stub_server.py --times=100000 --projects=500
+
+    python benchmarks/stub_server.py --latency=80 --jitter=40 --error-rate=0.05
+"""
+
+import base64
+import hashlib
+import json
+import random
+import socket
+import sys
+import threading
+import uuid
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from time import sleep, time as current_timestamp
+from urlparse import parse_qs, urlparse
+
+# The field that identifies the objects of each endpoint in URLs
+object_keys = {
+    "times": "uuid",
+    "projects": "slugs",
+    "activities": "slug",
+    "users": "username"
+}
+
+
+def make_token(username, lifetime=3600):
+    """Returns a token in the format Pymesync decodes the expiration time
+    from"""
+
+    header = base64.b64encode(json.dumps({"alg": "none"}))
+    payload = base64.b64encode(json.dumps({
+        "sub": username,
+        "exp": int((current_timestamp() + lifetime) * 1000)
+    }))
+
+    return "{}.{}.".format(header, payload)
+
+
+def synthetic_data(users=5, projects=10, activities=5, times=200):
+    """Returns a deterministic set of TimeSync objects of the given sizes.
+    The first user, user0, is a site admin and a member of every project"""
+
+    usernames = ["user{}".format(i) for i in range(users)]
+    activity_slugs = ["a{}".format(i) for i in range(activities)]
+
+    data = {
+        "users": [{
+            "username": username,
+            "display_name": "User {}".format(i),
+            "email": "{}@example.com".format(username),
+            "site_admin": i == 0,
+            "site_manager": False,
+            "site_spectator": False,
+            "meta": None,
+            "active": True,
+            "created_at": "2015-01-01",
+            "deleted_at": None
+        } for i, username in enumerate(usernames)],
+        "projects": [{
+            "uuid": str(uuid.UUID(int=i + 1)),
+            "name": "Project {}".format(i),
+            "slugs": ["p{}".format(i)],
+            "uri": "https://example.com/p{}".format(i),
+            "default_activity": None,
+            "users": {username: {"member": True, "spectator": j == 0,
+                                 "manager": j == 0}
+                      for j, username in enumerate(usernames)
+                      if j == 0 or (i + j) % 3 == 0},
+            "revision": 1,
+            "created_at": "2015-01-01",
+            "updated_at": None,
+            "deleted_at": None
+        } for i in range(projects)],
+        "activities": [{
+            "uuid": str(uuid.UUID(int=1000 + i)),
+            "name": "Activity {}".format(i),
+            "slug": slug,
+            "revision": 1,
+            "created_at": "2015-01-01",
+            "updated_at": None,
+            "deleted_at": None
+        } for i, slug in enumerate(activity_slugs)],
+        "times": [{
+            "uuid": str(uuid.UUID(int=100000 + i)),
+            "duration": 900 * (1 + i % 16),
+            "user": usernames[i % users],
+            "project": ["p{}".format(i % projects)],
+            "activities": [activity_slugs[i % activities]],
+            "notes": "Time {}".format(i),
+            "issue_uri": None,
+            "date_worked": "2016-{:02}-{:02}".format(
+                1 + i % 12, 1 + i % 28),
+            "revision": 1,
+            "created_at": "2016-01-01",
+            "updated_at": None,
+            "deleted_at": None
+        } for i in range(times)]
+    }
+
+    return data
+
+
+def filter_times(times, query):
+    """Applies TimeSync's GET /times filters"""
+
+    def matches(time):
+        if "user" in query and time["user"] not in query["user"]:
+            return False
+
+        if "project" in query and \
+                not set(time["project"]).intersection(query["project"]):
+            return False
+
+        if "activity" in query and \
+                not set(time["activities"]).intersection(query["activity"]):
+            return False
+
+        if "start" in query and time["date_worked"] < query["start"][0]:
+            return False
+
+        if "end" in query and time["date_worked"] > query["end"][0]:
+            return False
+
+        return True
+
+    return [t for t in times if matches(t)]
+
+
+class StubTimeSync(ThreadingMixIn, HTTPServer):
+    """An in-memory TimeSync server listening on localhost"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, data=None, port=0, latency=0, jitter=0, error_rate=0,
+                 error_status=500, drop_rate=0, seed=0, validators=True):
+        """Latency and jitter are in seconds. error_rate and drop_rate are the
+        fractions of requests to fail, chosen at random from seed"""
+
+        HTTPServer.__init__(self, ("127.0.0.1", port), StubHandler)
+
+        self.data = data if data is not None else synthetic_data()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drop_rate = drop_rate
+        self.validators = validators
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.connections = 0
+        self.not_modified = 0
+        self.faults = {"errors": 0, "drops": 0}
+        self.thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/v0".format(self.server_address[1])
+
+    def start(self):
+        """Serves requests in a background thread"""
+
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Clients that time out or give up on a slow response close the
+        # connection before it's written, which isn't a server error
+        if not isinstance(sys.exc_info()[1], socket.error):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def count(self, method, endpoint):
+        with self.lock:
+            key = "{} {}".format(method, endpoint)
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def reset_counts(self):
+        with self.lock:
+            self.requests = {}
+            self.connections = 0
+            self.not_modified = 0
+            self.faults = {"errors": 0, "drops": 0}
+
+    def request_count(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def connection_count(self):
+        with self.lock:
+            return self.connections
+
+    def choose_fault(self):
+        """Returns how long to delay a response and whether to answer it with
+        an error ("error"), drop it ("drop") or answer it normally (None)"""
+
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            roll = self.random.random()
+
+            if roll < self.drop_rate:
+                fault = "drop"
+            elif roll < self.drop_rate + self.error_rate:
+                fault = "error"
+            else:
+                fault = None
+
+            if fault:
+                self.faults[fault + "s"] += 1
+
+        return delay, fault
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    # Keep connections open between requests like a real server would, so
+    # clients that reuse them can be measured
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body=None):
+        content = "" if body is None else json.dumps(body)
+        etag = None
+
+        if self.command == "GET" and status == 200 and self.server.validators:
+            etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+
+            if self.headers.getheader("If-None-Match") == etag:
+                with self.server.lock:
+                    self.server.not_modified += 1
+
+                status = 304
+                content = ""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+
+        if etag:
+            self.send_header("ETag", etag)
+
+        self.end_headers()
+        self.wfile.write(content)
+
+    def not_found(self):
+        self.respond(404, {"error": "Object not found", "status": 404,
+                           "text": "Nonexistent object"})
+
+    def route(self):
+        """Splits the request path into an endpoint and an object identifier
+        and counts the request"""
+
+        url = urlparse(self.path)
+        parts = url.path.split("/")[2:]  # Leave out the /v0 prefix
+
+        endpoint = parts[0] if parts else ""
+        identifier = parts[1] if len(parts) > 1 else None
+
+        self.server.count(self.command, endpoint)
+
+        return endpoint, identifier, parse_qs(url.query)
+
+    def inject_fault(self):
+        """Delays the response and fails it if the server chose to. Returns
+        True if the request was failed"""
+
+        delay, fault = self.server.choose_fault()
+
+        if delay:
+            sleep(delay)
+
+        if fault == "drop":
+            self.close_connection = 1
+            return True
+
+        if fault == "error":
+            status = self.server.error_status
+            self.respond(status, {"error": "Injected error", "status": status,
+                                  "text": "The stub server failed this "
+                                          "request on purpose"})
+            return True
+
+        return False
+
+    def find(self, endpoint, identifier):
+        for obj in self.server.data.get(endpoint, []):
+            key = obj[object_keys[endpoint]]
+
+            if identifier == key or \
+                    (isinstance(key, list) and identifier in key):
+                return obj
+
+        return None
+
+    def read_body(self):
+        length = int(self.headers.getheader("Content-Length") or 0)
+
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_GET(self):
+        endpoint, identifier, query = self.route()
+
+        if self.inject_fault():
+            return
+
+        if endpoint not in object_keys:
+            return self.not_found()
+
+        if identifier is not None:
+            obj = self.find(endpoint, identifier)
+            return self.respond(200, obj) if obj else self.not_found()
+
+        objects = self.server.data[endpoint]
+
+        if endpoint == "times":
+            objects = filter_times(objects, query)
+
+        if query.get("include_deleted") != ["true"]:
+            objects = [o for o in objects if not o.get("deleted_at")]
+
+        self.respond(200, objects)
+
+    def do_POST(self):
+        endpoint, identifier, _ = self.route()
+
+        if self.inject_fault():
+            return
+        body = self.read_body()
+
+        if endpoint == "login":
+            username = body.get("auth", {}).get("username")
+            return self.respond(200, {"token": make_token(username)})
+
+        if endpoint not in object_keys:
+            return self.not_found()
+
+        fields = body.get("object", {})
+
+        with self.server.lock:
+            if identifier is None:
+                obj = dict(fields, uuid=str(uuid.uuid4()), revision=1,
+                           created_at="2016-06-01", updated_at=None,
+                           deleted_at=None)
+                self.server.data[endpoint].append(obj)
+            else:
+                obj = self.find(endpoint, identifier)
+
+                if obj is None:
+                    return self.not_found()
+
+                obj.update(fields)
+                obj["revision"] = obj.get("revision", 0) + 1
+                obj["updated_at"] = "2016-06-01"
+
+        self.respond(200, obj)
+
+    def do_DELETE(self):
+        endpoint, identifier, _ = self.route()
+
+        if self.inject_fault():
+            return
+
+        obj = self.find(endpoint, identifier) if identifier else None
+
+        if obj is None:
+            return self.not_found()
+
+        obj["deleted_at"] = "2016-06-01"
+
+        self.respond(200)
+
+
+if __name__ == "__main__":
+    from docopt import docopt
+
+    args = docopt(__doc__)
+
+    data = synthetic_data(users=int(args["--users"]),
+                          projects=int(args["--projects"]),
+                          activities=int(args["--activities"]),
+                          times=int(args["--times"]))
+
+    server = StubTimeSync(data, port=int(args["--port"]),
+                          latency=float(args["--latency"]) / 1000,
+                          jitter=float(args["--jitter"]) / 1000,
+                          error_rate=float(args["--error-rate"]),
+                          error_status=int(args["--error-status"]),
+                          drop_rate=float(args["--drop-rate"]),
+                          seed=int(args["--seed"]),
+                          validators=not args["--no-validators"])
+
+    print "Serving a stub TimeSync at {}".format(server.url)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
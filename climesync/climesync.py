@@ -12,6 +12,10 @@ Options:
     -l               --ldap                      Authenticate using LDAP
     -f <config_file> --config-file=<config_file> Use a config file other than
                                                  the default ~/.climesyncrc
+    -t --trace                                   Print the requests sent to
+                                                 TimeSync and their timings
+                     --trace-file=<path>         Also append those requests to
+                                                 a JSON Lines file
 
 Commands:
 
@@ -19,9 +23,16 @@ Commands:
     clock-out             Clock out and submit the completed time to the server
 
     create-time           Submit a new time
+    create-times          Submit many times from a CSV or JSON Lines file
+    queue                 List the times waiting to be submitted
     update-time           Update the fields of an existing time
     get-times             List and optionally filter times on the server
+    sum-times             Total the times on the server by user, project,
+                          activity, day, week, or month
+    sync-times            Update the local mirror of times on the server
     delete-time           Delete a time
+    update-times          Update many times selected by UUID or filter
+    delete-times          Delete many times selected by UUID or filter
 
     create-project        Create a new project
     update-project        Update the fields of an existing project
@@ -40,6 +51,12 @@ Commands:
     get-users             List all users or get information on a specific user
     delete-user           Delete a user
 
+    refresh-metadata      Re-download the cached users, projects and
+                          activities
+
+    daemon                Keep a signed in connection open for other
+                          climesync commands to use
+
 By default, Climesync starts in interactive mode and allows the user to enter
 commands into a shell. However, you can access certain Climesync functionality
 without going into interactive mode by calling them from the command line.
@@ -50,12 +67,19 @@ climesync <command> --help
 """
 
 import sys  # NOQA flake8 ignore
+from datetime import datetime
 
 from docopt import docopt
 
-import commands
+import daemon
+import tracing
 import util
 
+# The command implementations, imported by load_commands() once a command
+# actually needs them. Importing them pulls in Pymesync and its dependencies,
+# which --help and commands forwarded to the daemon never use
+commands = None
+
 menu_options = (
     "\n"
     "===============================================================\n"
@@ -71,6 +95,7 @@ menu_options = (
     "ct - submit time\n"
     "ut - update time\n"
     "gt - get times\n"
+    "st - sum times\n"
     "dt - delete time\n\n"
     "cp - create project\n"
     "up - update project\n"
@@ -86,52 +111,93 @@ menu_options = (
     "uu - update user\n"
     "gu - get users\n"
     "du - delete user\n\n"
-    "us - update user settings\n\n"
+    "us - update user settings\n"
+    "rm - refresh cached users, projects, and activities\n\n"
     "h - print this menu\n"
     "q - exit\n")
 
 # Lookup table for Climesync commands in both interactive mode and
 # scripting mode. Table entries are represented as a tuple in the form
-# (interactive_name, scripting_name, command)
+# (interactive_name, scripting_name, command_function_name)
 command_lookup = [
-    ("c",   None,                   commands.connect),
-    ("dc",  None,                   commands.disconnect),
-    ("s",   None,                   commands.sign_in),
-    ("so",  None,                   commands.sign_out),
-    ("ci",  "clock-in",             commands.clock_in),
-    ("co",  "clock-out",            commands.clock_out),
-    ("ct",  "create-time",          commands.create_time),
-    ("ut",  "update-time",          commands.update_time),
-    ("gt",  "get-times",            commands.get_times),
-    ("dt",  "delete-time",          commands.delete_time),
-    ("cp",  "create-project",       commands.create_project),
-    ("up",  "update-project",       commands.update_project),
-    ("upu", "update-project-users", commands.update_project_users),
-    ("rpu", "remove-project-users", commands.remove_project_users),
-    ("gp",  "get-projects",         commands.get_projects),
-    ("dp",  "delete-project",       commands.delete_project),
-    ("ca",  "create-activity",      commands.create_activity),
-    ("ua",  "update-activity",      commands.update_activity),
-    ("ga",  "get-activities",       commands.get_activities),
-    ("da",  "delete-activity",      commands.delete_activity),
-    ("cu",  "create-user",          commands.create_user),
-    ("uu",  "update-user",          commands.update_user),
-    ("gu",  "get-users",            commands.get_users),
-    ("du",  "delete-user",          commands.delete_user),
-    ("us",  None,                   commands.update_settings),
+    ("c",   None,                   "connect"),
+    ("dc",  None,                   "disconnect"),
+    ("s",   None,                   "sign_in"),
+    ("so",  None,                   "sign_out"),
+    ("ci",  "clock-in",             "clock_in"),
+    ("co",  "clock-out",            "clock_out"),
+    ("ct",  "create-time",          "create_time"),
+    (None,  "create-times",         "create_times"),
+    (None,  "queue",                "queue"),
+    ("ut",  "update-time",          "update_time"),
+    ("gt",  "get-times",            "get_times"),
+    ("st",  "sum-times",            "sum_times"),
+    (None,  "sync-times",           "sync_times"),
+    ("dt",  "delete-time",          "delete_time"),
+    (None,  "update-times",         "update_times"),
+    (None,  "delete-times",         "delete_times"),
+    ("cp",  "create-project",       "create_project"),
+    ("up",  "update-project",       "update_project"),
+    ("upu", "update-project-users", "update_project_users"),
+    ("rpu", "remove-project-users", "remove_project_users"),
+    ("gp",  "get-projects",         "get_projects"),
+    ("dp",  "delete-project",       "delete_project"),
+    ("ca",  "create-activity",      "create_activity"),
+    ("ua",  "update-activity",      "update_activity"),
+    ("ga",  "get-activities",       "get_activities"),
+    ("da",  "delete-activity",      "delete_activity"),
+    ("cu",  "create-user",          "create_user"),
+    ("uu",  "update-user",          "update_user"),
+    ("gu",  "get-users",            "get_users"),
+    ("du",  "delete-user",          "delete_user"),
+    ("us",  None,                   "update_settings"),
+    ("rm",  "refresh-metadata",     "refresh_metadata"),
 ]
 
+# The command lookup table indexed by interactive name (column 0) and by
+# scripting name (column 1)
+command_index = [{c[col]: c for c in command_lookup if c[col] is not None}
+                 for col in (0, 1)]
+
+# Options in the configuration file that set a variable of the same name in
+# commands, along with the ConfigParser method used to read them
+command_settings = [
+    ("autoupdate_config",   "getboolean"),
+    ("reuse_token",         "getboolean"),
+    ("background_metadata", "getboolean"),
+    ("queue_writes",        "getboolean"),
+    ("max_workers",         "getint"),
+    ("pool_size",           "getint"),
+    ("connect_timeout",     "getfloat"),
+    ("read_timeout",        "getfloat"),
+    ("response_cache_ttl",  "getint"),
+    ("metadata_cache_ttl",  "getint"),
+    ("full_sync_days",      "getint"),
+]
+
+
+def load_commands():
+    """Import the command implementations the first time they're needed"""
+
+    global commands
+
+    if commands is None:
+        import commands
+
+    return commands
+
 
 def lookup_command(name, col):
     """Look for a command in the command lookup table by matching a name
        with a value in the specified column
     """
-    names = [c[col] for c in command_lookup]
-    if name in names:
-        return command_lookup[names.index(name)][2]
-    else:
+    entry = command_index[col].get(name)
+
+    if entry is None:
         return None
 
+    return getattr(load_commands(), entry[2])
+
 
 def menu():
     """Provide an interactive shell for the user to execute commands"""
@@ -141,6 +207,7 @@ def menu():
 
     if command:
         util.print_pretty(command())
+        report_trace(choice)
     elif choice == "h":
         print menu_options
     elif choice == "q":
@@ -158,14 +225,64 @@ def interactive_mode():
 
 
 def scripting_mode(command_name, argv):
-    """Call a climesync command with command line arguments"""
+    """Call a climesync command with command line arguments. Returns the exit
+    status, which is 1 if the command returned an error"""
     command = lookup_command(command_name, 1)
 
     if command:
-        util.print_json(command(argv))
+        response = command(argv)
+
+        util.print_json(response)
+        report_trace(command_name)
+
+        if isinstance(response, dict) and ("error" in response or
+                                           "pymesync error" in response or
+                                           "climesync error" in response):
+            return 1
     else:
         print __doc__
 
+    return 0
+
+
+def report_trace(command_name):
+    """Print the requests a command sent to TimeSync if they're traced"""
+
+    if commands is not None and commands.tracer is not None:
+        commands.tracer.report(command_name)
+
+
+def flush_queued_times():
+    """Submit the times queued by earlier runs that are due to be retried"""
+
+    counts = commands.flush_outbox()
+
+    if counts["submitted"] or counts["failed"]:
+        sys.stderr.write("Submitted {} queued times, {} failed (See climesync "
+                         "queue)\n".format(counts["submitted"],
+                                           counts["failed"]))
+
+
+def daemon_mode(socket_path, sign_in_kwargs):
+    """Run scripting mode commands sent by other climesync processes until
+    the daemon is stopped"""
+
+    def run(command_name, argv):
+        # Sign in again once the daemon's token has expired
+        expiration = commands.ts.token_expiration_time()
+
+        if isinstance(expiration, dict) or expiration <= datetime.now():
+            commands.sign_in(interactive=False, **sign_in_kwargs)
+
+        # Pick up users, projects, and activities changed by other clients
+        commands.expire_metadata()
+
+        flush_queued_times()
+
+        return scripting_mode(command_name, argv)
+
+    return daemon.serve(run, socket_path)
+
 
 def main(argv=None, test=False):
     # Command line arguments
@@ -187,18 +304,53 @@ def main(argv=None, test=False):
     try:
         config_obj = util.read_config(config_file)
 
-        if config_obj.has_option("climesync", "autoupdate_config"):
-            commands.autoupdate_config = \
-                config_obj.getboolean("climesync", "autoupdate_config")
+        settings = {}
+
+        for key, getter in command_settings:
+            if config_obj.has_option("climesync", key):
+                settings[key] = getattr(config_obj, getter)("climesync", key)
 
         config_dict = dict(config_obj.items("climesync"))
 
-        # Turn "ldap" into a bool instead of a string
-        if config_obj.has_option("climesync", "ldap"):
-            config_dict["ldap"] = config_obj.getboolean("climesync", "ldap")
+        # Turn "ldap" and "trace" into bools instead of strings
+        for key in ("ldap", "trace"):
+            if config_obj.has_option("climesync", key):
+                config_dict[key] = config_obj.getboolean("climesync", key)
     except:
+        settings = {}
         config_dict = {}
 
+    socket_path = config_dict.get("daemon_socket",
+                                  daemon.default_socket_path)
+
+    trace_file = args['--trace-file'] or config_dict.get("trace_file")
+    trace = args['--trace'] or config_dict.get("trace") or bool(trace_file)
+
+    if command == "daemon":
+        daemon_args = docopt(daemon.__doc__, argv=argv)
+
+        if daemon_args["--stop"]:
+            if not daemon.stop(socket_path):
+                util.print_json({"climesync error": "The daemon isn't "
+                                                    "running"})
+            return
+    elif command and not test and not (url or user or password or ldap or
+                                       args['--config-file'] or trace):
+        # Let a running daemon run the command with its open connection
+        status = daemon.forward(command, argv, socket_path)
+
+        if status is not None:
+            if status:
+                sys.exit(status)
+            return
+
+    load_commands()
+
+    for key, value in settings.iteritems():
+        setattr(commands, key, value)
+
+    commands.tracer = tracing.Tracer(trace_file) if trace else None
+
     # Attempt to connect with arguments and/or config
     response = commands.connect(arg_url=url, config_dict=config_dict,
                                 interactive=interactive, test=test)
@@ -214,10 +366,26 @@ def main(argv=None, test=False):
             "climesync error" in response:
         util.print_json(response)
 
-    if command:
-        scripting_mode(command, argv)
+    # Times queued by earlier runs are submitted once TimeSync is reachable
+    if "token" in response and not test:
+        flush_queued_times()
+
+    if command == "daemon":
+        if "token" not in response:
+            return
+
+        util.print_json(daemon_mode(socket_path,
+                                    {"arg_user": user, "arg_pass": password,
+                                     "arg_ldap": ldap,
+                                     "config_dict": config_dict}))
+    elif command:
+        status = scripting_mode(command, argv)
+
+        if status:
+            sys.exit(status)
     else:
         util.print_json(response)
+        report_trace("sign-in")
 
         try:
             interactive_mode()
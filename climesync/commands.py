@@ -1,9 +1,16 @@
-from datetime import date, datetime
+import csv
+import sys
+import threading
+from datetime import date, datetime, timedelta
 
 import pymesync
 from docopt import docopt
 
+import outbox
+import timestore
+import transport
 import util
+from timetable import TimeTable
 
 ts = None  # pymesync.TimeSync object
 
@@ -14,6 +21,84 @@ activities = None
 
 autoupdate_config = True
 
+# Number of project slugs to request times for at once when computing project
+# time summaries
+summary_chunk_size = 50
+
+# Maximum number of requests to send to TimeSync at the same time
+max_workers = 8
+
+# Number of connections to TimeSync kept open for reuse. At least max_workers
+# are always kept
+pool_size = 10
+
+# Number of seconds to wait for TimeSync to accept a connection and to send
+# each response. A value of 0 waits forever
+connect_timeout = 10
+read_timeout = 0
+
+# Number of seconds users, projects, and activities requested from a TimeSync
+# server that doesn't send ETag or Last-Modified headers are reused for
+# without requesting them again. A value of 0 always requests them again
+response_cache_ttl = 60
+
+# Number of seconds the on-disk user/project/activity metadata cache is valid
+# for. A value of 0 disables the cache
+metadata_cache_ttl = 3600
+
+# Where the local mirror of TimeSync times used by get-times --local is kept
+time_store_path = timestore.default_path
+
+# Number of days before the last sync that times are requested again when
+# updating the local time mirror
+sync_overlap_days = 31
+
+# Number of days after which updating the local time mirror requests every
+# time again, so changes to times worked before the last sync_overlap_days
+# aren't missed for good. A value of 0 always requests every time
+full_sync_days = 7
+
+# Whether create-time and clock-out queue times in the outbox instead of
+# submitting them right away
+queue_writes = False
+
+# Where times waiting to be submitted are queued
+outbox_path = outbox.default_path
+
+# Whether to store auth tokens in ~/.climesynctoken and reuse them in later
+# runs instead of authenticating every time
+reuse_token = True
+
+# Number of seconds before a stored token expires that it stops being reused
+token_refresh_margin = 300
+
+# Number of times get-times has to return in interactive mode before they're
+# kept in a TimeTable instead of a list of dicts
+time_table_min_rows = 1000
+
+# tracing.Tracer that records the requests sent to TimeSync, if --trace is on
+tracer = None
+
+# Whether interactive mode loads users, projects, and activities in the
+# background after signing in instead of waiting for them before the first
+# prompt
+background_metadata = True
+
+# The thread loading metadata in the background, if there is one
+metadata_thread = None
+
+# When the cached user, users, projects, and activities were last loaded
+metadata_loaded_at = None
+
+# Projects and users being requested ahead of time by prefetch(), as (thread,
+# result) by (endpoint, slug or username)
+prefetched = {}
+prefetch_lock = threading.Lock()
+
+# The project slug and username most recently picked to be changed in
+# interactive mode, which are the likeliest to be picked next
+last_selected = {"projects": None, "users": None}
+
 
 # climesync_command decorator
 class climesync_command():
@@ -55,6 +140,9 @@ class climesync_command():
                 if util.check_token_expiration(ts):
                     return {"error": "You need to sign in."}
 
+                # Interactive commands validate input against cached data
+                ensure_metadata()
+
                 try:
                     return command()
                 except IndexError as e:
@@ -90,14 +178,22 @@ def connect(arg_url="", config_dict=dict(), test=False, interactive=True):
     if interactive and not test and autoupdate_config:
         util.add_kv_pair("timesync_url", url)
 
+    wait_for_metadata()
+
+    # Share one pool of open connections between every TimeSync instance and
+    # worker thread
+    if not test:
+        transport.install(max(pool_size, max_workers), connect_timeout,
+                          read_timeout, response_cache_ttl)
+
     # Create a new instance and attempt to connect to the provided url
     ts = pymesync.TimeSync(baseurl=url, test=test)
 
+    if tracer is not None:
+        ts = tracer.wrap(ts)
+
     # Clear cached TS objects
-    user = None
-    users = None
-    projects = None
-    activities = None
+    forget_metadata()
 
     # No response from server upon connection
     return list()
@@ -108,6 +204,8 @@ def disconnect():
 
     global ts
 
+    wait_for_metadata()
+
     ts = None
 
     # No response from server
@@ -123,6 +221,8 @@ def sign_in(arg_user="", arg_pass="", arg_ldap=None, config_dict=dict(),
     if not ts:
         return {"error": "Not connected to TimeSync server"}
 
+    wait_for_metadata()
+
     username = ""
     password = ""
     ldap = None
@@ -161,40 +261,285 @@ def sign_in(arg_user="", arg_pass="", arg_ldap=None, config_dict=dict(),
 
     auth_type = "ldap" if ldap else "password"
 
-    # Attempt to authenticate and return the server's response
-    res = ts.authenticate(username, password, auth_type)
+    # Attempt to reuse a stored token, then to authenticate and return the
+    # server's response
+    res = reuse_stored_token(username, password, auth_type)
 
-    # Cache user object and other TimeSync data
-    if not util.ts_error(res):
-        users = ts.get_users()
-        projects = ts.get_projects()
-        activities = ts.get_activities()
+    if res is None:
+        res = ts.authenticate(username, password, auth_type)
 
-        if not util.ts_error(users, projects, activities):
-            if ts.test:
-                user = users[0]
-                user["projects"] = []
-                user["project_slugs"] = ["test"]
-            else:
-                user = {u["username"]: u for u in users}[username]
-                user["projects"] = [p for p in projects
-                                    if "users" in p
-                                    and user["username"] in p["users"]]
-                user["project_slugs"] = [p["slugs"][0]
-                                         for p in user["projects"]]
-
-            users = [u["username"] for u in users]
-            projects = [p["slugs"][0] for p in projects]
-            activities = [a["slug"] for a in activities]
+        if reuse_token and not ts.test and not util.ts_error(res):
+            util.write_token(ts.baseurl, username, auth_type, ts.token)
+
+    # Cache user object and other TimeSync data. Outside of interactive mode
+    # it's only loaded once a command needs it (See ensure_metadata)
+    user = None
+    users = None
+    projects = None
+    activities = None
+
+    with prefetch_lock:
+        prefetched.clear()
+
+    if not util.ts_error(res) and interactive:
+        if background_metadata and not ts.test:
+            start_metadata_load()
+        else:
+            load_metadata()
+
+    return res
+
+
+def reuse_stored_token(username, password, auth_type):
+    """Signs in with the token stored by an earlier run, unless there isn't
+    one or it's about to expire. Returns None if it can't be used"""
+
+    global ts
+
+    if not reuse_token or ts.test:
+        return None
+
+    token = util.read_token(ts.baseurl, username, auth_type)
+
+    if not token:
+        return None
+
+    ts.token = token
+    expiration = ts.token_expiration_time()
+    refresh_time = datetime.now() + timedelta(seconds=token_refresh_margin)
+
+    if isinstance(expiration, dict) or expiration <= refresh_time:
+        ts.token = None
+        return None
+
+    # The same attributes ts.authenticate sets, so the token can be renewed
+    ts.user = username
+    ts.password = password
+    ts.auth_type = auth_type
+
+    return {"token": token}
+
+
+def load_metadata(refresh=False, quiet=False):
+    """Fills in the cached user, users, projects, and activities, either from
+    the on-disk metadata cache or from the TimeSync server. Errors aren't
+    printed if quiet is True"""
+
+    global ts, user, users, projects, activities, metadata_loaded_at
+
+    use_cache = not ts.test and metadata_cache_ttl > 0
+
+    if refresh:
+        transport.clear_cache()
+    elif use_cache:
+        metadata = util.read_metadata_cache(ts.baseurl, ts.user,
+                                            metadata_cache_ttl)
+
+        if metadata:
+            user = metadata["user"]
+            users = metadata["users"]
+            projects = metadata["projects"]
+            activities = metadata["activities"]
+            metadata_loaded_at = datetime.now()
+            return
+
+    users = ts.get_users()
+    projects = ts.get_projects()
+    activities = ts.get_activities()
+
+    if not util.ts_error(users, projects, activities):
+        if ts.test:
+            user = users[0]
+            user["projects"] = []
+            user["project_slugs"] = ["test"]
         else:
+            user = {u["username"]: u for u in users}[ts.user]
+            user["projects"] = [p for p in projects
+                                if "users" in p
+                                and user["username"] in p["users"]]
+            user["project_slugs"] = [p["slugs"][0]
+                                     for p in user["projects"]]
+
+        users = [u["username"] for u in users]
+        projects = [p["slugs"][0] for p in projects]
+        activities = [a["slug"] for a in activities]
+        metadata_loaded_at = datetime.now()
+
+        if use_cache:
+            util.write_metadata_cache(ts.baseurl, ts.user, {
+                "user": user,
+                "users": users,
+                "projects": projects,
+                "activities": activities
+            })
+    else:
+        if not quiet:
             for o in (users, projects, activities):
                 util.ts_error(o)
 
-            users = None
-            projects = None
-            activities = None
+        forget_metadata()
 
-    return res
+
+def forget_metadata():
+    """Clears the cached user, users, projects, and activities, so they're
+    loaded again the next time they're needed"""
+
+    global user, users, projects, activities, metadata_loaded_at
+
+    user = None
+    users = None
+    projects = None
+    activities = None
+    metadata_loaded_at = None
+
+
+def expire_metadata():
+    """Forgets the cached user, users, projects, and activities if they were
+    loaded more than metadata_cache_ttl seconds ago, so a long-running daemon
+    sees changes made by other clients"""
+
+    wait_for_metadata()
+
+    if metadata_loaded_at is not None and datetime.now() - \
+            metadata_loaded_at >= timedelta(seconds=metadata_cache_ttl):
+        forget_metadata()
+
+
+def ensure_metadata():
+    """Loads the cached user, users, projects, and activities if they haven't
+    been loaded since signing in"""
+
+    global ts, users
+
+    wait_for_metadata()
+
+    if ts and ts.token and users is None:
+        load_metadata()
+
+
+def start_metadata_load():
+    """Starts loading the cached user, users, projects, and activities in a
+    background thread, so the first prompt can be shown while they're being
+    requested. If it fails, ensure_metadata() tries again and reports why"""
+
+    global metadata_thread
+
+    wait_for_metadata()
+
+    metadata_thread = threading.Thread(target=load_metadata,
+                                       kwargs={"quiet": True})
+    metadata_thread.daemon = True
+    metadata_thread.start()
+
+
+def wait_for_metadata():
+    """Waits for the metadata being loaded in the background, if it is"""
+
+    global metadata_thread
+
+    thread = metadata_thread
+
+    if thread is not None:
+        thread.join()
+        metadata_thread = None
+
+
+def invalidate_metadata(response):
+    """Clears the cached metadata, both in memory and on disk for the current
+    server, if response shows that users, projects, or activities were
+    successfully changed"""
+
+    result = response[0] if isinstance(response, list) and response \
+        else response
+
+    if not result or "error" in result or "pymesync error" in result:
+        return response
+
+    wait_for_metadata()
+    forget_metadata()
+
+    if not ts.test:
+        util.clear_metadata_cache(ts.baseurl)
+
+    return response
+
+
+def fetch_project(slug, fetched):
+    """Returns the project with a slug, only requesting it from TimeSync if it
+    isn't already in fetched, the dict of projects fetched so far by the
+    running command"""
+
+    if slug not in fetched:
+        fetched[slug] = fetch_object("projects", slug)
+
+    return fetched[slug]
+
+
+def request_object(endpoint, key):
+    """Requests the project with a slug or the user with a username"""
+
+    if endpoint == "projects":
+        return ts.get_projects({"slug": key})[0]
+
+    return ts.get_users(username=key)[0]
+
+
+def prefetch(endpoint, key):
+    """Starts requesting a project or user in a background thread, so
+    fetch_object() can use it instead of waiting for a new request"""
+
+    if key is None or not ts or ts.test:
+        return
+
+    with prefetch_lock:
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(request_object(endpoint, key)))
+        thread.daemon = True
+
+        prefetched[(endpoint, key)] = (thread, result)
+
+    thread.start()
+
+
+def fetch_object(endpoint, key):
+    """Returns a project or user, waiting for it if it's being prefetched
+    and requesting it otherwise. Anything else prefetched from the endpoint
+    wasn't picked and is dropped so it's never used once it's stale"""
+
+    with prefetch_lock:
+        entry = prefetched.pop((endpoint, key), None)
+
+        for other in [k for k in prefetched if k[0] == endpoint]:
+            del prefetched[other]
+
+    if entry is not None:
+        thread, result = entry
+        thread.join()
+
+        if result:
+            return result[0]
+
+    return request_object(endpoint, key)
+
+
+def select_object(endpoint, prompt, validator):
+    """Asks for the slug of a project or the username of a user to change,
+    prefetching the likeliest choice while the user is typing"""
+
+    likely = last_selected[endpoint]
+
+    if likely is None and endpoint == "users":
+        likely = ts.user
+    elif likely is None and user and user.get("project_slugs"):
+        likely = user["project_slugs"][0]
+
+    prefetch(endpoint, likely)
+
+    key = util.get_field(prompt, validator=validator)
+    last_selected[endpoint] = key
+
+    return key
 
 
 def sign_out():
@@ -205,17 +550,22 @@ def sign_out():
     if not ts:
         return {"error": "Not connected to TimeSync server"}
 
+    wait_for_metadata()
+
     url = ts.baseurl
     test = ts.test
 
+    if ts.token and not test:
+        util.write_token(url, ts.user, ts.auth_type, None)
+
     # Create a new instance connected to the same server as the last
     ts = pymesync.TimeSync(baseurl=url, test=test)
 
+    if tracer is not None:
+        ts = tracer.wrap(ts)
+
     # Clear cached TS objects
-    user = None
-    users = None
-    projects = None
-    activities = None
+    forget_metadata()
 
     # No response from server
     return list()
@@ -235,7 +585,34 @@ def update_settings():
                                  ("*display_name", "Updated display name"),
                                  ("*email", "Updated email address")])
 
-    return ts.update_user(user=post_data, username=username)
+    return invalidate_metadata(ts.update_user(user=post_data,
+                                              username=username))
+
+
+@climesync_command()
+def refresh_metadata(post_data=None):
+    """refresh-metadata
+
+Usage: refresh-metadata [-h]
+
+Options:
+    -h --help  Show this help message and exit
+
+Examples:
+    climesync refresh-metadata
+    """
+
+    global ts, users
+
+    if not ts:
+        return {"error": "Not connected to TimeSync server"}
+
+    load_metadata(refresh=True)
+
+    if users is None:
+        return {"error": "Couldn't refresh users, projects, and activities"}
+
+    return "Refreshed users, projects, and activities"
 
 
 @climesync_command(optional_args=True)
@@ -303,7 +680,7 @@ Usage: clock-out [-h] [<activities> ...]
                       [--activities=<activities>]
                       [--date-worked=<date_worked>]
                       [--issue-uri=<issue_uri>]
-                      [--notes=<notes>]
+                      [--notes=<notes>] [--queue]
 
 Arguments:
     <activities>                 Activities worked on (Optional if the project
@@ -320,6 +697,8 @@ Options:
                                  supply the date worked
     --issue-uri=<issue_uri>      The URI of the issue on an issue tracker
     --notes=<notes>              Additional notes
+    --queue                      Queue the time to be submitted later instead
+                                 of waiting for the server (See queue)
 
 Examples:
     climesync clock-out
@@ -333,6 +712,8 @@ Examples:
     if interactive:
         post_data = {}
 
+    queue = post_data.pop("queue", False)
+
     if not ts:
         return {"error": "Not connected to TimeSync server"}
 
@@ -346,7 +727,8 @@ Examples:
 
     now = util.current_datetime()
 
-    project = ts.get_projects({"slug": session["project"]})[0]
+    fetched_projects = {}
+    project = fetch_project(session["project"], fetched_projects)
 
     # Construct the base time from session data
     time = util.construct_clock_out_time(session, now, post_data, project)
@@ -391,10 +773,11 @@ Examples:
 
         post_data.update(revisions)
 
-        project = ts.get_projects({"slug": time["project"]})[0]
+        project = fetch_project(time["project"], fetched_projects)
 
-    response = ts.create_time(time=time)
+    response = submit_time(time, queue)
 
+    # Once the time is queued it's safe to clear the session as well
     if not util.ts_error(response):
         util.clear_session()
 
@@ -408,7 +791,7 @@ def create_time(post_data=None):
 Usage: create-time [-h] <duration> <project> [<activities> ...]
                         [--date-worked=<date_worked>]
                         [--issue-uri=<issue_uri>]
-                        [--notes=<notes>]
+                        [--notes=<notes>] [--queue]
 
 Arguments:
     <duration>    Duration of time entry
@@ -421,6 +804,8 @@ Options:
     --date-worked=<date_worked>  The date of the entry [Default: today]
     --issue-uri=<issue_uri>      The URI of the issue on an issue tracker
     --notes=<notes>              Additional notes
+    --queue                      Queue the time to be submitted later instead
+                                 of waiting for the server (See queue)
 
 Examples:
     climesync create-time 1h0m projectx docs design qa
@@ -471,11 +856,329 @@ Examples:
     if "activities" in post_data and isinstance(post_data["activities"], str):
         post_data["activities"] = [post_data["activities"]]
 
+    queue = post_data.pop("queue", False)
+
     # Use the currently authenticated user
     post_data["user"] = ts.user
 
     # Attempt to create a time and return the response
-    return ts.create_time(time=post_data)
+    return submit_time(post_data, queue)
+
+
+def submit_time(time, queue=False):
+    """Submits a new time, or adds it to the outbox to be submitted later if
+    asked to or if TimeSync can't be reached right now"""
+
+    global ts
+
+    if queue or queue_writes:
+        entry = outbox.add(time, ts.baseurl, ts.user, outbox_path)
+
+        return {"note": "The time was queued to be submitted later",
+                "key": entry["key"]}
+
+    # Pymesync converts the duration in the time it's given
+    response = ts.create_time(time=dict(time))
+    result = response[0] if isinstance(response, list) else response
+
+    if util.is_transient_error(result):
+        message = util.error_message(result)
+
+        entry = outbox.add(time, ts.baseurl, ts.user, outbox_path)
+        outbox.record_failure(entry, message, True)
+        outbox.save(entry, outbox_path)
+
+        return {"note": u"Couldn't submit the time ({}), so it was queued "
+                        u"to be submitted later".format(message),
+                "key": entry["key"]}
+
+    return response
+
+
+def flush_outbox(force=False):
+    """Submits the signed in user's queued times that are due to be retried,
+    or all of them if force is True. Returns how many were submitted and
+    how many failed again"""
+
+    global ts
+
+    counts = {"submitted": 0, "failed": 0}
+
+    queued = [e for e in outbox.entries(ts.baseurl, ts.user, outbox_path)
+              if force or outbox.is_due(e)]
+
+    def submit(entry):
+        # An earlier attempt may have reached the server even though it
+        # failed, so don't create the time twice. If the server can't be
+        # asked, the time stays queued until it can
+        if entry["uncertain"]:
+            submitted = already_submitted(entry)
+
+            if isinstance(submitted, dict):
+                return entry, submitted, True
+            elif submitted:
+                return entry, None, False
+
+        response = ts.create_time(time=dict(entry["time"]))
+
+        if isinstance(response, list):
+            response = response[0]
+
+        return entry, response, util.is_transient_error(response)
+
+    for entry, response, transient in util.map_concurrently(submit, queued,
+                                                            max_workers):
+        if response is None or not ("error" in response or
+                                    "pymesync error" in response):
+            outbox.remove(entry["key"], outbox_path)
+            counts["submitted"] += 1
+        else:
+            outbox.record_failure(entry, util.error_message(response),
+                                  transient)
+            outbox.save(entry, outbox_path)
+            counts["failed"] += 1
+
+    return counts
+
+
+def already_submitted(entry):
+    """Checks whether the time in an outbox entry is already on the server.
+    Returns the error response instead if the server couldn't be asked"""
+
+    global ts
+
+    time = entry["time"]
+
+    times = ts.get_times(query_parameters={"user": [entry["user"]],
+                                           "project": [time["project"]],
+                                           "start": [time["date_worked"]],
+                                           "end": [time["date_worked"]]})
+
+    if isinstance(times, dict):
+        times = [times]
+
+    if times and ("error" in times[0] or "pymesync error" in times[0]):
+        return times[0]
+
+    return any("uuid" in t and outbox.matches(entry, t) for t in times)
+
+
+@climesync_command(optional_args=True)
+def queue(post_data=None):
+    """queue
+
+Usage: queue [-h] [--flush] [--drop=<key>]
+
+Options:
+    -h --help     Show this help message and exit
+    --flush       Submit every queued time now, including ones that failed
+    --drop=<key>  Remove a time from the queue without submitting it
+
+Lists the times queued by create-time and clock-out that haven't been
+submitted yet. Queued times are submitted the next time climesync runs, and
+retried later if the server still can't be reached. Times rejected by the
+server stay in the queue until they're flushed or dropped.
+
+Examples:
+    climesync queue
+
+    climesync queue --drop=6e7ab3ea9d0c4a7f8f3c2b1d0e9f8a7b
+    """
+
+    global ts
+
+    if not ts:
+        return {"error": "Not connected to TimeSync server"}
+
+    if post_data is None:
+        post_data = {}
+
+    if post_data.get("drop"):
+        if not outbox.remove(post_data["drop"], outbox_path):
+            return {"error": u"No time is queued as {}"
+                             .format(post_data["drop"])}
+
+        return {"note": u"Removed {} from the queue".format(post_data["drop"])}
+
+    if post_data.get("flush"):
+        return flush_outbox(force=True)
+
+    queued = outbox.entries(ts.baseurl, ts.user, outbox_path)
+
+    if not queued:
+        return {"note": "No times are queued"}
+
+    return [{"key": e["key"],
+             "queued_at": datetime.fromtimestamp(int(e["queued_at"]))
+                                  .isoformat(),
+             "project": e["time"].get("project"),
+             "duration": util.duration_seconds(e["time"].get("duration")),
+             "date_worked": e["time"].get("date_worked"),
+             "status": "failed" if e["failed"] else "pending",
+             "attempts": e["attempts"],
+             "last_error": e["last_error"]} for e in queued]
+
+
+@climesync_command(optional_args=True)
+def create_times(post_data=None):
+    """create-times
+
+Usage: create-times [-h] --from-file=<path> [--format=<format>]
+                         [--report=<path>]
+
+Options:
+    -h --help           Show this help message and exit
+    --from-file=<path>  A CSV or JSON Lines file of times to submit, or - to
+                        read from stdin
+    --format=<format>   The format of the file, either csv or jsonl
+                        (Defaults to the file's extension)
+    --report=<path>     Write the result of every time to a CSV file
+
+File format:
+    Each CSV row or JSON object holds the fields of one time: duration,
+    project, activities, date_worked, issue_uri and notes. Durations are
+    given in seconds or as <value>h<value>m and date_worked defaults to
+    today. CSV files written by get-times --csv can be submitted as-is.
+
+Examples:
+    climesync create-times --from-file=times.csv --report=results.csv
+
+    export-times | climesync create-times --from-file=- --format=jsonl
+    """
+
+    global ts, projects, activities
+
+    if not ts:
+        return {"error": "Not connected to TimeSync server"}
+
+    path = post_data["from_file"]
+    file_format = post_data.get("format")
+
+    if not file_format:
+        file_format = "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+
+    if file_format not in ("csv", "jsonl"):
+        return {"error": "Unknown file format {}".format(file_format)}
+
+    # Times are validated against the cached project and activity slugs
+    ensure_metadata()
+
+    if projects is None or activities is None:
+        return {"error": "Couldn't get projects and activities"}
+
+    try:
+        times_file = sys.stdin if path == "-" else open(path, "rb")
+    except IOError as e:
+        return {"error": u"Couldn't open {}: {}".format(path, e.strerror)}
+
+    report_file = None
+    report = None
+
+    counts = {"created": 0, "invalid": 0, "failed": 0}
+
+    def submit(row):
+        line, time = row
+        response = ts.create_time(time=time)
+
+        if isinstance(response, list):
+            response = response[0]
+
+        return line, response
+
+    def record(line, status, uuid="", error=""):
+        counts[status] += 1
+
+        if report:
+            report.writerow({"line": line, "status": status, "uuid": uuid,
+                             "error": error})
+        elif error:
+            message = u"Line {}: {}\n".format(line, error)
+            sys.stderr.write(message.encode("utf-8"))
+
+    def submit_batch(batch):
+        responses = util.map_concurrently(submit, batch, max_workers)
+
+        for line, response in responses:
+            if "error" in response or "pymesync error" in response:
+                record(line, "failed", error=util.error_message(response))
+            else:
+                record(line, "created", uuid=response.get("uuid", ""))
+
+    try:
+        if post_data.get("report"):
+            report_path = post_data["report"]
+
+            try:
+                report_file = open(report_path, "wb")
+            except IOError as e:
+                return {"error": u"Couldn't open {}: {}".format(
+                    report_path, e.strerror)}
+
+            report = util.UnicodeDictWriter(report_file,
+                                            ["line", "status", "uuid",
+                                             "error"],
+                                            quoting=csv.QUOTE_ALL)
+            report.writeheader()
+
+        batch = []
+
+        for line, time, error in util.read_times_file(times_file,
+                                                      file_format):
+            error = error or validate_time(time)
+
+            if error:
+                record(line, "invalid", error=error)
+                continue
+
+            time["user"] = ts.user
+            batch.append((line, time))
+
+            # Only keep a bounded number of times in memory at once
+            if len(batch) >= max(max_workers, 1) * 10:
+                submit_batch(batch)
+                batch = []
+
+        submit_batch(batch)
+    finally:
+        if times_file is not sys.stdin:
+            times_file.close()
+
+        if report_file:
+            report_file.close()
+
+    return counts
+
+
+def validate_time(time):
+    """Checks a time to be submitted against the cached project and activity
+    slugs. Returns an error message if it isn't valid and None otherwise"""
+
+    global projects, activities
+
+    missing = [f for f in ("duration", "project") if f not in time]
+
+    if missing:
+        return u"Missing {}".format(", ".join(missing))
+
+    duration = time["duration"]
+
+    if not (isinstance(duration, int) and duration >= 0) and \
+            not (isinstance(duration, basestring) and util.is_time(duration)):
+        return u"Invalid duration {}".format(duration)
+
+    if not util.is_date(time["date_worked"]):
+        return u"Invalid date worked {}".format(time["date_worked"])
+
+    if time["project"] not in projects:
+        return u"Unknown project {}".format(time["project"])
+
+    unknown_activities = [a for a in time.get("activities", [])
+                          if a not in activities]
+
+    if unknown_activities:
+        return u"Unknown activities {}".format(", ".join(unknown_activities))
+
+    return None
 
 
 @climesync_command(select_arg="uuid", optional_args=True)
@@ -551,7 +1254,7 @@ Usage: get-times [-h] [--user=<users>] [--project=<projects>]
                       [--end=<end date>] [--uuid=<uuid>]
                       [--include-revisions=<True/False>]
                       [--include-deleted=<True/False>]
-                      [--csv]
+                      [--window=<days>] [--local] [--csv]
 
 Options:
     -h --help                         Show this help message and exit
@@ -566,6 +1269,12 @@ Options:
                                       --include-deleted are ignored
 `   --include-revisions=<True/False>  Whether to include all time revisions
 `   --include-deleted=<True/False>    Whether to include deleted times
+    --window=<days>                   Request times from the server in
+                                      windows of this many days at once and
+                                      print them as they arrive (Requires
+                                      both the start and end dates)
+    --local                           Update the local time mirror, then
+                                      answer from it (See sync-times)
     --csv                             Output the result in CSV format
 
 Examples:
@@ -575,6 +1284,11 @@ Examples:
 
     climesync get-times --user="userone usertwo" --csv > times.csv
 
+    climesync get-times --start=2015-01-01 --end=2015-12-31 --window=31
+`       --csv > times.csv
+
+    climesync get-times --project=projectx --start=2016-01-01 --local
+
     climesync get-times --uuid=12345676-1c9a-rrrr-bbbb-89b4544cad56
     """
 
@@ -598,26 +1312,58 @@ Examples:
                                      ("*?include_deleted", "Allow deleted?"),
                                      ("*uuid", "By UUID")])
 
-    if "user" in post_data and isinstance(post_data["user"], str):
-        post_data["user"] = [post_data["user"]]
+    fix_time_query(post_data)
+
+    window = post_data.pop("window", None)
+    local = post_data.pop("local", False)
 
-    if "project" in post_data and isinstance(post_data["project"], str):
-        post_data["project"] = [post_data["project"]]
+    if local:
+        times = local_times(post_data)
 
-    if "activity" in post_data and isinstance(post_data["activity"], str):
-        post_data["activity"] = [post_data["activity"]]
+        if isinstance(times, dict):
+            return times
+    elif window is not None and "uuid" not in post_data:
+        if not str(window).isdigit() or int(window) < 1:
+            return {"error": "The window must be a positive number of days"}
 
-    if "start" in post_data:
-        post_data["start"] = [post_data["start"]]
+        if "start" not in post_data or "end" not in post_data:
+            return {"error": "A window requires both a start and end date"}
 
-    if "end" in post_data:
-        post_data["end"] = [post_data["end"]]
+        errors = []
+        times = iter_times(post_data, int(window), errors)
 
-    times = ts.get_times(query_parameters=post_data)
+        # Write the times as they arrive instead of collecting them first
+        if not interactive:
+            if csv_format:
+                util.output_csv(times, "time", None)
+            else:
+                util.print_json(times)
+
+            # The times that were written are only part of the export
+            if errors:
+                return {"error": u"Couldn't get every time: {}".format(
+                    errors[0])}
+
+            return []
+
+        times = list(times)
+
+        if errors:
+            sys.stderr.write(u"Couldn't get every time: {}\n".format(
+                errors[0]))
+    else:
+        times = ts.get_times(query_parameters=post_data)
 
     if interactive and not times:
         return {"note": "No times were returned"}
 
+    # Interactive mode keeps the times around while it asks how to show
+    # them, so large results are kept in less memory. Scripting mode prints
+    # them and exits, so converting them wouldn't save anything
+    if interactive and isinstance(times, list) and \
+            len(times) >= time_table_min_rows:
+        times = TimeTable(times)
+
     # Optionally output to a CSV file
     if interactive:
         csv_path = util.ask_csv()
@@ -642,6 +1388,254 @@ Examples:
     return times
 
 
+@climesync_command(optional_args=True)
+def sum_times(post_data=None, csv_format=False):
+    """sum-times
+
+Usage: sum-times [-h] [--group-by=<fields>] [--user=<users>]
+                      [--project=<projects>] [--activity=<activities>]
+                      [--start=<start date>] [--end=<end date>] [--local]
+                      [--csv]
+
+Options:
+    -h --help                Show this help message and exit
+    --group-by=<fields>      The fields to total times by, out of user,
+                             project, activity, day, week, and month
+                             [default: project]
+    --user=<users>           Filter by a list of users
+    --project=<projects>     Filter by a list of project slugs
+    --activity=<activities>  Filter by a list of activity slugs
+    --start=<start date>     Filter by start date
+    --end=<end date>         Filter by end date
+    --local                  Update the local time mirror, then sum the
+                             times in it (See sync-times)
+    --csv                    Output the result in CSV format
+
+Times are grouped by the first slug of their project. Times worked on several
+activities count toward each of them, but only once toward the total.
+
+Examples:
+    climesync sum-times
+
+    climesync sum-times --group-by="user month" --start=2016-01-01
+`       --end=2016-12-31 --csv > payroll.csv
+
+    climesync sum-times --group-by="project activity" --project=projectx
+    """
+
+    global ts, users, projects, activities
+
+    if not ts:
+        return {"error": "Not connected to TimeSync server"}
+
+    interactive = post_data is None
+
+    if interactive:
+        post_data = util.get_fields([("*!group_by", "Group by",
+                                      list(util.sum_fields)),
+                                     ("*!user", "Submitted by users", users),
+                                     ("*!project", "Belonging to projects",
+                                      projects),
+                                     ("*!activity", "Belonging to activities",
+                                      activities),
+                                     ("*~start", "Beginning on date"),
+                                     ("*~end", "Ending on date")])
+
+    group_by = post_data.pop("group_by", None) or ["project"]
+
+    if isinstance(group_by, basestring):
+        group_by = group_by.replace(",", " ").split()
+
+    invalid = [f for f in group_by if f not in util.sum_fields]
+
+    if invalid:
+        return {"error": "Can't group times by {}".format(", ".join(invalid))}
+
+    fix_time_query(post_data)
+
+    if post_data.pop("local", False):
+        times = local_times(post_data)
+
+        if isinstance(times, dict):
+            return times
+    else:
+        times = ts.get_times(query_parameters=post_data)
+
+        if times and ("error" in times[0] or "pymesync error" in times[0]):
+            return times[0]
+
+    sums = util.sum_times(times, group_by)
+
+    if interactive:
+        csv_path = util.ask_csv()
+
+        if csv_path:
+            util.output_csv(sums, "sum", csv_path)
+    elif csv_format:
+        util.output_csv(sums, "sum", None)
+        return []
+
+    return sums
+
+
+def local_times(query):
+    """Brings the local time mirror up to date, then returns the mirrored
+    times matching get-times query parameters, or an error dictionary"""
+
+    global ts
+
+    conn = timestore.open_store(time_store_path)
+
+    try:
+        response = sync_time_store(conn)
+
+        if "error" in response or "pymesync error" in response:
+            return response
+
+        return timestore.query_times(conn, timestore.source_key(ts.baseurl,
+                                                                ts.user),
+                                     query)
+    finally:
+        conn.close()
+
+
+@climesync_command(optional_args=True)
+def sync_times(post_data=None):
+    """sync-times
+
+Usage: sync-times [-h] [--start=<start date>] [--full]
+
+Options:
+    -h --help             Show this help message and exit
+    --start=<start date>  Request the times worked on or after this date
+                          again
+    --full                Request every time again
+
+Keeps a local mirror of your times in ~/.climesync/times.db for
+get-times --local. Only times worked in the month before the last sync
+(or after the --start date) are requested again, since TimeSync can't
+list just the times changed since then. To pick up changes to older
+times, every time is requested again with --full, or once the last time
+they all were is a week old (See full_sync_days).
+
+Examples:
+    climesync sync-times
+
+    climesync sync-times --start=2016-01-01
+    """
+
+    global ts
+
+    if not ts:
+        return {"error": "Not connected to TimeSync server"}
+
+    if post_data is None:
+        post_data = {}
+
+    if "start" in post_data and not util.is_date(post_data["start"]):
+        return {"error": "Invalid start date"}
+
+    conn = timestore.open_store(time_store_path)
+
+    try:
+        return sync_time_store(conn, post_data.get("start"),
+                               post_data.get("full", False))
+    finally:
+        conn.close()
+
+
+def sync_time_store(conn, start=None, full=False):
+    """Requests the times that might have changed since the last sync and
+    stores them in the local time mirror. Returns a summary of the changes or
+    an error dictionary"""
+
+    global ts
+
+    source = timestore.source_key(ts.baseurl, ts.user)
+    today = date.today().isoformat()
+
+    if start is None and not full:
+        start = timestore.sync_start(conn, source, sync_overlap_days,
+                                     full_sync_days)
+
+    # Deleted times are requested too so they're marked deleted locally
+    query = {"include_deleted": True}
+
+    if start is not None and not full:
+        query["start"] = [start]
+
+    times = ts.get_times(query_parameters=query)
+
+    if times and ("error" in times[0] or "pymesync error" in times[0]):
+        return times[0]
+
+    counts = timestore.store_times(conn, source, times)
+    timestore.finish_sync(conn, source, today, full="start" not in query)
+
+    return dict(counts, received=len(times))
+
+
+def fix_time_query(post_data):
+    """Puts get-times filters into the lists Pymesync expects"""
+
+    for key in ("user", "project", "activity"):
+        if key in post_data and isinstance(post_data[key], str):
+            post_data[key] = [post_data[key]]
+
+    for key in ("start", "end"):
+        if key in post_data:
+            post_data[key] = [post_data[key]]
+
+    return post_data
+
+
+def iter_times(post_data, window, errors=None):
+    """Yields the times matching post_data, requesting them from TimeSync in
+    windows of days between the start and end dates. The times in each window
+    are yielded as soon as it and every earlier window have arrived
+
+    If a window fails after times were already yielded, no more times are
+    yielded and its error message is appended to errors, or written to stderr
+    if errors isn't given"""
+
+    global ts
+
+    def get_window(dates):
+        # Pymesync modifies the query parameters, so give it a copy
+        query = dict(post_data, start=[dates[0]], end=[dates[1]])
+
+        return ts.get_times(query_parameters=query)
+
+    windows = util.date_windows(post_data["start"][0], post_data["end"][0],
+                                window)
+
+    # Windows are requested concurrently but still arrive in date order
+    responses = util.map_concurrently(get_window, windows, max_workers)
+    returned_times = False
+
+    try:
+        for times in responses:
+            if times and ("error" in times[0] or
+                          "pymesync error" in times[0]):
+                # Let the caller handle errors the same way as unwindowed
+                # requests
+                if not returned_times:
+                    yield times[0]
+                elif errors is not None:
+                    errors.append(util.error_message(times[0]))
+                else:
+                    sys.stderr.write(u"Couldn't get every time: {}\n".format(
+                        util.error_message(times[0])))
+
+                return
+
+            for time in times:
+                returned_times = True
+                yield time
+    finally:
+        responses.close()
+
+
 @climesync_command(select_arg="uuid")
 def delete_time(uuid=None):
     """delete-time
@@ -675,6 +1669,207 @@ Examples:
     return ts.delete_time(uuid=uuid)
 
 
+@climesync_command(optional_args=True)
+def update_times(post_data=None):
+    """update-times
+
+Usage: update-times [-h] (--from-file=<path> | [--user=<users>]
+                         [--project=<projects>] [--activity=<activities>]
+                         [--start=<start date>] [--end=<end date>])
+                         [--set-duration=<duration>]
+                         [--set-project=<project>]
+                         [--set-activities=<activities>]
+                         [--set-date-worked=<date worked>]
+                         [--set-issue-uri=<issue uri>]
+                         [--set-notes=<notes>] [--dry-run]
+
+Options:
+    -h --help                        Show this help message and exit
+    --from-file=<path>               A file with the UUID of one time to
+                                     update per line, or - to read from stdin
+    --user=<users>                   Update times submitted by these users
+    --project=<projects>             Update times in these projects
+    --activity=<activities>          Update times with these activities
+    --start=<start date>             Update times worked on or after this date
+    --end=<end date>                 Update times worked on or before this
+                                     date
+    --set-duration=<duration>        New duration of the times
+    --set-project=<project>          New project slug of the times
+    --set-activities=<activities>    New activity slugs of the times
+    --set-date-worked=<date worked>  New date the times were worked on
+    --set-issue-uri=<issue uri>      New issue URI of the times
+    --set-notes=<notes>              New notes of the times
+    --dry-run                        List the times that would be updated
+                                     without changing them
+
+Examples:
+    climesync update-times --project=gwm --start=2016-06-01
+`       --set-project=ganeti-webmgr --dry-run
+
+    climesync update-times --from-file=uuids.txt --set-activities="[dev]"
+    """
+
+    global ts
+
+    if not ts:
+        return {"error": "Not connected to TimeSync server"}
+
+    dry_run = post_data.pop("dry_run", False)
+
+    time = {}
+
+    for key in post_data.keys():
+        if key.startswith("set_"):
+            time[key[len("set_"):]] = post_data.pop(key)
+
+    if not time:
+        return {"error": "No fields to update were given"}
+
+    if isinstance(time.get("duration"), str) and time["duration"].isdigit():
+        time["duration"] = int(time["duration"])
+
+    if isinstance(time.get("activities"), str):
+        time["activities"] = [time["activities"]]
+
+    # Pymesync converts the duration in the time it's given, so every
+    # request gets its own copy
+    return run_bulk_times("updated", post_data, dry_run,
+                          lambda uuid: ts.update_time(uuid=uuid,
+                                                      time=dict(time)))
+
+
+@climesync_command(optional_args=True)
+def delete_times(post_data=None):
+    """delete-times
+
+Usage: delete-times [-h] (--from-file=<path> | [--user=<users>]
+                         [--project=<projects>] [--activity=<activities>]
+                         [--start=<start date>] [--end=<end date>])
+                         [--dry-run]
+
+Options:
+    -h --help                Show this help message and exit
+    --from-file=<path>       A file with the UUID of one time to delete per
+                             line, or - to read from stdin
+    --user=<users>           Delete times submitted by these users
+    --project=<projects>     Delete times in these projects
+    --activity=<activities>  Delete times with these activities
+    --start=<start date>     Delete times worked on or after this date
+    --end=<end date>         Delete times worked on or before this date
+    --dry-run                List the times that would be deleted without
+                             deleting them
+
+Examples:
+    climesync delete-times --user=userone --start=2016-06-01 --dry-run
+
+    climesync get-times --project=gwm --csv | cut -d, -f1 | tail -n +2
+`       | tr -d '"' | climesync delete-times --from-file=-
+    """
+
+    global ts
+
+    if not ts:
+        return {"error": "Not connected to TimeSync server"}
+
+    dry_run = post_data.pop("dry_run", False)
+
+    return run_bulk_times("deleted", post_data, dry_run,
+                          lambda uuid: ts.delete_time(uuid=uuid))
+
+
+def run_bulk_times(verb, post_data, dry_run, operation):
+    """Calls operation with the UUID of every time selected by post_data
+    (either a --from-file path or get-times filters) and returns how many
+    times it succeeded and failed for
+
+    Operations are run concurrently and retried on transient errors. Failures
+    are written to stderr
+    """
+
+    global ts
+
+    uuids = selected_time_uuids(post_data)
+
+    if isinstance(uuids, dict):
+        return uuids
+
+    if dry_run:
+        return {"matched": len(uuids), "uuids": uuids}
+
+    counts = {"matched": len(uuids), verb: 0, "failed": 0}
+    show_progress = sys.stderr.isatty()
+
+    def run(uuid):
+        attempts = []
+
+        def attempt():
+            attempts.append(uuid)
+            return operation(uuid)
+
+        response = util.call_with_retries(attempt)
+
+        if isinstance(response, list):
+            response = response[0]
+
+        # A delete that failed after the server already deleted the time
+        # finds it gone when it's retried
+        if verb == "deleted" and len(attempts) > 1 and \
+                "error" in response and \
+                str(response.get("status")) == "404":
+            response = {"status": 200}
+
+        return uuid, response
+
+    for done, (uuid, response) in enumerate(
+            util.map_concurrently(run, uuids, max_workers), 1):
+        if "error" in response or "pymesync error" in response:
+            counts["failed"] += 1
+
+            message = u"{}: {}\n".format(uuid, util.error_message(response))
+            sys.stderr.write(message.encode("utf-8"))
+        else:
+            counts[verb] += 1
+
+        if show_progress:
+            sys.stderr.write("\r{} {}/{} times".format(verb.capitalize(),
+                                                       done, len(uuids)))
+
+    if show_progress and uuids:
+        sys.stderr.write("\n")
+
+    return counts
+
+
+def selected_time_uuids(post_data):
+    """Returns the UUIDs of the times selected by a --from-file path or by
+    get-times filters, or an error dictionary"""
+
+    global ts
+
+    if "from_file" in post_data:
+        path = post_data["from_file"]
+
+        if path == "-":
+            return list(util.read_uuids(sys.stdin))
+
+        try:
+            with open(path, "rb") as f:
+                return list(util.read_uuids(f))
+        except IOError as e:
+            return {"error": u"Couldn't open {}: {}".format(path, e.strerror)}
+
+    # Refuse to select every time on the server by accident
+    if not post_data:
+        return {"error": "Give a file of UUIDs or at least one filter"}
+
+    times = ts.get_times(query_parameters=fix_time_query(post_data))
+
+    if times and ("error" in times[0] or "pymesync error" in times[0]):
+        return times[0]
+
+    return [t["uuid"] for t in times]
+
+
 @climesync_command(optional_args=True)
 def create_project(post_data=None):
     """create-project (Site admins only)
@@ -746,7 +1941,7 @@ Examples:
         post_data["slugs"] = [post_data["slugs"]]
 
     # Attempt to create a new project and return the response
-    return ts.create_project(project=post_data)
+    return invalidate_metadata(ts.create_project(project=post_data))
 
 
 @climesync_command(select_arg="slug", optional_args=True)
@@ -781,11 +1976,12 @@ Examples:
         return {"error": "Not connected to TimeSync server"}
 
     if slug is None:
-        slug = util.get_field("Slug of project to update", validator=projects)
+        slug = select_object("projects", "Slug of project to update",
+                             projects)
 
     # The data to send to the server containing revised project information
     if post_data is None:
-        current_project = ts.get_projects({"slug": slug})[0]
+        current_project = fetch_project(slug, {})
 
         if "error" in current_project or "pymesync error" in current_project:
             return current_project
@@ -801,7 +1997,8 @@ Examples:
         post_data["slugs"] = [post_data["slugs"]]
 
     # Attempt to update the project information and return the response
-    return ts.update_project(project=post_data, slug=slug)
+    return invalidate_metadata(ts.update_project(project=post_data,
+                                                 slug=slug))
 
 
 @climesync_command(select_arg="slug")
@@ -844,17 +2041,20 @@ Examples:
         return {"error": "Not connected to TimeSync server"}
 
     if slug is None:
-        slug = util.get_field("Slug of project to update", validator=projects)
+        slug = select_object("projects", "Slug of project to update",
+                             projects)
 
-    if post_data is None:
-        current_project = ts.get_projects({"slug": slug})[0]
+    # The project is fetched once, both to show its current users and to
+    # merge the changes into them
+    old_project = fetch_project(slug, {})
 
-        if "error" in current_project or "pymesync error" in current_project:
-            return current_project
+    if "error" in old_project or "pymesync error" in old_project:
+        return old_project
 
+    if post_data is None:
         post_data = util.get_fields([("*!users", "Users to add/update",
                                       users)],
-                                    current_object=current_project)
+                                    current_object=old_project)
     else:
         permissions_dict = dict(zip(post_data.pop("username"),
                                     post_data.pop("access_mode")))
@@ -862,19 +2062,15 @@ Examples:
 
     if "users" in post_data and not isinstance(post_data["users"], dict):
         users_list = post_data["users"]
-        current_users = current_project["users"]
+        current_users = old_project.get("users", {})
         post_data["users"] = util.get_user_permissions(users_list,
                                                        current_users)
 
-    old_project = ts.get_projects(query_parameters={"slug": slug})[0]
+    project_users = dict(old_project.get("users") or {})
+    project_users.update(post_data.get("users", {}))
 
-    if "error" in old_project or "pymesync error" in old_project:
-        return old_project
-
-    users = old_project.setdefault("users", {})
-    users.update(post_data["users"])
-
-    return ts.update_project(project={"users": users}, slug=slug)
+    return invalidate_metadata(ts.update_project(
+        project={"users": project_users}, slug=slug))
 
 
 @climesync_command(select_arg="slug")
@@ -899,32 +2095,32 @@ Examples:
         return {"error": "Not connected to TimeSync server"}
 
     if slug is None:
-        slug = util.get_field("Slug of project to update", validator=projects)
-
-    if post_data is None:
-        current_project = ts.get_projects({"slug": slug})[0]
-
-        if "error" in current_project or "pymesync error" in current_project:
-            return current_project
+        slug = select_object("projects", "Slug of project to update",
+                             projects)
 
-        post_data = util.get_fields([("*!users", "Users to remove", users)],
-                                    current_object=current_project)
-
-    old_project = ts.get_projects(query_parameters={"slug": slug})[0]
+    # The project is fetched once, both to show its current users and to
+    # remove users from them
+    old_project = fetch_project(slug, {})
 
     if "error" in old_project or "pymesync error" in old_project:
         return old_project
 
+    if post_data is None:
+        post_data = util.get_fields([("*!users", "Users to remove", users)],
+                                    current_object=old_project)
+
     to_remove = post_data["users"] if "users" in post_data else []
-    users = old_project.setdefault("users", {})
+    project_users = old_project.get("users") or {}
 
-    if any(user not in users for user in to_remove):
+    if any(username not in project_users for username in to_remove):
         return {"error": "User doesn't exist in project"}
 
-    users = {user: perms for user, perms in users.iteritems()
-             if user not in to_remove}
+    project_users = {username: perms
+                     for username, perms in project_users.iteritems()
+                     if username not in to_remove}
 
-    return ts.update_project(project={"users": users}, slug=slug)
+    return invalidate_metadata(ts.update_project(
+        project={"users": project_users}, slug=slug))
 
 
 @climesync_command(optional_args=True)
@@ -983,29 +2179,28 @@ Examples:
 
     # Project time summaries
     if interactive or not csv_format:
-        for project in projects_res:
-            proj_slug = project["slugs"][0]
-            proj_times = ts.get_times(query_parameters={"project":
-                                                        [proj_slug]})
-
-            if not proj_times or \
-               "error" in proj_times[0] or "pymesync error" in proj_times[0]:
+        proj_slugs = [project["slugs"][0] for project in projects_res]
+        summaries = {}
+
+        # Request the times of several projects at once instead of making one
+        # request per project
+        for i in xrange(0, len(proj_slugs), summary_chunk_size):
+            chunk_slugs = proj_slugs[i:i + summary_chunk_size]
+            chunk_times = ts.get_times(query_parameters={"project":
+                                                         chunk_slugs})
+
+            if not chunk_times or \
+               "error" in chunk_times[0] or "pymesync error" in chunk_times[0]:
                 continue
 
-            proj_time_sum = util.to_readable_time(sum(t["duration"]
-                                                      for t in proj_times))
-            proj_num_entries = len(proj_times)
-            proj_latest_time = max(datetime.strptime(t["date_worked"],
-                                                     "%Y-%m-%d")
-                                   for t in proj_times).date().isoformat()
-            proj_first_time = min(datetime.strptime(t["date_worked"],
-                                                    "%Y-%m-%d")
-                                  for t in proj_times).date().isoformat()
-
-            project["time_total"] = proj_time_sum
-            project["num_times"] = proj_num_entries
-            project["latest_time"] = proj_latest_time
-            project["first_time"] = proj_first_time
+            summaries.update(util.summarize_project_times(chunk_times,
+                                                          chunk_slugs))
+
+        for project in projects_res:
+            summary = summaries.get(project["slugs"][0])
+
+            if summary:
+                project.update(summary)
 
     return projects_res
 
@@ -1040,7 +2235,7 @@ Examples:
         if not really:
             return list()
 
-    return ts.delete_project(slug=slug)
+    return invalidate_metadata(ts.delete_project(slug=slug))
 
 
 @climesync_command()
@@ -1073,7 +2268,7 @@ Examples:
                                      ("slug", "Activity slug")])
 
     # Attempt to create a new activity and return the response
-    return ts.create_activity(activity=post_data)
+    return invalidate_metadata(ts.create_activity(activity=post_data))
 
 
 @climesync_command(select_arg="old_slug", optional_args=True)
@@ -1117,7 +2312,8 @@ Examples:
                                     current_object=current_activity)
 
     # Attempt to update the activity information and return the repsonse
-    return ts.update_activity(activity=post_data, slug=old_slug)
+    return invalidate_metadata(ts.update_activity(activity=post_data,
+                                                  slug=old_slug))
 
 
 @climesync_command(optional_args=True)
@@ -1207,7 +2403,7 @@ Examples:
         if not really:
             return list()
 
-    return ts.delete_activity(slug=slug)
+    return invalidate_metadata(ts.delete_activity(slug=slug))
 
 
 @climesync_command(optional_args=True)
@@ -1264,7 +2460,7 @@ Examples:
                                      ("*?active", "Is the new user active?")])
 
     # Attempt to create a new user and return the response
-    return ts.create_user(user=post_data)
+    return invalidate_metadata(ts.create_user(user=post_data))
 
 
 @climesync_command(select_arg="old_username", optional_args=True)
@@ -1307,12 +2503,12 @@ Examples:
         return {"error": "Not connected to TimeSync server"}
 
     if old_username is None:
-        old_username = util.get_field("Username of user to update",
-                                      validator=users)
+        old_username = select_object("users", "Username of user to update",
+                                     users)
 
     # The data to send to the server containing revised user information
     if post_data is None:
-        current_user = ts.get_users(username=old_username)[0]
+        current_user = fetch_object("users", old_username)
 
         if "error" in current_user or "pymesync error" in current_user:
                 return current_user
@@ -1329,7 +2525,8 @@ Examples:
                                     current_object=current_user)
 
     # Attempt to update the user and return the response
-    return ts.update_user(user=post_data, username=old_username)
+    return invalidate_metadata(ts.update_user(user=post_data,
+                                              username=old_username))
 
 
 @climesync_command(optional_args=True)
@@ -1422,16 +2619,22 @@ Examples:
             else:
                 role = ""
 
-        users_res = []
-        for user, roles in project_users.iteritems():
-            if (role == "--members" and "member" not in roles) or \
-               (role == "--managers" and "manager" not in roles) or \
-               (role == "--spectators" and "spectator" not in roles):
-                continue
+        required_role = {"--members": "member",
+                         "--managers": "manager",
+                         "--spectators": "spectator"}.get(role)
+
+        usernames = [user for user, roles in project_users.iteritems()
+                     if not required_role or required_role in roles]
 
-            user_object = ts.get_users(username=user)[0]
+        # Look the users up concurrently, stopping at the first error
+        user_objects = util.map_concurrently(
+            lambda username: ts.get_users(username=username)[0],
+            usernames, max_workers)
 
+        users_res = []
+        for user_object in user_objects:
             if "error" in user_object or "pymesync error" in user_object:
+                user_objects.close()
                 return user_object
 
             users_res.append(user_object)
@@ -1447,14 +2650,14 @@ Examples:
         return users_res
 
     if username:  # Get user projects
-        projects = ts.get_projects()
+        projects_res = ts.get_projects()
 
-        if "error" in projects[0] or "pymesync error" in projects[0]:
-            util.print_json(projects)
+        if "error" in projects_res[0] or "pymesync error" in projects_res[0]:
+            util.print_json(projects_res)
         else:
             # Create a dictionary of projects that the user has a role in
             user_projects = {project["name"]: project["users"][username]
-                             for project in projects
+                             for project in projects_res
                              if username in project.setdefault("users", [])}
 
             users_res[0]["projects"] = user_projects
@@ -1504,4 +2707,4 @@ Examples:
         if not really:
             return list()
 
-    return ts.delete_user(username=username)
+    return invalidate_metadata(ts.delete_user(username=username))
@@ -0,0 +1,216 @@
+"""daemon
+
+Usage: daemon [-h] [--stop]
+
+Options:
+    -h --help  Show this help message and exit
+    --stop     Stop the running Climesync daemon
+
+Keeps one authenticated TimeSync connection and the cached users, projects
+and activities in memory, and runs scripting mode commands sent to it over a
+Unix socket. While the daemon is running, climesync <command> forwards the
+command to it instead of connecting and signing in again.
+
+Examples:
+    climesync daemon &
+
+    climesync daemon --stop
+"""
+
+import json
+import os
+import socket
+import sys
+
+default_socket_path = "~/.climesync.sock"
+
+
+class OutputBuffer:
+    """File-like object that collects everything written to it as UTF-8
+    encoded bytes"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, s):
+        if isinstance(s, unicode):
+            s = s.encode("utf-8")
+
+        self.chunks.append(s)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+
+def forwardable(argv):
+    """Returns True if a command with the arguments argv can be run by the
+    daemon. Commands that read from stdin have to be run in-process"""
+
+    return not any(arg == "-" or arg.endswith("=-") for arg in argv)
+
+
+def send(request, path=default_socket_path):
+    """Sends a request to the daemon and returns its reply, or None if the
+    daemon isn't running"""
+
+    path = os.path.expanduser(path)
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        client.connect(path)
+    except socket.error:
+        client.close()
+        return None
+
+    try:
+        client.sendall(json.dumps(request) + "\n")
+        client.shutdown(socket.SHUT_WR)
+
+        return json.loads(read_all(client))
+    except (socket.error, ValueError):
+        return None
+    finally:
+        client.close()
+
+
+def forward(command, argv, path=default_socket_path):
+    """Runs a scripting mode command in the daemon and writes its output to
+    stdout and stderr
+
+    Returns the command's exit status, or None if the command couldn't be
+    forwarded and has to be run in-process
+    """
+
+    if not forwardable(argv):
+        return None
+
+    reply = send({"command": command, "argv": argv, "cwd": os.getcwd()},
+                 path)
+
+    if reply is None:
+        return None
+
+    sys.stdout.write(reply["stdout"].encode("utf-8"))
+    sys.stderr.write(reply["stderr"].encode("utf-8"))
+
+    return reply["status"]
+
+
+def stop(path=default_socket_path):
+    """Asks the daemon to exit. Returns False if it wasn't running"""
+
+    return send({"stop": True}, path) is not None
+
+
+def serve(run, path=default_socket_path):
+    """Runs commands sent to the Unix socket at path until asked to stop
+
+    run is called with the command name and its arguments, and returns the
+    command's exit status. Anything it writes to stdout or stderr is sent back
+    to the client along with the exit status
+    """
+
+    path = os.path.expanduser(path)
+
+    # A socket left behind by a daemon that didn't exit cleanly
+    if os.path.exists(path):
+        if send({"ping": True}, path) is not None:
+            return {"climesync error": "The daemon is already running"}
+
+        os.remove(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    # Only the current user may send commands to the daemon
+    old_umask = os.umask(0o177)
+
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+
+    server.listen(5)
+
+    try:
+        while True:
+            connection, _ = server.accept()
+
+            try:
+                request = json.loads(read_all(connection))
+
+                if request.get("stop"):
+                    connection.sendall(json.dumps({}))
+                    break
+
+                if request.get("ping"):
+                    connection.sendall(json.dumps({}))
+                    continue
+
+                connection.sendall(json.dumps(handle(run, request)))
+            except (socket.error, ValueError):
+                pass
+            finally:
+                connection.close()
+    finally:
+        server.close()
+        os.remove(path)
+
+    return list()
+
+
+def handle(run, request):
+    """Runs one forwarded command, capturing its output"""
+
+    stdout, stderr = sys.stdout, sys.stderr
+    cwd = os.getcwd()
+
+    sys.stdout = OutputBuffer()
+    sys.stderr = OutputBuffer()
+
+    status = 0
+
+    try:
+        # Relative paths in the command's arguments are relative to the
+        # client's working directory
+        os.chdir(request["cwd"])
+
+        status = run(request["command"], request["argv"]) or 0
+    except SystemExit as e:
+        # docopt exits after printing help or a usage error
+        if isinstance(e.code, basestring):
+            sys.stderr.write(e.code + "\n")
+            status = 1
+        else:
+            status = e.code or 0
+    except Exception as e:
+        sys.stderr.write(u"climesync daemon error: {}\n".format(e))
+        status = 1
+    finally:
+        output, errors = sys.stdout.getvalue(), sys.stderr.getvalue()
+        sys.stdout, sys.stderr = stdout, stderr
+        os.chdir(cwd)
+
+    return {"stdout": output.decode("utf-8", "replace"),
+            "stderr": errors.decode("utf-8", "replace"),
+            "status": status}
+
+
+def read_all(connection):
+    """Reads from a socket until the other end stops sending"""
+
+    chunks = []
+
+    while True:
+        chunk = connection.recv(65536)
+
+        if not chunk:
+            return "".join(chunks)
+
+        chunks.append(chunk)
@@ -0,0 +1,167 @@
+"""Durable queue of times waiting to be submitted to TimeSync
+
+Every queued time is kept in its own file in the outbox directory, named
+after the idempotency key it was given when it was queued, so adding or
+removing one time never rewrites the others.
+"""
+
+import json
+import os
+import uuid
+from time import time as current_timestamp
+
+import util
+
+default_path = "~/.climesync/outbox"
+
+# Seconds to wait before retrying a time after its first failed attempt. The
+# wait doubles after every failure, up to max_retry_delay
+retry_delay = 30
+max_retry_delay = 3600
+
+
+def entry_path(key, path=default_path):
+    return os.path.join(os.path.expanduser(path), "{}.json".format(key))
+
+
+def add(time, baseurl, username, path=default_path):
+    """Queues a time to be submitted by a user to a TimeSync server and
+    returns its outbox entry"""
+
+    entry = {
+        "key": uuid.uuid4().hex,
+        "baseurl": baseurl,
+        "user": username,
+        "time": time,
+        "queued_at": current_timestamp(),
+        "attempts": 0,
+        "next_attempt_at": 0,
+        "uncertain": False,
+        "failed": False,
+        "last_error": None
+    }
+
+    save(entry, path)
+
+    return entry
+
+
+def save(entry, path=default_path):
+    """Writes an outbox entry, creating the outbox if it doesn't exist"""
+
+    realpath = os.path.expanduser(path)
+
+    if not os.path.isdir(realpath):
+        os.makedirs(realpath, 0o700)
+
+    util.write_private_file(entry_path(entry["key"], path), json.dumps(entry))
+
+
+def remove(key, path=default_path):
+    """Removes a time from the outbox. Returns False if it wasn't queued"""
+
+    try:
+        os.remove(entry_path(key, path))
+    except OSError:
+        return False
+
+    return True
+
+
+def entries(baseurl=None, username=None, path=default_path):
+    """Returns the queued times, optionally only those of a user on a TimeSync
+    server, in the order they were queued"""
+
+    realpath = os.path.expanduser(path)
+
+    try:
+        names = os.listdir(realpath)
+    except OSError:
+        return []
+
+    queued = []
+
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+
+        try:
+            with open(os.path.join(realpath, name), "r") as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            continue
+
+        if baseurl is not None and entry.get("baseurl") != baseurl:
+            continue
+
+        if username is not None and entry.get("user") != username:
+            continue
+
+        queued.append(entry)
+
+    return sorted(queued, key=lambda e: e["queued_at"])
+
+
+def is_due(entry, now=None):
+    """Returns True if it's time to try submitting a queued time again"""
+
+    if entry["failed"]:
+        return False
+
+    now = current_timestamp() if now is None else now
+
+    return entry["next_attempt_at"] <= now
+
+
+def record_failure(entry, error, transient, now=None):
+    """Updates an entry after a failed attempt to submit it
+
+    Times that failed because of a transient error are retried later with
+    exponential backoff. They might have reached the server anyway, so they're
+    marked uncertain. Other errors won't go away on their own, so those times
+    aren't retried automatically
+    """
+
+    now = current_timestamp() if now is None else now
+
+    entry["attempts"] += 1
+    entry["last_error"] = error
+
+    if transient:
+        entry["uncertain"] = True
+        entry["next_attempt_at"] = now + min(
+            retry_delay * 2 ** (entry["attempts"] - 1), max_retry_delay)
+    else:
+        entry["failed"] = True
+
+    return entry
+
+
+def matches(entry, time):
+    """Returns True if a time on the server is the one an outbox entry
+    would create"""
+
+    queued = entry["time"]
+
+    if time.get("user") != entry["user"] or \
+            time.get("date_worked") != queued.get("date_worked"):
+        return False
+
+    if util.duration_seconds(queued.get("duration")) != time.get("duration"):
+        return False
+
+    project = time.get("project") or []
+
+    if queued.get("project") not in project:
+        return False
+
+    activities = sorted(time.get("activities") or [])
+
+    if queued.get("activities") and sorted(queued["activities"]) != activities:
+        return False
+
+    for field in ("notes", "issue_uri"):
+        if (queued.get(field) or None) != (time.get(field) or None):
+            return False
+
+    return True
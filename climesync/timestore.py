@@ -0,0 +1,216 @@
+"""Local SQLite mirror of the times on TimeSync servers
+
+Each mirrored time is stored as the JSON object TimeSync returned, along with
+the fields needed to filter it. Times are mirrored separately for every
+server and user, since users with different permissions see different times.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import date, timedelta
+
+default_path = "~/.climesync/times.db"
+
+schema = """
+CREATE TABLE IF NOT EXISTS times (
+    source TEXT NOT NULL,
+    uuid TEXT NOT NULL,
+    user TEXT,
+    date_worked TEXT,
+    updated_at TEXT,
+    deleted_at TEXT,
+    revision INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (source, uuid)
+);
+
+CREATE INDEX IF NOT EXISTS times_date_worked ON times (source, date_worked);
+
+CREATE TABLE IF NOT EXISTS syncs (
+    source TEXT PRIMARY KEY,
+    synced_through TEXT,
+    full_synced_on TEXT
+);
+"""
+
+
+def source_key(baseurl, username):
+    """Returns the key the times of a user on a TimeSync server are stored
+    under"""
+
+    return u"{} {}".format(baseurl, username)
+
+
+def open_store(path=default_path):
+    """Opens the time store at path, creating it (and its directory, readable
+    only by its owner) if it doesn't exist"""
+
+    realpath = os.path.expanduser(path)
+    dirname = os.path.dirname(realpath)
+
+    if dirname and not os.path.isdir(dirname):
+        os.makedirs(dirname, 0o700)
+
+    conn = sqlite3.connect(realpath)
+    conn.executescript(schema)
+
+    # Stores created before full syncs were recorded
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(syncs)")]
+
+    if "full_synced_on" not in columns:
+        conn.execute("ALTER TABLE syncs ADD COLUMN full_synced_on TEXT")
+
+    os.chmod(realpath, 0o600)
+
+    return conn
+
+
+def synced_through(conn, source):
+    """Returns the date the times of source were last synced through, or None
+    if they were never synced"""
+
+    row = conn.execute("SELECT synced_through FROM syncs WHERE source = ?",
+                       (source,)).fetchone()
+
+    return row[0] if row else None
+
+
+def full_synced_on(conn, source):
+    """Returns the date every time of source was last requested, or None if
+    they never were"""
+
+    row = conn.execute("SELECT full_synced_on FROM syncs WHERE source = ?",
+                       (source,)).fetchone()
+
+    return row[0] if row else None
+
+
+def parse_date(date_str):
+    year, month, day = (int(n) for n in date_str.split("-"))
+
+    return date(year, month, day)
+
+
+def sync_start(conn, source, overlap_days, full_sync_days=None, today=None):
+    """Returns the first date worked to request from TimeSync to bring the
+    mirror of source up to date, or None if everything has to be requested
+
+    Times worked up to overlap_days before the last sync are requested again,
+    since they're the ones most likely to have been changed since then. Older
+    times can still change, so everything is requested again once the last
+    full sync is full_sync_days old
+    """
+
+    today = date.today() if today is None else today
+    last_synced = synced_through(conn, source)
+
+    if last_synced is None:
+        return None
+
+    if full_sync_days is not None:
+        last_full = full_synced_on(conn, source)
+
+        if last_full is None or \
+                (today - parse_date(last_full)).days >= full_sync_days:
+            return None
+
+    start = parse_date(last_synced) - timedelta(days=overlap_days)
+
+    return start.isoformat()
+
+
+def store_times(conn, source, times):
+    """Adds new times to the mirror of source and replaces the stored copies
+    of times that have changed. Returns how many times were added and
+    updated"""
+
+    counts = {"added": 0, "updated": 0}
+
+    for time in times:
+        stored = conn.execute("SELECT revision, updated_at, deleted_at "
+                              "FROM times WHERE source = ? AND uuid = ?",
+                              (source, time["uuid"])).fetchone()
+
+        current = (time.get("revision"), time.get("updated_at"),
+                   time.get("deleted_at"))
+
+        if stored is not None and tuple(stored) == current:
+            continue
+
+        conn.execute("INSERT OR REPLACE INTO times (source, uuid, user, "
+                     "date_worked, updated_at, deleted_at, revision, data) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     (source, time["uuid"], time.get("user"),
+                      time.get("date_worked"), time.get("updated_at"),
+                      time.get("deleted_at"), time.get("revision"),
+                      json.dumps(time)))
+
+        counts["added" if stored is None else "updated"] += 1
+
+    return counts
+
+
+def finish_sync(conn, source, through, full=False):
+    """Records that the mirror of source is up to date through a date, and
+    that every time was requested if full is True, and commits the synced
+    times"""
+
+    if full:
+        conn.execute("INSERT OR REPLACE INTO syncs (source, synced_through, "
+                     "full_synced_on) VALUES (?, ?, ?)",
+                     (source, through, through))
+    elif not conn.execute("UPDATE syncs SET synced_through = ? "
+                          "WHERE source = ?", (through, source)).rowcount:
+        conn.execute("INSERT INTO syncs (source, synced_through) "
+                     "VALUES (?, ?)", (source, through))
+
+    conn.commit()
+
+
+def query_times(conn, source, query):
+    """Returns the mirrored times of source matching get-times style query
+    parameters, in the order they were worked"""
+
+    sql = "SELECT data FROM times WHERE source = ?"
+    args = [source]
+
+    if query.get("user"):
+        sql += " AND user IN ({})".format(", ".join("?" * len(query["user"])))
+        args.extend(query["user"])
+
+    if query.get("start"):
+        sql += " AND date_worked >= ?"
+        args.append(query["start"][0])
+
+    if query.get("end"):
+        sql += " AND date_worked <= ?"
+        args.append(query["end"][0])
+
+    if query.get("uuid"):
+        sql += " AND uuid = ?"
+        args.append(query["uuid"])
+
+    if not query.get("include_deleted"):
+        sql += " AND deleted_at IS NULL"
+
+    sql += " ORDER BY date_worked, uuid"
+
+    projects = set(query.get("project") or [])
+    activities = set(query.get("activity") or [])
+
+    times = []
+
+    for (data,) in conn.execute(sql, args):
+        time = json.loads(data)
+
+        if projects and not projects.intersection(time.get("project") or []):
+            continue
+
+        if activities and \
+                not activities.intersection(time.get("activities") or []):
+            continue
+
+        times.append(time)
+
+    return times
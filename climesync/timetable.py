@@ -0,0 +1,306 @@
+"""Compact in-memory storage for large sets of times
+
+Pymesync returns every time as a dict of about a dozen keys, each with its own
+copies of the same usernames, slugs and dates. A TimeTable keeps the same
+times in columns instead: usernames, slugs and timestamps are stored once and
+shared, and durations, dates worked and revisions are packed into arrays of
+machine integers. Each time can still be read like the dict it came from
+through a TimeRow, which is created when it's needed and not kept around.
+"""
+
+from array import array
+from datetime import date
+from itertools import islice
+
+# The fields every time has, in the order TimeRow.keys() returns them
+time_fields = ("uuid", "user", "project", "activities", "duration",
+               "date_worked", "issue_uri", "notes", "revision", "created_at",
+               "updated_at", "deleted_at")
+
+field_set = frozenset(time_fields)
+
+# Fields stored in arrays of integers, and the fields of strings that are
+# likely to repeat and are stored once
+integer_fields = ("duration", "revision")
+shared_fields = ("user", "issue_uri", "created_at", "updated_at",
+                 "deleted_at")
+
+# Number of times extend() adds at once
+chunk_size = 1024
+
+
+class TimeTable(object):
+    """A list of times stored by column
+
+    Like the lists of times commands return, a TimeTable can be marked with
+    "detail" to have print_pretty_time show every time instead of a summary
+    """
+
+    def __init__(self, times=()):
+        self.strings = {}
+        self.ordinals = {}
+        self.dates = {}
+
+        self.columns = {field: [] for field in time_fields}
+        self.columns["duration"] = array("l")
+        self.columns["revision"] = array("l")
+        self.columns["date_worked"] = array("l")
+
+        # Values that don't fit their column and fields times don't usually
+        # have, by index
+        self.extra = {}
+
+        self.detail = False
+
+        self.extend(times)
+
+    def append(self, time):
+        if time == "detail":
+            self.detail = True
+            return
+
+        columns = self.columns
+        share = self.strings.setdefault
+        get = time.get
+
+        # Times that have exactly the usual fields, with values of the usual
+        # types, take the fast path
+        extra = None
+
+        if len(time) != len(time_fields) or not field_set.issuperset(time):
+            extra = {f: v for f, v in time.iteritems() if f not in field_set}
+            extra[None] = [f for f in time_fields if f not in time]
+
+        for field in integer_fields:
+            value = get(field)
+
+            if type(value) is int and -2 ** 31 <= value < 2 ** 31:
+                columns[field].append(value)
+            else:
+                columns[field].append(0)
+                extra = extra or {}
+                extra[field] = value
+
+        date_worked = get("date_worked")
+        ordinal = self.ordinals.get(date_worked) or \
+            self.ordinal(date_worked)
+
+        if ordinal is None:
+            columns["date_worked"].append(0)
+            extra = extra or {}
+            extra["date_worked"] = date_worked
+        else:
+            columns["date_worked"].append(ordinal)
+
+        for field in shared_fields:
+            columns[field].append(share(get(field), get(field)))
+
+        for field in ("project", "activities"):
+            values = get(field)
+
+            if type(values) is list:
+                columns[field].append(tuple([share(v, v) for v in values]))
+            else:
+                columns[field].append(None)
+                extra = extra or {}
+                extra[field] = values
+
+        columns["uuid"].append(get("uuid"))
+        columns["notes"].append(get("notes"))
+
+        if extra:
+            self.extra[len(self) - 1] = extra
+
+    def extend(self, times):
+        """Appends times from any iterable, a chunk at a time so a generator
+        of times is never held in memory all at once"""
+
+        times = iter(times)
+
+        while True:
+            chunk = list(islice(times, chunk_size))
+
+            if not chunk:
+                break
+
+            if not self.extend_regular(chunk):
+                for time in chunk:
+                    self.append(time)
+
+    def extend_regular(self, times):
+        """Appends a chunk of times column by column, which is several times
+        faster than appending them one by one. Returns False without
+        appending anything if any of them needs the slow path of append()"""
+
+        field_count = len(time_fields)
+
+        for time in times:
+            if type(time) is not dict or len(time) != field_count or \
+                    not field_set.issuperset(time):
+                return False
+
+        share = self.strings.setdefault
+        ordinals = self.ordinals
+        new_columns = {}
+
+        try:
+            for field in integer_fields:
+                values = [time[field] for time in times]
+
+                if any(type(v) is not int for v in values):
+                    return False
+
+                new_columns[field] = array("l", values)
+
+            dates = [ordinals.get(time["date_worked"]) or
+                     self.ordinal(time["date_worked"]) for time in times]
+        except OverflowError:
+            return False
+
+        if None in dates:
+            return False
+
+        new_columns["date_worked"] = dates
+
+        for field in ("project", "activities"):
+            values = [time[field] for time in times]
+
+            if any(type(v) is not list for v in values):
+                return False
+
+            new_columns[field] = [tuple([share(v, v) for v in slugs])
+                                  for slugs in values]
+
+        for field in shared_fields:
+            new_columns[field] = [share(time[field], time[field])
+                                  for time in times]
+
+        new_columns["uuid"] = [time["uuid"] for time in times]
+        new_columns["notes"] = [time["notes"] for time in times]
+
+        for field, values in new_columns.iteritems():
+            self.columns[field].extend(values)
+
+        return True
+
+    def ordinal(self, date_worked):
+        """Returns the ordinal of an ISO 8601 date, or None if it isn't one"""
+
+        ordinal = self.ordinals.get(date_worked)
+
+        if ordinal is None:
+            try:
+                year, month, day = (int(n) for n in date_worked.split("-"))
+                ordinal = date(year, month, day).toordinal()
+            except (AttributeError, ValueError):
+                return None
+
+            self.ordinals[date_worked] = ordinal
+            self.dates[ordinal] = self.strings.setdefault(date_worked,
+                                                          date_worked)
+
+        return ordinal
+
+    def value(self, index, field):
+        """Returns a field of the time at index, raising KeyError if the time
+        doesn't have it"""
+
+        if index in self.extra:
+            extra = self.extra[index]
+
+            if field in extra.get(None, ()):
+                raise KeyError(field)
+            elif field in extra:
+                return extra[field]
+
+        value = self.columns[field][index]
+
+        if field == "date_worked":
+            return self.dates[value]
+        elif type(value) is tuple:
+            return list(value)
+
+        return value
+
+    def fields(self, index):
+        """Returns the fields of the time at index"""
+
+        extra = self.extra.get(index)
+
+        if extra is None:
+            return list(time_fields)
+
+        missing = extra.get(None, ())
+
+        return [f for f in time_fields if f not in missing] + \
+            [f for f in extra if f is not None and f not in time_fields]
+
+    def __len__(self):
+        return len(self.columns["uuid"])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("TimeTable index out of range")
+
+        return TimeRow(self, index)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield TimeRow(self, index)
+
+    def __contains__(self, item):
+        return item == "detail" and self.detail
+
+
+class TimeRow(object):
+    """A read-only view of one time in a TimeTable that can be used in place of
+    the dict Pymesync returned for it"""
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, field):
+        return self.table.value(self.index, field)
+
+    def get(self, field, default=None):
+        try:
+            return self.table.value(self.index, field)
+        except KeyError:
+            return default
+
+    def __contains__(self, field):
+        return field in self.keys()
+
+    def keys(self):
+        return self.table.fields(self.index)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def iteritems(self):
+        for field in self.keys():
+            yield field, self[field]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def to_dict(self):
+        return dict(self.iteritems())
+
+    def __eq__(self, other):
+        if isinstance(other, TimeRow):
+            other = other.to_dict()
+
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "TimeRow({!r})".format(self.to_dict())
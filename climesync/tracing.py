@@ -0,0 +1,225 @@
+"""Records the requests Climesync makes to TimeSync and how long they take
+
+A Tracer wraps the pymesync.TimeSync object so every method call that sends a
+request is timed, and prints a summary of them to stderr after each command
+or appends them to a JSON Lines file.
+"""
+
+import copy
+import json
+import sys
+import threading
+from timeit import default_timer
+
+# The TimeSync endpoint each traced Pymesync method requests. Methods that
+# aren't listed here (like token_expiration_time) don't send requests and
+# aren't traced
+endpoints = {
+    "authenticate":    "POST /login",
+    "create_time":     "POST /times",
+    "update_time":     "POST /times/:uuid",
+    "get_times":       "GET /times",
+    "delete_time":     "DELETE /times/:uuid",
+    "create_project":  "POST /projects",
+    "update_project":  "POST /projects/:slug",
+    "get_projects":    "GET /projects",
+    "project_users":   "GET /projects/:slug",
+    "delete_project":  "DELETE /projects/:slug",
+    "create_activity": "POST /activities",
+    "update_activity": "POST /activities/:slug",
+    "get_activities":  "GET /activities",
+    "delete_activity": "DELETE /activities/:slug",
+    "create_user":     "POST /users",
+    "update_user":     "POST /users/:username",
+    "get_users":       "GET /users",
+    "delete_user":     "DELETE /users/:username",
+}
+
+# Methods whose responses are a dict with an entry for each object, like the
+# permissions of each of a project's users
+keyed_methods = ("project_users",)
+
+# Parameters whose values are left out of traces
+secret_params = ("password",)
+
+
+def hide_secrets(value):
+    """Replaces the values of secret parameters anywhere in a copy of a
+    call's arguments, like the password in update_user's user dict"""
+
+    if isinstance(value, dict):
+        for key in value:
+            if key in secret_params:
+                value[key] = "..."
+            else:
+                hide_secrets(value[key])
+    elif isinstance(value, list):
+        for item in value:
+            hide_secrets(item)
+
+
+def is_error(result):
+    if isinstance(result, list) and len(result) == 1:
+        result = result[0]
+
+    return isinstance(result, dict) and \
+        ("error" in result or "pymesync error" in result)
+
+
+def result_count(method, result):
+    """Returns the number of TimeSync objects in a response to method"""
+
+    if is_error(result) or not result:
+        return 0
+
+    if isinstance(result, list) or method in keyed_methods:
+        return len(result)
+
+    return 1
+
+
+def payload_size(result):
+    """Returns the size in bytes of a response encoded as JSON"""
+
+    return len(json.dumps(result, default=str))
+
+
+class Tracer(object):
+    """Collects the traced calls made by one or more commands"""
+
+    def __init__(self, path=None, out=None):
+        self.path = path
+        self.out = out
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def wrap(self, ts):
+        return TracedTimeSync(ts, self)
+
+    def params(self, method, args, kwargs):
+        """Returns a copy of the arguments of a call with secrets hidden"""
+
+        params = copy.deepcopy(kwargs)
+
+        if args:
+            params["args"] = copy.deepcopy(list(args))
+
+        hide_secrets(params)
+
+        # Authenticating positionally passes the password second
+        if method == "authenticate" and len(args) > 1:
+            params["args"][1] = "..."
+
+        return params
+
+    def record(self, method, params, result, seconds):
+        call = {
+            "method": method,
+            "endpoint": endpoints[method],
+            "params": params,
+            "ms": round(seconds * 1000, 1),
+            "bytes": payload_size(result),
+            "results": result_count(method, result),
+            "error": is_error(result)
+        }
+
+        with self.lock:
+            self.calls.append(call)
+
+    def summary(self):
+        """Returns the calls totalled by method, slowest first"""
+
+        totals = {}
+
+        with self.lock:
+            calls = list(self.calls)
+
+        for call in calls:
+            total = totals.setdefault(call["method"], {
+                "method": call["method"],
+                "endpoint": call["endpoint"],
+                "calls": 0,
+                "errors": 0,
+                "results": 0,
+                "bytes": 0,
+                "ms": 0.0,
+                "max_ms": 0.0
+            })
+
+            total["calls"] += 1
+            total["errors"] += call["error"]
+            total["results"] += call["results"]
+            total["bytes"] += call["bytes"]
+            total["ms"] += call["ms"]
+            total["max_ms"] = max(total["max_ms"], call["ms"])
+
+        return sorted(totals.values(), key=lambda t: -t["ms"])
+
+    def report(self, command_name):
+        """Prints a summary of the calls traced since the last report and
+        appends them to the trace file, then starts over"""
+
+        summary = self.summary()
+
+        if not summary:
+            return
+
+        out = self.out or sys.stderr
+
+        out.write(u"\nTimeSync requests made by {}:\n".format(
+            command_name))
+        out.write(u"{:<16} {:<24} {:>5} {:>6} {:>8} {:>9} {:>9} "
+                  u"{:>9}\n".format("method", "endpoint", "calls", "errors",
+                                    "results", "KB", "total ms", "max ms"))
+
+        for total in summary:
+            out.write(u"{:<16} {:<24} {:>5} {:>6} {:>8} {:>9.1f} "
+                      u"{:>9.1f} {:>9.1f}\n".format(
+                          total["method"], total["endpoint"], total["calls"],
+                          total["errors"], total["results"],
+                          total["bytes"] / 1024.0, total["ms"],
+                          total["max_ms"]))
+
+        if self.path:
+            with self.lock:
+                calls = list(self.calls)
+
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"command": command_name, "calls": calls,
+                                    "summary": summary}) + "\n")
+
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = []
+
+
+class TracedTimeSync(object):
+    """Passes everything through to a pymesync.TimeSync object, timing the
+    methods that send requests"""
+
+    def __init__(self, ts, tracer):
+        object.__setattr__(self, "_ts", ts)
+        object.__setattr__(self, "_tracer", tracer)
+
+    def __getattr__(self, name):
+        value = getattr(self._ts, name)
+
+        if name not in endpoints or not callable(value):
+            return value
+
+        def traced(*args, **kwargs):
+            # Pymesync changes some arguments, so copy them beforehand
+            params = self._tracer.params(name, args, kwargs)
+
+            start = default_timer()
+            result = value(*args, **kwargs)
+            self._tracer.record(name, params, result, default_timer() - start)
+
+            return result
+
+        return traced
+
+    def __setattr__(self, name, value):
+        setattr(self._ts, name, value)
@@ -0,0 +1,292 @@
+"""Pooled keep-alive HTTP connections for Pymesync
+
+Pymesync sends every request with requests.get(), requests.post() or
+requests.delete(), which open a new connection (and TLS session) each time.
+install() swaps the requests module Pymesync uses for a PooledTransport,
+which sends the same requests through one shared requests.Session so
+connections to TimeSync are kept open and reused by every command in a
+session and by every worker thread.
+
+The transport also keeps the responses to GET requests for users, projects,
+and activities in a ResponseCache. When TimeSync sent an ETag or
+Last-Modified header with a response, the next request for the same URL asks
+TimeSync to answer with 304 Not Modified if nothing changed, and the cached
+response is used instead of downloading it again. Responses without either
+header are reused without asking for a number of seconds instead.
+"""
+
+import base64
+import json
+import threading
+from timeit import default_timer
+from urlparse import urlparse
+
+import pymesync.pymesync
+import requests
+from requests.adapters import HTTPAdapter
+
+# The requests module Pymesync was imported with
+original_requests = pymesync.pymesync.requests
+
+install_lock = threading.Lock()
+
+# Endpoints whose GET responses are cached. Projects, activities and users
+# rarely change and are requested by many commands
+cached_endpoints = ("projects", "activities", "users")
+
+
+def request_endpoints(url):
+    """Returns the cached TimeSync endpoints whose objects a URL requests
+    (like ("projects",) for .../v0/projects/gwm?token=...), or () if it
+    doesn't request any. The users of a project change along with both the
+    project and the users, so .../projects/gwm/users requests both"""
+
+    parts = urlparse(url).path.rstrip("/").split("/")
+
+    if len(parts) >= 3 and parts[-3] == "projects" and parts[-1] == "users":
+        return ("projects", "users")
+
+    for part in parts[-2:]:
+        if part in cached_endpoints:
+            return (part,)
+
+    return ()
+
+
+def token_subject(token):
+    """Returns the username a TimeSync token was issued to, or the token
+    itself if it can't be decoded"""
+
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.b64decode(str(payload)))["sub"]
+    except (IndexError, KeyError, TypeError, ValueError):
+        return token
+
+
+def cache_key(url):
+    """Returns the key a response to a GET request for url is cached under.
+    The token is left out of the URL so responses outlive the token they
+    were requested with, but are never shared between users"""
+
+    parsed = urlparse(url)
+
+    # Pymesync doesn't quote tokens, so the query can't be unquoted either
+    params = parsed.query.split("&")
+    token = "".join(p[len("token="):] for p in params
+                    if p.startswith("token="))
+    query = "&".join(p for p in params if not p.startswith("token="))
+
+    return (token_subject(token), parsed.netloc, parsed.path, query)
+
+
+def validators(response):
+    """Returns the headers that ask TimeSync to answer 304 Not Modified if
+    the object in a response hasn't changed since"""
+
+    headers = {}
+
+    if response.headers.get("ETag"):
+        headers["If-None-Match"] = response.headers["ETag"]
+
+    if response.headers.get("Last-Modified"):
+        headers["If-Modified-Since"] = response.headers["Last-Modified"]
+
+    return headers
+
+
+class ResponseCache(object):
+    """Responses to GET requests by cache key, along with when they were
+    received or last confirmed to be unchanged"""
+
+    def __init__(self, ttl=60):
+        """ttl is the number of seconds responses without an ETag or
+        Last-Modified header are reused for. A value of 0 doesn't keep them"""
+
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        # Number of requests answered from the cache without asking TimeSync
+        # ("fresh"), after TimeSync answered 304 ("revalidated"), and not at
+        # all ("misses")
+        self.counts = {"fresh": 0, "revalidated": 0, "misses": 0}
+
+    def lookup(self, key):
+        """Returns the cached response and validator headers for key. The
+        response is None if there's nothing cached, and the headers are None
+        if the response can be used without asking TimeSync"""
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None:
+            return None, {}
+
+        response, stored_at = entry
+        headers = validators(response)
+
+        if not headers:
+            if default_timer() - stored_at < self.ttl:
+                return response, None
+
+            return None, {}
+
+        return response, headers
+
+    def store(self, key, response):
+        cache_control = response.headers.get("Cache-Control", "")
+
+        if response.status_code != 200 or "no-store" in cache_control:
+            return
+
+        if not validators(response) and self.ttl <= 0:
+            return
+
+        # Read the body now, while the connection it came over is still ours
+        response.content
+
+        with self.lock:
+            self.entries[key] = (response, default_timer())
+
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def invalidate(self, endpoints):
+        """Forgets the cached responses that requested any of endpoints"""
+
+        with self.lock:
+            self.entries = {key: entry
+                            for key, entry in self.entries.iteritems()
+                            if not set(request_endpoints(key[2])) &
+                            set(endpoints)}
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+
+
+class PooledTransport(object):
+    """Stands in for the requests module inside Pymesync"""
+
+    # Pymesync catches requests.exceptions.RequestException
+    exceptions = requests.exceptions
+
+    def __init__(self, pool_size=10, connect_timeout=10, read_timeout=0,
+                 cache_ttl=60):
+        """pool_size is the number of connections kept open to each host.
+        Timeouts are in seconds, and 0 waits forever"""
+
+        self.settings = (pool_size, connect_timeout, read_timeout)
+        self.timeout = (connect_timeout or None, read_timeout or None)
+        self.cache = ResponseCache(cache_ttl)
+
+        self.session = requests.Session()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+
+        endpoints = request_endpoints(url)
+
+        if not endpoints:
+            return self.session.request(method, url, **kwargs)
+        elif method == "GET":
+            return self.cached_get(url, **kwargs)
+
+        # Anything else sent to a cached endpoint may change what it returns.
+        # Projects list their users, so changing users changes them too
+        if "users" in endpoints:
+            endpoints = ("projects", "users")
+
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            self.cache.invalidate(endpoints)
+
+    def cached_get(self, url, **kwargs):
+        key = cache_key(url)
+        cached, headers = self.cache.lookup(key)
+
+        if headers is None:
+            self.cache.count("fresh")
+            return cached
+
+        headers.update(kwargs.pop("headers", None) or {})
+
+        response = self.session.request("GET", url, headers=headers, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            self.cache.count("revalidated")
+            self.cache.store(key, cached)
+            return cached
+
+        self.cache.count("misses")
+        self.cache.store(key, response)
+
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def install(pool_size=10, connect_timeout=10, read_timeout=0,
+            cache_ttl=60):
+    """Makes Pymesync send its requests through a shared PooledTransport and
+    returns it. The transport that's already installed is kept, along with
+    its open connections and cached responses, unless the connection
+    settings changed"""
+
+    settings = (pool_size, connect_timeout, read_timeout)
+
+    with install_lock:
+        current = pymesync.pymesync.requests
+
+        if isinstance(current, PooledTransport):
+            if current.settings == settings:
+                current.cache.ttl = cache_ttl
+                return current
+
+            current.close()
+
+        transport = PooledTransport(*(settings + (cache_ttl,)))
+        pymesync.pymesync.requests = transport
+
+    return transport
+
+
+def clear_cache():
+    """Forgets every response cached by the installed transport"""
+
+    current = pymesync.pymesync.requests
+
+    if isinstance(current, PooledTransport):
+        current.cache.clear()
+
+
+def uninstall():
+    """Closes the installed transport and gives Pymesync back the requests
+    module"""
+
+    with install_lock:
+        current = pymesync.pymesync.requests
+
+        if isinstance(current, PooledTransport):
+            current.close()
+
+        pymesync.pymesync.requests = original_requests
@@ -1,33 +1,51 @@
 import ConfigParser
+import json
 import os
 import re
 import stat
+import tempfile
 import codecs
 import csv
-import cStringIO
 import sys  # NOQA flake8 ignore
-from collections import OrderedDict
-from datetime import datetime
+from collections import OrderedDict, deque
+from StringIO import StringIO
+from datetime import date, datetime, timedelta
 from getpass import getpass
+from itertools import islice, product
+from time import sleep, time as current_timestamp
+from types import GeneratorType
+
+from timetable import TimeRow, TimeTable
 
 
 config_file = None
 
+# Parsed configuration files by path, along with the stat_stamp of the file
+# they were parsed from
+config_cache = {}
+
+# Bumped whenever the format of the metadata cache changes
+metadata_cache_version = 1
+
+# The fields sum-times can group times by
+sum_fields = ("user", "project", "activity", "day", "week", "month")
+
 
 class UnicodeDictWriter:
     """
     Wrapper for csv.DictWriter that adds support for dictionaries with
     Unicode string contents
 
+    Each cell is encoded once and every row is written straight to the byte
+    stream f, so rows are never buffered
+
     Based on a recipe from the Python 2 docs
     """
 
     def __init__(self, f, headers, dialect=csv.excel, encoding="utf-8",
                  **kwargs):
-        self.queue = cStringIO.StringIO()
-        self.writer = csv.writer(self.queue, dialect=dialect, **kwargs)
-        self.stream = f
-        self.encoder = codecs.getincrementalencoder(encoding)()
+        self.writer = csv.writer(f, dialect=dialect, **kwargs)
+        self.encoding = encoding
         self.headers = headers
 
     def writeheader(self):
@@ -36,26 +54,13 @@ class UnicodeDictWriter:
         self.__writerow(uni_headers)
 
     def writerow(self, row):
-        row_ordered = OrderedDict()
-
-        for header in self.headers:
-            uni_value = self.__convert_csv_writable(row.setdefault(header, ""))
-
-            row_ordered[header] = uni_value
-
-        self.__writerow(row_ordered.itervalues())
+        self.__writerow([self.__convert_csv_writable(row.get(header, ""))
+                         for header in self.headers])
 
     ####################
 
     def __writerow(self, row):
-        self.writer.writerow([s.encode("utf-8") for s in row])
-
-        data = self.queue.getvalue()
-        data = data.decode("utf-8")
-        data = self.encoder.encode(data)
-
-        self.stream.write(data)
-        self.queue.truncate(0)
+        self.writer.writerow([s.encode(self.encoding) for s in row])
 
     def __convert_csv_writable(self, value):
         if isinstance(value, list):
@@ -88,6 +93,98 @@ def ts_error(*ts_objects):
             return True
 
 
+def map_concurrently(func, items, workers=1):
+    """Calls func on each item using a bounded pool of worker threads and
+    yields the results in the same order as the items
+
+    No more than workers calls are made ahead of the results the caller has
+    taken, so results the caller hasn't gotten to yet don't pile up in memory
+
+    If the caller stops iterating early (e.g. on the first error response),
+    the remaining calls are abandoned and the pool is shut down
+    """
+
+    items = list(items)
+
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield func(item)
+
+        return
+
+    # Only commands that send requests concurrently need multiprocessing
+    from multiprocessing.pool import ThreadPool
+
+    workers = min(workers, len(items))
+    pool = ThreadPool(workers)
+    remaining = iter(items)
+    pending = deque(pool.apply_async(func, (item,))
+                    for item in islice(remaining, workers))
+
+    try:
+        while pending:
+            result = pending.popleft().get()
+
+            for item in islice(remaining, 1):
+                pending.append(pool.apply_async(func, (item,)))
+
+            yield result
+    finally:
+        pool.terminate()
+
+
+def error_message(ts_object):
+    """Returns the most descriptive error message in a TimeSync or Pymesync
+    error object"""
+
+    for key in ("pymesync error", "text", "error"):
+        if ts_object.get(key):
+            return u"{}".format(ts_object[key])
+
+    return u""
+
+
+def is_transient_error(ts_object):
+    """Returns True if a TimeSync or Pymesync response is an error that might
+    not happen again if the request is retried"""
+
+    if not isinstance(ts_object, dict):
+        return False
+
+    error = ts_object.get("pymesync error")
+
+    # Pymesync also uses pymesync errors for requests it refuses to send
+    # (like an invalid duration or not being signed in), which fail the same
+    # way every time. Only its connection failures (the exception raised by
+    # requests) and responses that aren't JSON (e.g. from a proxy) count
+    if error is not None:
+        if isinstance(error, Exception):
+            return True
+
+        match = re.search(r"connection to TimeSync failed.*response status "
+                          r"was (\d+)", u"{}".format(error))
+
+        return match is not None and not 400 <= int(match.group(1)) < 500
+
+    try:
+        return "error" in ts_object and int(ts_object.get("status")) >= 500
+    except (TypeError, ValueError):
+        return False
+
+
+def call_with_retries(func, retries=2, delay=0.5):
+    """Calls func until it returns a response that isn't a transient error,
+    waiting twice as long before each retry. Returns the last response"""
+
+    for attempt in range(retries + 1):
+        response = func()
+
+        if attempt == retries or not is_transient_error(response):
+            return response
+
+        sleep(delay * 2 ** attempt)
+
+
 def create_config(path="~/.climesyncrc"):
     """Create the configuration file if it doesn't exist"""
 
@@ -117,6 +214,15 @@ def read_config(path="~/.climesyncrc"):
 
     realpath = os.path.expanduser(path)
 
+    config_file = path
+
+    # Only parse the file again if it has changed since it was last read
+    stamp = stat_stamp(realpath)
+    cached = config_cache.get(realpath)
+
+    if stamp is not None and cached and cached[0] == stamp:
+        return cached[1]
+
     config = ConfigParser.RawConfigParser()
 
     # If the file already exists, try to read it
@@ -131,7 +237,8 @@ def read_config(path="~/.climesyncrc"):
             print "ERROR: Invalid configuration file!"
             return None
 
-    config_file = path
+    if stamp is not None:
+        config_cache[realpath] = (stamp, config)
 
     return config
 
@@ -168,15 +275,33 @@ def write_config(key, value, path="~/.climesyncrc"):
         config.add_section("climesync")
         config.set("climesync", key, value.encode("utf-8"))
 
-    # Truncate existing file before writing to it
-    with codecs.open(realpath, "w", "utf-8") as f:
-        f.write(u"# Climesync configuration file\n")
+    contents = StringIO()
+    contents.write("# Climesync configuration file\n")
+    config.write(contents)
 
-        # Write the config values
-        config.write(f)
+    # Replace the file in one step so it's never left half written
+    write_private_file(path, contents.getvalue())
 
     config_file = path
 
+    # The config written is already parsed, so keep it for the next read
+    stamp = stat_stamp(realpath)
+
+    if stamp is not None:
+        config_cache[realpath] = (stamp, config)
+
+
+def stat_stamp(realpath):
+    """Returns a value that changes whenever the file at realpath is modified
+    or replaced, or None if it doesn't exist"""
+
+    try:
+        st = os.stat(realpath)
+    except OSError:
+        return None
+
+    return st.st_mtime, st.st_size, st.st_ino
+
 
 def current_datetime():
     """Returns the current datetime (Wrapper for datetime.now() so that it
@@ -234,6 +359,155 @@ def clear_session(path="~/.climesyncsession"):
     os.remove(realpath)
 
 
+def write_private_file(path, data):
+    """Atomically replaces the file at path with data, readable and writable
+    only by its owner"""
+
+    realpath = os.path.expanduser(path)
+    dirname = os.path.dirname(realpath)
+
+    # mkstemp creates the file with mode 600
+    fd, temppath = tempfile.mkstemp(dir=dirname, prefix=".climesync")
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+
+        os.rename(temppath, realpath)
+    except:
+        os.remove(temppath)
+        raise
+
+
+def read_metadata_cache(baseurl, username, ttl,
+                        path="~/.climesyncmetadata"):
+    """Reads the cached user, users, projects, and activities for a user on a
+    TimeSync server, if they are cached and no more than ttl seconds old"""
+
+    realpath = os.path.expanduser(path)
+
+    try:
+        with open(realpath, "r") as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if not isinstance(cache, dict) or \
+            cache.get("version") != metadata_cache_version:
+        return None
+
+    entry = cache.get("entries", {}).get(u"{} {}".format(baseurl, username))
+
+    if not entry or not 0 <= current_timestamp() - entry["fetched_at"] <= ttl:
+        return None
+
+    return entry["metadata"]
+
+
+def write_metadata_cache(baseurl, username, metadata,
+                         path="~/.climesyncmetadata"):
+    """Caches the user, users, projects, and activities for a user on a
+    TimeSync server"""
+
+    realpath = os.path.expanduser(path)
+
+    try:
+        with open(realpath, "r") as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        cache = None
+
+    if not isinstance(cache, dict) or \
+            cache.get("version") != metadata_cache_version:
+        cache = {"version": metadata_cache_version, "entries": {}}
+
+    cache["entries"][u"{} {}".format(baseurl, username)] = {
+        "fetched_at": current_timestamp(),
+        "metadata": metadata
+    }
+
+    try:
+        write_private_file(path, json.dumps(cache))
+    except (IOError, OSError):
+        pass
+
+
+def clear_metadata_cache(baseurl=None, path="~/.climesyncmetadata"):
+    """Removes the cached metadata of every user on a TimeSync server, or of
+    every server if no URL is given"""
+
+    realpath = os.path.expanduser(path)
+
+    if not os.path.exists(realpath):
+        return
+
+    if baseurl is None:
+        os.remove(realpath)
+        return
+
+    try:
+        with open(realpath, "r") as f:
+            cache = json.load(f)
+
+        prefix = u"{} ".format(baseurl)
+        cache["entries"] = {k: v for k, v in cache["entries"].iteritems()
+                            if not k.startswith(prefix)}
+
+        write_private_file(path, json.dumps(cache))
+    except (IOError, OSError, ValueError, KeyError, AttributeError):
+        os.remove(realpath)
+
+
+def read_token(baseurl, username, auth_type, path="~/.climesynctoken"):
+    """Reads the stored auth token of a user on a TimeSync server, if there
+    is one"""
+
+    realpath = os.path.expanduser(path)
+
+    try:
+        with open(realpath, "r") as f:
+            tokens = json.load(f)
+    except (IOError, ValueError):
+        return None
+
+    if not isinstance(tokens, dict):
+        return None
+
+    return tokens.get(u"{} {} {}".format(baseurl, username, auth_type))
+
+
+def write_token(baseurl, username, auth_type, token,
+                path="~/.climesynctoken"):
+    """Stores the auth token of a user on a TimeSync server so later runs can
+    reuse it, or removes it if the token is None"""
+
+    realpath = os.path.expanduser(path)
+
+    try:
+        with open(realpath, "r") as f:
+            tokens = json.load(f)
+    except (IOError, ValueError):
+        tokens = None
+
+    if not isinstance(tokens, dict):
+        tokens = {}
+
+    key = u"{} {} {}".format(baseurl, username, auth_type)
+
+    if token is None:
+        if key not in tokens:
+            return
+
+        del tokens[key]
+    else:
+        tokens[key] = token
+
+    try:
+        write_private_file(path, json.dumps(tokens))
+    except (IOError, OSError):
+        pass
+
+
 def construct_clock_out_time(session, now, revisions, project):
     """Construct a time for clocking out using session data, the current
     datetime, and any revisions the user wished to make"""
@@ -278,22 +552,22 @@ def check_token_expiration(ts):
     """Checks to see if the auth token has expired. If it has, try to log the
     user back in using the username and password in their config file"""
 
-    # If ts_token_expiration_time() returns a dict, there must be an error
-    if type(ts.token_expiration_time()) is dict:
+    expiration = ts.token_expiration_time()
+
+    # If ts.token_expiration_time() returns a dict, there must be an error
+    if type(expiration) is dict:
         return True
 
     # If the token is expired, try to log the user back in
-    if ts and not ts.test and ts.token_expiration_time() <= datetime.now():
+    if ts and not ts.test and expiration <= datetime.now():
         config = read_config()
-        username = config.get("climesync", "username")
-        baseurl = config.get("climesync", "timesync_url")
-        if baseurl[-1] == "/":
-            baseurl = baseurl[:-1]
 
-        if config.has_option("climesync", "username") \
+        if config and config.has_option("climesync", "username") \
            and config.has_option("climesync", "password") \
-           and username == ts.user \
-           and baseurl == ts.baseurl:
+           and config.has_option("climesync", "timesync_url") \
+           and config.get("climesync", "username") == ts.user \
+           and config.get("climesync", "timesync_url").rstrip("/") == \
+                ts.baseurl:
             username = config.get("climesync", "username")
             password = config.get("climesync", "password")
 
@@ -304,9 +578,17 @@ def check_token_expiration(ts):
 
 def output_csv(response, data_type, path=None):
     """Outputs a TimeSync response to a CSV file at the specified path, or
-    to stdout if no path is supplied"""
+    to stdout if no path is supplied
+
+    response can be any iterable of TimeSync objects, including a generator,
+    in which case each object is written as soon as it's produced
+    """
+
+    ts_objects = iter(response)
+    first_object = next(ts_objects, None)
 
-    if response and "error" in response[0] or "pymesync error" in response[0]:
+    if first_object is not None and ("error" in first_object or
+                                     "pymesync error" in first_object):
         return
 
     common_headers = ["uuid", "revision", "created_at", "updated_at",
@@ -324,6 +606,8 @@ def output_csv(response, data_type, path=None):
         headers = ["username", "display_name", "email", "site_spectator",
                    "site_manager", "site_admin", "active", "meta",
                    "created_at", "updated_at", "deleted_at"]
+    elif data_type == "sum" and first_object is not None:
+        headers = first_object.keys()
     elif path is not None:
         print "Unknown data type!"
         return
@@ -331,20 +615,135 @@ def output_csv(response, data_type, path=None):
         return
 
     if path is not None:
-        csvfile = codecs.open(path, "w", "utf-8-sig")
+        csvfile = open(path, "wb")
+        csvfile.write(codecs.BOM_UTF8)
     else:
         csvfile = sys.stdout
 
     writer = UnicodeDictWriter(csvfile, headers, quoting=csv.QUOTE_ALL)
 
     writer.writeheader()
-    for ts_object in response:
+
+    if first_object is not None:
+        writer.writerow(first_object)
+
+    for ts_object in ts_objects:
         writer.writerow(ts_object)
 
     if path is not None:
         csvfile.close()
 
 
+def read_times_file(f, file_format):
+    """Reads times to submit from a CSV or JSON Lines file one at a time
+
+    Yields a (line number, time, error message) tuple for each time in the
+    file. If the time couldn't be read, the time is None and the error message
+    explains why. Otherwise the error message is None
+    """
+
+    if file_format == "csv":
+        # Skip the byte order mark output_csv writes before the headers
+        lines = (l[len(codecs.BOM_UTF8):]
+                 if n == 0 and l.startswith(codecs.BOM_UTF8) else l
+                 for n, l in enumerate(f))
+
+        reader = csv.DictReader(lines)
+        rows = ((reader.line_num, row) for row in reader)
+    else:
+        rows = enumerate(f, 1)
+
+    for line, row in rows:
+        if file_format == "csv":
+            row = {k.decode("utf-8"): v.decode("utf-8")
+                   for k, v in row.iteritems() if k is not None and v}
+        else:
+            if not row.strip():
+                continue
+
+            try:
+                row = json.loads(row.decode("utf-8-sig"))
+            except ValueError as e:
+                yield line, None, u"Invalid JSON: {}".format(e)
+                continue
+
+            if not isinstance(row, dict):
+                yield line, None, u"Expected a JSON object"
+                continue
+
+        yield line, parse_time_fields(row), None
+
+
+def read_uuids(f):
+    """Yields the UUIDs in a file with one UUID per line, skipping blank lines
+    and lines starting with #"""
+
+    for line in f:
+        line = line.strip()
+
+        if line and not line.startswith("#"):
+            yield line.decode("utf-8-sig")
+
+
+def parse_time_fields(row):
+    """Converts the fields of a time read from a file into the values Pymesync
+    expects, leaving out any fields that can't be submitted"""
+
+    time = {}
+
+    for field in ("duration", "project", "activities", "date_worked",
+                  "issue_uri", "notes"):
+        value = row.get(field)
+
+        if value is None or value == "" or value == []:
+            continue
+
+        if field == "duration":
+            if isinstance(value, basestring) and value.isdigit():
+                value = int(value)
+        elif field in ("project", "activities") and \
+                isinstance(value, basestring):
+            # Accept lists as written by output_csv, e.g. ['code','docs'], as
+            # well as comma or space delimited slugs
+            value = re.findall(r"[^\s,'\[\]]+", value)
+
+        if field == "project" and isinstance(value, list):
+            value = value[0] if value else None
+
+            if value is None:
+                continue
+
+        time[field] = value
+
+    time.setdefault("date_worked", date.today().isoformat())
+
+    return time
+
+
+def date_windows(start_date_str, end_date_str, days):
+    """Splits the dates from start_date_str to end_date_str (inclusive) into
+    consecutive windows of at most the given number of days
+
+    Returns a list of (window start, window end) datestring tuples
+    """
+
+    start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+    end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+    window_length = timedelta(days=days)
+
+    windows = []
+
+    while start_date <= end_date:
+        window_end = min(start_date + window_length - timedelta(days=1),
+                         end_date)
+
+        windows.append((start_date.isoformat(), window_end.isoformat()))
+
+        start_date = window_end + timedelta(days=1)
+
+    return windows
+
+
 def is_time(time_str):
     """Checks if the supplied string is formatted as a time value for Pymesync
 
@@ -359,6 +758,21 @@ def is_time(time_str):
     return True if re.match(r"\A[\d]+h[\d]+m\Z", time_str) else False
 
 
+def duration_seconds(duration):
+    """Converts a duration given in seconds or as <value>h<value>m into a
+    number of seconds"""
+
+    if isinstance(duration, basestring):
+        if duration.isdigit():
+            return int(duration)
+
+        if is_time(duration):
+            hours, minutes = re.match(r"(\d+)h(\d+)m", duration).groups()
+            return int(hours) * 3600 + int(minutes) * 60
+
+    return duration
+
+
 def is_date(date_str):
     """Checks if the supplied string is formatted as an ISO 8601 datestring
 
@@ -404,6 +818,49 @@ def to_readable_time(seconds):
     return "{}h{}m".format(hours, minutes)
 
 
+def summarize_project_times(times, slugs):
+    """Computes the time summary of each of the given projects in a single
+    pass over their times
+
+    times - A list of times belonging to any of the projects
+    slugs - The slugs of the projects to summarize
+
+    Returns a dictionary mapping each project slug that has at least one time
+    to its time_total, num_times, latest_time and first_time
+    """
+
+    slugs = set(slugs)
+
+    # Running [duration sum, number of times, first date, latest date]
+    totals = {}
+
+    for time in times:
+        time_slugs = time["project"]
+
+        if isinstance(time_slugs, basestring):
+            time_slugs = [time_slugs]
+
+        date_worked = date_worked_key(time)
+
+        for slug in slugs.intersection(time_slugs):
+            total = totals.get(slug)
+
+            if total is None:
+                totals[slug] = [time["duration"], 1, date_worked, date_worked]
+                continue
+
+            total[0] += time["duration"]
+            total[1] += 1
+            total[2] = min(total[2], date_worked)
+            total[3] = max(total[3], date_worked)
+
+    return {slug: {"time_total": to_readable_time(total[0]),
+                   "num_times": total[1],
+                   "latest_time": total[3],
+                   "first_time": total[2]}
+            for slug, total in totals.iteritems()}
+
+
 def value_to_printable(value, **format_flags):
     """Formats values returned by Pymesync into nice-looking strings
 
@@ -446,8 +903,13 @@ def print_json(response):
 
     print ""
 
-    if isinstance(response, list):  # List of dictionaries
+    # List of dictionaries, or a generator that yields them as they arrive
+    if isinstance(response, (list, GeneratorType, TimeTable)):
         for json_dict in response:
+            # Skip the "detail" marker used by print_pretty_time
+            if not isinstance(json_dict, (dict, TimeRow)):
+                continue
+
             for key, value in json_dict.iteritems():
                 time_value = True if key == "duration" else False
                 print u"{}: {}" \
@@ -467,15 +929,20 @@ def print_json(response):
         print response
 
 
-def compare_date_worked(time_a, time_b):
-    """"""
+def date_worked_key(time):
+    """Sort key that orders times by date worked
+
+    Dates worked are ISO 8601 datestrings, which sort the same way as the
+    dates they represent, so they're compared without being parsed
+    """
+
+    return time["date_worked"]
 
-    date_format = "%Y-%m-%d"
 
-    date_a = datetime.strptime(time_a["date_worked"], date_format)
-    date_b = datetime.strptime(time_b["date_worked"], date_format)
+def sort_times(times):
+    """Returns a list of the times sorted by date worked"""
 
-    return date_a < date_b
+    return sorted(times, key=date_worked_key)
 
 
 def determine_data_type(data):
@@ -484,7 +951,7 @@ def determine_data_type(data):
     if not data:
         return ""
 
-    if isinstance(data, list):
+    if isinstance(data, (list, TimeTable)):
         data = data[0]
 
     if "duration" in data:
@@ -499,6 +966,131 @@ def determine_data_type(data):
         return ""
 
 
+def aggregate_project_times(times, projects):
+    """Sums the durations of times per project, per user in each project, and
+    per activity of each of those users in a single pass over the times
+
+    Returns a dictionary mapping each project slug to a dictionary with the
+    project's number of entries, the dates worked of its first and last
+    entries, its total duration, the total duration of each of its
+    activities, and the total and per-activity durations of each of its users
+    """
+
+    project_set = set(projects)
+    summaries = {}
+
+    for time in times:
+        duration = time["duration"]
+        time_activities = set(time["activities"])
+
+        for project in project_set.intersection(time["project"]):
+            summary = summaries.get(project)
+
+            if summary is None:
+                summary = summaries[project] = {
+                    "entries": 0,
+                    "first_date": time["date_worked"],
+                    "total": 0,
+                    "activities": {},
+                    "users": {}
+                }
+
+            summary["entries"] += 1
+            summary["last_date"] = time["date_worked"]
+            summary["total"] += duration
+
+            user_sums = summary["users"].get(time["user"])
+
+            if user_sums is None:
+                user_sums = summary["users"][time["user"]] = {
+                    "total": 0,
+                    "activities": {}
+                }
+
+            user_sums["total"] += duration
+
+            for activity in time_activities:
+                summary["activities"][activity] = \
+                    summary["activities"].get(activity, 0) + duration
+                user_sums["activities"][activity] = \
+                    user_sums["activities"].get(activity, 0) + duration
+
+    return summaries
+
+
+def sum_times(times, group_by):
+    """Totals the number of entries and the durations of times grouped by a
+    combination of sum_fields, in a single pass over the times
+
+    A time's project field lists every slug of its one project, so times are
+    grouped by the first slug. Times with more than one activity count toward
+    the group of each of them, but only once toward the grand total. Returns
+    a row for each group in sorted order, followed by a row with the grand
+    total
+    """
+
+    # ISO weeks by date worked, so each date is only parsed once
+    weeks = {}
+
+    def week(time):
+        date_worked = time["date_worked"]
+
+        if date_worked not in weeks:
+            year, month, day = (int(n) for n in date_worked[:10].split("-"))
+            iso_year, iso_week, _ = date(year, month, day).isocalendar()
+            weeks[date_worked] = "{}-W{:02}".format(iso_year, iso_week)
+
+        return (weeks[date_worked],)
+
+    key_getters = {
+        "user": lambda time: (time["user"],),
+        "project": lambda time: (time["project"] or ["-"])[:1],
+        "activity": lambda time: time.get("activities") or ("-",),
+        "day": lambda time: (time["date_worked"],),
+        "week": week,
+        "month": lambda time: (time["date_worked"][:7],),
+    }
+
+    getters = [key_getters[field] for field in group_by]
+
+    groups = {}
+    entries = 0
+    total = 0
+
+    for time in times:
+        duration = time["duration"]
+
+        entries += 1
+        total += duration
+
+        for key in product(*[getter(time) for getter in getters]):
+            sums = groups.get(key)
+
+            if sums is None:
+                groups[key] = [1, duration]
+            else:
+                sums[0] += 1
+                sums[1] += duration
+
+    rows = []
+
+    for key in sorted(groups):
+        row = OrderedDict(zip(group_by, key))
+        row["entries"], row["seconds"] = groups[key]
+        row["total"] = to_readable_time(row["seconds"])
+
+        rows.append(row)
+
+    row = OrderedDict((field, "all") for field in group_by)
+    row["entries"] = entries
+    row["seconds"] = total
+    row["total"] = to_readable_time(total)
+
+    rows.append(row)
+
+    return rows
+
+
 def print_pretty_time(response):
     """Abandon all hope ye who enter here"""
 
@@ -506,14 +1098,14 @@ def print_pretty_time(response):
         response = [response] + ["detail"]
 
     if "detail" not in response:
-        times = sorted(response, cmp=compare_date_worked)
+        times = sort_times(response)
         projects = list({time["project"][0] for time in times})
         activities = list({a for time in times for a in time["activities"]})
         users = list({time["user"] for time in times})
 
-        print
+        summaries = aggregate_project_times(times, projects)
 
-        sorted_times = OrderedDict((p, 0) for p in projects)
+        print
 
         min_leading_whitespace = 9
 
@@ -521,16 +1113,14 @@ def print_pretty_time(response):
         min_activity_whitespace = 10
 
         for project in projects:
-            project_times = [t for t in times
-                             if project in t["project"]]
+            summary = summaries[project]
+            project_activity_sums = summary["activities"]
+            project_user_sums = summary["users"]
 
             project_activities = [a for a in activities
-                                  if any(a in t["activities"]
-                                         for t in project_times)]
+                                  if a in project_activity_sums]
 
-            project_users = [u for u in users
-                             if any(u == t["user"]
-                                    for t in project_times)]
+            project_users = [u for u in users if u in project_user_sums]
 
             leading_whitespace = max([min_leading_whitespace] +
                                      [len(u) + 1 for u in project_users])
@@ -546,53 +1136,22 @@ def print_pretty_time(response):
                                    for a, w in zip(project_activities,
                                                    activity_whitespaces))
 
-            sorted_activity_time_sums = OrderedDict((a, 0)
-                                                    for a
-                                                    in project_activities)
-
-            sorted_times[project] = OrderedDict((u, 0) for u in users)
-
-            entry_text = "entry" if len(project_times) == 1 else "entries"
+            entry_text = "entry" if summary["entries"] == 1 else "entries"
 
             print u"{} - {} {} ({} - {})".format(project,
-                                                 len(project_times),
+                                                 summary["entries"],
                                                  entry_text,
-                                                 project_times[0]
-                                                              ["date_worked"],
-                                                 project_times[-1]
-                                                              ["date_worked"])
+                                                 summary["first_date"],
+                                                 summary["last_date"])
 
             print u"{}{}".format(" "*leading_whitespace, activity_row)
 
             for user in project_users:
-                user_times = [t for t in project_times
-                              if user == t["user"]]
-
-                user_activities = [a for a in project_activities
-                                   if any(a in t["activities"]
-                                          for t in user_times)]
-
-                sorted_times[project][user] = OrderedDict((a, 0)
-                                                          for a in
-                                                          project_activities)
-
-                for activity in user_activities:
-                    activity_times = [t for t in user_times
-                                      if activity in t["activities"]]
-
-                    activity_time_sum = sum(t["duration"]
-                                            for t in activity_times)
-
-                    sorted_activity_time_sums[activity] += activity_time_sum
-                    sorted_times[project][user][activity] = activity_time_sum
+                user_sums = project_user_sums[user]
 
-                activity_time_sums = [s for s in sorted_times[project][user]
-                                      .itervalues()]
-
-                activity_times = [to_readable_time(s)
-                                  for s in activity_time_sums]
-
-                user_time_sum = sum(t["duration"] for t in user_times)
+                activity_times = [to_readable_time(user_sums["activities"]
+                                                   .get(a, 0))
+                                  for a in project_activities]
 
                 user_time_whitespace = " "*(leading_whitespace - len(user))
 
@@ -606,17 +1165,10 @@ def print_pretty_time(response):
                 print u"{}{}{}Total: {}".format(user, user_time_whitespace,
                                                 time_row,
                                                 to_readable_time(
-                                                    user_time_sum))
-
-                sorted_times[project][user] = user_time_sum
-
-            total_activity_time_sums = [s for s in sorted_activity_time_sums
-                                        .itervalues()]
+                                                    user_sums["total"]))
 
-            total_activity_times = [to_readable_time(s)
-                                    for s in total_activity_time_sums]
-
-            project_time_sum = sum(t["duration"] for t in project_times)
+            total_activity_times = [to_readable_time(project_activity_sums[a])
+                                    for a in project_activities]
 
             project_total_whitespace = " "*(leading_whitespace - 7)
             time_total_whitespaces = [" "*(activity_time_whitespace[i]
@@ -631,37 +1183,39 @@ def print_pretty_time(response):
             print u"Totals:{}{}Total: {}".format(project_total_whitespace,
                                                  time_total_row,
                                                  to_readable_time(
-                                                     project_time_sum))
-
-            sorted_times[project] = project_time_sum
+                                                     summary["total"]))
 
             print
     else:
-        del response[response.index("detail")]
+        if isinstance(response, list):
+            del response[response.index("detail")]
 
         # Sort by date worked
-        times = sorted(response, cmp=compare_date_worked)
+        times = sort_times(response)
 
         # Sort again by project slug
         times = sorted(times, key=lambda t: t["project"])
 
-        times_data = []
+        # Build each time's fields as it's printed instead of all at once
+        print_json(time_details(times))
+
 
-        for time in times:
-            time_data = OrderedDict()
-            time_data["user"] = time["user"]
-            time_data["project"] = time["project"]
-            time_data["activities"] = time["activities"]
-            time_data["duration"] = time["duration"]
-            time_data["date_worked"] = time["date_worked"]
-            time_data["created_at"] = time["created_at"]
-            time_data["issue_uri"] = time.setdefault("issue_uri", "")
-            time_data["notes"] = time.setdefault("notes", "")
-            time_data["uuid"] = time["uuid"]
+def time_details(times):
+    """Yields the fields of each time shown in the time detail view"""
 
-            times_data.append(time_data)
+    for time in times:
+        time_data = OrderedDict()
+        time_data["user"] = time["user"]
+        time_data["project"] = time["project"]
+        time_data["activities"] = time["activities"]
+        time_data["duration"] = time["duration"]
+        time_data["date_worked"] = time["date_worked"]
+        time_data["created_at"] = time["created_at"]
+        time_data["issue_uri"] = time.get("issue_uri", "")
+        time_data["notes"] = time.get("notes", "")
+        time_data["uuid"] = time["uuid"]
 
-        print_json(times_data)
+        yield time_data
 
 
 def print_pretty_project(response):
@@ -26,7 +26,13 @@ setup(
     ],
     scripts=["climesync/climesync.py",
              "climesync/util.py",
-             "climesync/commands.py"],
+             "climesync/commands.py",
+             "climesync/daemon.py",
+             "climesync/timestore.py",
+             "climesync/outbox.py",
+             "climesync/tracing.py",
+             "climesync/timetable.py",
+             "climesync/transport.py"],
     entry_points={
         "console_scripts": [
             "climesync = climesync:main"
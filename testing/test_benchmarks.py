@@ -0,0 +1,112 @@
+import unittest
+from timeit import default_timer
+
+import pymesync
+
+from benchmarks.stub_server import StubTimeSync, synthetic_data
+
+
+class StubTimeSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubTimeSync(synthetic_data(times=20)).start()
+        self.ts = pymesync.TimeSync(baseurl=self.server.url)
+        self.ts.authenticate(username="user0", password="password",
+                             auth_type="password")
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_get_times(self):
+        times = self.ts.get_times({"user": ["user1"]})
+
+        self.assertEqual(len(times), 4)
+        self.assertTrue(all(t["user"] == "user1" for t in times))
+
+    def test_get_project(self):
+        project = self.ts.get_projects({"slug": "p3"})
+
+        self.assertEqual(project[0]["slugs"], ["p3"])
+
+    def test_create_time(self):
+        time = {"duration": 3600, "project": "p0", "activities": ["a0"],
+                "user": "user0", "date_worked": "2017-01-01", "notes": "",
+                "issue_uri": ""}
+
+        created = self.ts.create_time(time)
+
+        self.assertIn("uuid", created)
+        self.assertEqual(len(self.ts.get_times({"start": ["2017-01-01"]})),
+                         1)
+
+    def test_missing_object(self):
+        response = self.ts.get_activities({"slug": "nonexistent"})
+
+        self.assertEqual(response[0]["status"], 404)
+
+    def test_request_count(self):
+        self.ts.get_users()
+        self.ts.get_activities()
+
+        # Authenticating sent one more
+        self.assertEqual(self.server.request_count(), 3)
+        self.server.reset_counts()
+        self.assertEqual(self.server.request_count(), 0)
+
+
+class StubTimeSyncFaultTest(unittest.TestCase):
+
+    def start(self, **faults):
+        self.server = StubTimeSync(synthetic_data(times=20), **faults).start()
+        self.addCleanup(self.server.stop)
+
+        ts = pymesync.TimeSync(baseurl=self.server.url)
+        ts.authenticate(username="user0", password="password",
+                        auth_type="password")
+
+        return ts
+
+    def test_latency(self):
+        ts = self.start(latency=0.05)
+
+        start = default_timer()
+        ts.get_activities()
+
+        self.assertGreaterEqual(default_timer() - start, 0.05)
+
+    def test_errors(self):
+        ts = self.start()
+        self.server.error_rate = 1
+        self.server.error_status = 503
+
+        response = ts.get_projects()
+
+        self.assertEqual(response[0]["status"], 503)
+        self.assertEqual(self.server.faults["errors"], 1)
+
+    def test_drops(self):
+        ts = self.start()
+        self.server.drop_rate = 1
+
+        response = ts.get_users()
+
+        self.assertIn("pymesync error", response[0])
+        self.assertEqual(self.server.faults["drops"], 1)
+
+    def test_error_rate(self):
+        ts = self.start(seed=1)
+        self.server.error_rate = 0.5
+
+        responses = [ts.get_activities({"slug": "a0"}) for _ in range(40)]
+        errors = sum(1 for r in responses if "status" in r[0])
+
+        self.assertEqual(errors, self.server.faults["errors"])
+        self.assertTrue(5 < errors < 35)
+
+    def test_synthetic_data_size(self):
+        data = synthetic_data(users=3, projects=7, activities=2, times=50)
+
+        self.assertEqual([len(data[k]) for k in ("users", "projects",
+                                                 "activities", "times")],
+                         [3, 7, 2, 50])
+        self.assertTrue(all("user0" in p["users"] for p in data["projects"]))
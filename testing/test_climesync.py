@@ -1,3 +1,4 @@
+from datetime import datetime, timedelta
 from StringIO import StringIO
 import unittest
 from mock import patch, MagicMock
@@ -5,6 +6,7 @@ from mock import patch, MagicMock
 from climesync import climesync
 from climesync.climesync import command_lookup
 from climesync import commands
+from climesync import tracing
 from climesync import util
 
 
@@ -17,13 +19,27 @@ class ClimesyncTest(unittest.TestCase):
         commands.projects = None
         commands.activities = None
 
+        # main() sets these from the (mocked) config file
+        self.settings = {name: getattr(commands, name)
+                         for name in ("autoupdate_config", "max_workers",
+                                      "metadata_cache_ttl", "queue_writes",
+                                      "reuse_token", "tracer", "pool_size",
+                                      "connect_timeout", "read_timeout",
+                                      "response_cache_ttl",
+                                      "background_metadata",
+                                      "full_sync_days")}
+
+    def tearDown(self):
+        for name, value in self.settings.iteritems():
+            setattr(commands, name, value)
+
     def test_lookup_command_interactive(self):
         test_queries = [
             ("ct", 6)
         ]
 
         for query, actual in test_queries:
-            command = command_lookup[actual][2]
+            command = getattr(commands, command_lookup[actual][2])
 
             assert climesync.lookup_command(query, 0) == command
 
@@ -33,10 +49,20 @@ class ClimesyncTest(unittest.TestCase):
         ]
 
         for query, actual in test_queries:
-            command = command_lookup[actual][2]
+            command = getattr(commands, command_lookup[actual][2])
 
             assert climesync.lookup_command(query, 1) == command
 
+    @patch("climesync.climesync.commands", None)
+    def test_help_lazy_commands(self):
+        with patch("sys.stdout", new_callable=StringIO):
+            self.assertRaises(SystemExit, climesync.main, argv=["--help"])
+
+        assert climesync.commands is None
+
+        assert climesync.lookup_command("get-times", 1) == commands.get_times
+        assert climesync.commands is commands
+
     def test_lookup_command_invalid(self):
         query = "invalid"
 
@@ -115,6 +141,49 @@ class ClimesyncTest(unittest.TestCase):
         assert not util.ts_error(commands.user, commands.users,
                                  commands.projects, commands.activities)
 
+    @patch("climesync.commands.util.write_token")
+    @patch("climesync.commands.util.read_token")
+    @patch("climesync.commands.ts")
+    def test_sign_in_stored_token(self, mock_ts, mock_read_token,
+                                  mock_write_token):
+        mock_ts.test = False
+        mock_read_token.return_value = "TOKEN"
+        mock_ts.token_expiration_time.return_value = \
+            datetime.now() + timedelta(hours=1)
+
+        response = commands.sign_in(arg_user="test", arg_pass="password",
+                                    arg_ldap=True, interactive=False)
+
+        assert response == {"token": "TOKEN"}
+        assert mock_ts.token == "TOKEN"
+        assert mock_ts.user == "test"
+        mock_read_token.assert_called_with(mock_ts.baseurl, "test", "ldap")
+        mock_ts.authenticate.assert_not_called()
+        mock_write_token.assert_not_called()
+
+    @patch("climesync.commands.util.write_token")
+    @patch("climesync.commands.util.read_token")
+    @patch("climesync.commands.ts")
+    def test_sign_in_stored_token_expiring(self, mock_ts, mock_read_token,
+                                           mock_write_token):
+        mock_ts.test = False
+        mock_read_token.return_value = "OLDTOKEN"
+        mock_ts.token_expiration_time.return_value = \
+            datetime.now() + timedelta(seconds=10)
+
+        def authenticate(username, password, auth_type):
+            mock_ts.token = "NEWTOKEN"
+            return {"token": "NEWTOKEN"}
+
+        mock_ts.authenticate.side_effect = authenticate
+
+        commands.sign_in(arg_user="test", arg_pass="password", arg_ldap=True,
+                         interactive=False)
+
+        mock_ts.authenticate.assert_called_with("test", "password", "ldap")
+        mock_write_token.assert_called_with(mock_ts.baseurl, "test", "ldap",
+                                            "NEWTOKEN")
+
     @patch("climesync.commands.ts")
     def test_sign_in_config_dict(self, mock_ts):
         username = "test"
@@ -164,6 +233,31 @@ class ClimesyncTest(unittest.TestCase):
         assert not util.ts_error(commands.user, commands.users,
                                  commands.projects, commands.activities)
 
+    @patch("climesync.commands.ts")
+    def test_sign_in_noninteractive_lazy_metadata(self, mock_ts):
+        username = "test"
+        password = "test"
+        ldap = True
+
+        mock_ts.test = True
+        mock_ts.get_users.return_value = [{"username": username}]
+        mock_ts.get_projects.return_value = [{"slugs": ["gwm"]}]
+        mock_ts.get_activities.return_value = [{"slug": "code"}]
+
+        commands.sign_in(arg_user=username, arg_pass=password, arg_ldap=ldap,
+                         interactive=False)
+
+        mock_ts.get_users.assert_not_called()
+        assert commands.users is None
+
+        commands.ensure_metadata()
+        commands.ensure_metadata()
+
+        assert mock_ts.get_users.call_count == 1
+        assert commands.users == [username]
+        assert commands.projects == ["gwm"]
+        assert commands.activities == ["code"]
+
     def test_sign_in_not_connected(self):
         commands.ts = None
 
@@ -223,7 +317,7 @@ class ClimesyncTest(unittest.TestCase):
         mock_interactive_mode.assert_called_with()
 
     @patch("climesync.climesync.commands")
-    @patch("climesync.climesync.scripting_mode")
+    @patch("climesync.climesync.scripting_mode", return_value=0)
     def test_start_scripting(self, mock_scripting_mode, mock_commands):
         command = "create-time"
         argv = [command]
@@ -316,7 +410,60 @@ class ClimesyncTest(unittest.TestCase):
         assert result
         assert "Invalid choice!" in mock_stdout.getvalue()
 
-    @patch("climesync.climesync.scripting_mode")
+    @patch("climesync.climesync.commands")
+    @patch("climesync.climesync.scripting_mode", return_value=0)
+    def test_main_trace(self, mock_scripting_mode, mock_commands):
+        climesync.main(argv=["--trace-file=trace.jsonl", "get-projects"],
+                       test=True)
+
+        tracer = mock_commands.tracer
+
+        self.assertIsInstance(tracer, tracing.Tracer)
+        self.assertEqual(tracer.path, "trace.jsonl")
+        mock_scripting_mode.assert_called_with("get-projects", [])
+
+    @patch("climesync.climesync.commands")
+    @patch("climesync.climesync.scripting_mode", return_value=0)
+    @patch("climesync.climesync.util.read_config")
+    def test_main_no_trace(self, mock_read_config, mock_scripting_mode,
+                           mock_commands):
+        mock_read_config.side_effect = IOError
+
+        climesync.main(argv=["get-projects"], test=True)
+
+        self.assertIsNone(mock_commands.tracer)
+
+    @patch("climesync.climesync.commands")
+    def test_scripting_mode_reports_trace(self, mock_commands):
+        mock_command = MagicMock(return_value=[])
+
+        with patch("climesync.climesync.lookup_command",
+                   return_value=mock_command):
+            climesync.scripting_mode("get-projects", [])
+
+        mock_commands.tracer.report.assert_called_with("get-projects")
+
+    @patch("climesync.climesync.commands")
+    def test_scripting_mode_status(self, mock_commands):
+        responses = [[], {"error": "Couldn't get every time: timed out"}]
+
+        for response, status in zip(responses, (0, 1)):
+            mock_command = MagicMock(return_value=response)
+
+            with patch("climesync.climesync.lookup_command",
+                       return_value=mock_command):
+                self.assertEqual(
+                    climesync.scripting_mode("get-times", []), status)
+
+    @patch("climesync.climesync.scripting_mode", return_value=1)
+    @patch("climesync.climesync.commands")
+    def test_main_exit_status(self, mock_commands, mock_scripting_mode):
+        with self.assertRaises(SystemExit) as context:
+            climesync.main(argv=["get-times"], test=True)
+
+        self.assertEqual(context.exception.code, 1)
+
+    @patch("climesync.climesync.scripting_mode", return_value=0)
     @patch("climesync.climesync.util.read_config")
     def test_main_use_config(self, mock_read_config, mock_scripting_mode):
         baseurl = "ts_url"
@@ -339,6 +486,31 @@ class ClimesyncTest(unittest.TestCase):
 
         mock_scripting_mode.assert_called_with("command", [])
 
+    @patch("climesync.climesync.commands")
+    @patch("climesync.climesync.scripting_mode", return_value=0)
+    @patch("climesync.climesync.daemon.forward")
+    def test_main_forward_to_daemon(self, mock_forward, mock_scripting_mode,
+                                    mock_commands):
+        mock_forward.return_value = 0
+
+        climesync.main(argv=["get-times", "--csv"])
+
+        mock_forward.assert_called_with("get-times", ["--csv"],
+                                        "~/.climesync.sock")
+        mock_commands.connect.assert_not_called()
+        mock_scripting_mode.assert_not_called()
+
+    @patch("climesync.climesync.commands")
+    @patch("climesync.climesync.scripting_mode", return_value=0)
+    @patch("climesync.climesync.daemon.forward")
+    def test_main_daemon_not_running(self, mock_forward, mock_scripting_mode,
+                                     mock_commands):
+        mock_forward.return_value = None
+
+        climesync.main(argv=["get-times"])
+
+        mock_scripting_mode.assert_called_with("get-times", [])
+
     @patch("climesync.climesync.util")
     def test_connect_error(self, mock_util):
         username = "test"
@@ -1,8 +1,17 @@
 import datetime
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from mock import patch
+from StringIO import StringIO
+from mock import call, patch
+import pymesync
+from requests.exceptions import Timeout
 
 from climesync import commands
+from climesync.timetable import TimeTable
 
 import test_data
 
@@ -214,6 +223,466 @@ class CommandsTest(unittest.TestCase):
 
         mock_get_fields.assert_not_called()
 
+    @patch("climesync.commands.metadata_cache_ttl", 3600)
+    @patch("climesync.util.read_metadata_cache")
+    @patch("climesync.commands.ts")
+    def test_load_metadata_cached(self, mock_ts, mock_read_metadata_cache):
+        metadata = {
+            "user": {"username": "test", "project_slugs": ["gwm"]},
+            "users": ["test"],
+            "projects": ["gwm"],
+            "activities": ["code"]
+        }
+
+        mock_ts.test = False
+        mock_read_metadata_cache.return_value = metadata
+
+        commands.load_metadata()
+
+        mock_ts.get_users.assert_not_called()
+        assert commands.user == metadata["user"]
+        assert commands.projects == ["gwm"]
+
+    @patch("climesync.commands.metadata_cache_ttl", 3600)
+    @patch("climesync.util.write_metadata_cache")
+    @patch("climesync.util.read_metadata_cache")
+    @patch("climesync.commands.ts")
+    def test_load_metadata_refresh(self, mock_ts, mock_read_metadata_cache,
+                                   mock_write_metadata_cache):
+        mock_ts.test = False
+        mock_ts.user = "test"
+        mock_ts.get_users.return_value = [{"username": "test"}]
+        mock_ts.get_projects.return_value = [
+            {"slugs": ["gwm"], "users": {"test": {"member": True}}}
+        ]
+        mock_ts.get_activities.return_value = [{"slug": "code"}]
+
+        commands.load_metadata(refresh=True)
+
+        mock_read_metadata_cache.assert_not_called()
+        assert mock_write_metadata_cache.called
+        assert commands.user["project_slugs"] == ["gwm"]
+        assert commands.activities == ["code"]
+
+    @patch("climesync.commands.users", None)
+    @patch("climesync.commands.load_metadata")
+    @patch("climesync.commands.ts")
+    def test_start_metadata_load(self, mock_ts, mock_load_metadata):
+        loading = threading.Event()
+
+        def load_metadata(quiet=False):
+            loading.wait(5)
+            commands.users = ["test"]
+
+        mock_load_metadata.side_effect = load_metadata
+
+        commands.start_metadata_load()
+
+        # The prompt doesn't wait for the metadata to load
+        assert commands.metadata_thread.is_alive()
+        assert commands.users is None
+
+        loading.set()
+        commands.ensure_metadata()
+
+        assert commands.metadata_thread is None
+        assert commands.users == ["test"]
+        mock_load_metadata.assert_called_once_with(quiet=True)
+
+    @patch.multiple("climesync.commands", user=None, users=None,
+                    projects=None, activities=None, metadata_loaded_at=None)
+    @patch("climesync.commands.ts")
+    def test_create_project_reloads_metadata(self, mock_ts):
+        mock_ts.test = True
+        mock_ts.token = "token"
+        mock_ts.get_users.return_value = [{"username": "test"}]
+        mock_ts.get_projects.return_value = [{"slugs": ["gwm"]}]
+        mock_ts.get_activities.return_value = [{"slug": "code"}]
+        mock_ts.create_project.return_value = {"slugs": ["newp"]}
+
+        commands.ensure_metadata()
+
+        assert commands.projects == ["gwm"]
+
+        mock_ts.get_projects.return_value = [{"slugs": ["gwm"]},
+                                             {"slugs": ["newp"]}]
+
+        commands.create_project(["New project", "[newp]", "test", "1"])
+        commands.ensure_metadata()
+
+        assert commands.projects == ["gwm", "newp"]
+        assert mock_ts.get_projects.call_count == 2
+
+    @patch("climesync.commands.metadata_cache_ttl", 3600)
+    @patch("climesync.commands.users", ["test"])
+    def test_expire_metadata(self):
+        loaded_at = datetime.datetime.now() - datetime.timedelta(minutes=30)
+
+        with patch("climesync.commands.metadata_loaded_at", loaded_at):
+            commands.expire_metadata()
+
+            assert commands.users == ["test"]
+
+        loaded_at -= datetime.timedelta(hours=1)
+
+        with patch("climesync.commands.metadata_loaded_at", loaded_at):
+            commands.expire_metadata()
+
+            assert commands.users is None
+            assert commands.metadata_loaded_at is None
+
+    @patch.dict("climesync.commands.last_selected", {"projects": None})
+    @patch("climesync.commands.user", {"project_slugs": ["gwm", "p2"]})
+    @patch("climesync.commands.util")
+    @patch("climesync.commands.ts")
+    def test_select_object_prefetch(self, mock_ts, mock_util):
+        mock_ts.test = False
+        mock_ts.get_projects.side_effect = \
+            lambda query: [{"slugs": [query["slug"]]}]
+        mock_util.get_field.return_value = "gwm"
+
+        slug = commands.select_object("projects", "Slug", ["gwm", "p2"])
+        project = commands.fetch_project(slug, {})
+
+        assert project == {"slugs": ["gwm"]}
+        assert commands.last_selected["projects"] == "gwm"
+        mock_ts.get_projects.assert_called_once_with({"slug": "gwm"})
+
+        # A different choice than the prefetched one is requested instead
+        mock_util.get_field.return_value = "p2"
+
+        slug = commands.select_object("projects", "Slug", ["gwm", "p2"])
+        project = commands.fetch_project(slug, {})
+
+        assert project == {"slugs": ["p2"]}
+        assert call({"slug": "p2"}) in mock_ts.get_projects.call_args_list
+        assert commands.prefetched == {}
+
+    def test_create_times(self):
+        tempdir = tempfile.mkdtemp()
+        times_path = os.path.join(tempdir, "times.jsonl")
+        report_path = os.path.join(tempdir, "report.csv")
+
+        with open(times_path, "w") as f:
+            f.write('{"duration": "1h0m", "project": "gwm",'
+                    ' "activities": ["docs"], "date_worked": "2016-05-04",'
+                    ' "issue_uri": "https://example.com/1", "notes": "a"}\n'
+                    '{"duration": 60, "project": "unknown"}\n'
+                    '{"project": "gwm"}\n'
+                    '{"duration": 1800, "project": "timesync",'
+                    ' "activities": ["dev", "plan"],'
+                    ' "issue_uri": "https://example.com/2", "notes": "b"}\n')
+
+        commands.connect(arg_url="test", test=True)
+        commands.sign_in(arg_user="test", arg_pass="test", arg_ldap=True)
+
+        try:
+            response = commands.create_times(["--from-file", times_path,
+                                              "--report", report_path])
+
+            with open(report_path) as f:
+                report = f.read().splitlines()
+        finally:
+            shutil.rmtree(tempdir)
+
+        assert response == {"created": 2, "invalid": 2, "failed": 0}
+
+        assert report[0] == '"line","status","uuid","error"'
+        assert report[1].startswith('"2","invalid","","Unknown project')
+        assert report[2] == '"3","invalid","","Missing duration"'
+        assert report[3].startswith('"1","created","')
+        assert report[4].startswith('"4","created","')
+
+    def test_create_times_bad_report(self):
+        tempdir = tempfile.mkdtemp()
+        times_path = os.path.join(tempdir, "times.jsonl")
+        report_path = os.path.join(tempdir, "missing", "report.csv")
+        opened = []
+
+        with open(times_path, "w") as f:
+            f.write('{"duration": 60, "project": "gwm"}\n')
+
+        def track_open(*args):
+            opened.append(open(*args))
+            return opened[-1]
+
+        commands.connect(arg_url="test", test=True)
+        commands.sign_in(arg_user="test", arg_pass="test", arg_ldap=True)
+
+        try:
+            with patch("climesync.commands.open", create=True,
+                       side_effect=track_open):
+                response = commands.create_times(["--from-file", times_path,
+                                                  "--report", report_path])
+        finally:
+            shutil.rmtree(tempdir)
+
+        assert response["error"].startswith(u"Couldn't open " + report_path)
+        assert [o.name for o in opened] == [times_path]
+        assert opened[0].closed
+
+    @patch("climesync.commands.max_workers", 4)
+    @patch("climesync.commands.sys.stderr", new_callable=StringIO)
+    @patch("climesync.util.sleep")
+    @patch("climesync.commands.ts")
+    def test_delete_times(self, mock_ts, mock_sleep, mock_stderr):
+        mock_ts.get_times.return_value = [{"uuid": "a"}, {"uuid": "b"},
+                                          {"uuid": "c"}, {"uuid": "d"}]
+
+        # "b" fails transiently once, "c" is already gone, and "d" was
+        # deleted by a request that failed anyway
+        not_found = {"error": "Object not found", "status": 404}
+        responses = {"a": [{"status": 200}],
+                     "b": [{"pymesync error": Timeout()}, {"status": 200}],
+                     "c": [not_found],
+                     "d": [{"error": "Bad Gateway", "status": 502},
+                           not_found]}
+
+        mock_ts.delete_time.side_effect = lambda uuid: responses[uuid].pop(0)
+
+        response = commands.delete_times(["--project=gwm",
+                                          "--start=2016-06-01"])
+
+        mock_ts.get_times.assert_called_once_with(
+            query_parameters={"project": ["gwm"], "start": ["2016-06-01"]})
+        assert response == {"matched": 4, "deleted": 3, "failed": 1}
+        assert mock_stderr.getvalue() == "c: Object not found\n"
+        assert mock_ts.delete_time.call_count == 6
+
+    @patch("climesync.commands.ts")
+    def test_delete_times_dry_run(self, mock_ts):
+        tempdir = tempfile.mkdtemp()
+        uuids_path = os.path.join(tempdir, "uuids.txt")
+
+        with open(uuids_path, "w") as f:
+            f.write("a\nb\n")
+
+        try:
+            response = commands.delete_times(["--from-file", uuids_path,
+                                              "--dry-run"])
+        finally:
+            shutil.rmtree(tempdir)
+
+        assert response == {"matched": 2, "uuids": ["a", "b"]}
+        mock_ts.delete_time.assert_not_called()
+
+    @patch("climesync.commands.ts")
+    def test_delete_times_no_filter(self, mock_ts):
+        response = commands.delete_times([])
+
+        assert "error" in response
+        mock_ts.get_times.assert_not_called()
+
+    @patch("climesync.commands.max_workers", 1)
+    @patch("climesync.commands.ts")
+    def test_update_times(self, mock_ts):
+        sent = []
+
+        def update_time(uuid, time):
+            sent.append(dict(time))
+
+            # Pymesync converts durations in place
+            time["duration"] = "converted"
+
+            return dict(time, uuid=uuid)
+
+        mock_ts.get_times.return_value = [{"uuid": "a"}, {"uuid": "b"}]
+        mock_ts.update_time.side_effect = update_time
+
+        response = commands.update_times(["--user=userone",
+                                          "--set-duration=1h0m",
+                                          "--set-activities=dev"])
+
+        assert response == {"matched": 2, "updated": 2, "failed": 0}
+        assert sent == [{"duration": "1h0m", "activities": ["dev"]}] * 2
+
+    @patch("climesync.commands.ts")
+    def test_update_times_no_fields(self, mock_ts):
+        response = commands.update_times(["--user=userone"])
+
+        assert "error" in response
+        mock_ts.update_time.assert_not_called()
+
+    @patch("climesync.commands.ts")
+    def test_create_time_queued(self, mock_ts):
+        tempdir = tempfile.mkdtemp()
+
+        mock_ts.baseurl = "ts_url"
+        mock_ts.user = "userone"
+
+        try:
+            with patch("climesync.commands.outbox_path", tempdir):
+                response = commands.create_time(["1h0m", "gwm", "dev",
+                                                 "--queue"])
+
+                entries = commands.outbox.entries(path=tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+
+        mock_ts.create_time.assert_not_called()
+        assert response["key"] == entries[0]["key"]
+        assert entries[0]["time"]["project"] == "gwm"
+        assert "queue" not in entries[0]["time"]
+
+    @patch("climesync.commands.ts")
+    def test_create_time_unreachable(self, mock_ts):
+        tempdir = tempfile.mkdtemp()
+
+        mock_ts.baseurl = "ts_url"
+        mock_ts.user = "userone"
+        mock_ts.create_time.return_value = {"pymesync error":
+                                            Timeout("timed out")}
+
+        try:
+            with patch("climesync.commands.outbox_path", tempdir):
+                response = commands.create_time(["1h0m", "gwm", "dev"])
+
+                entries = commands.outbox.entries(path=tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+
+        assert "timed out" in response["note"]
+        assert entries[0]["attempts"] == 1
+        assert entries[0]["uncertain"]
+        assert entries[0]["time"]["duration"] == "1h0m"
+
+    def test_create_time_invalid(self):
+        tempdir = tempfile.mkdtemp()
+
+        # Pymesync rejects the duration before sending anything, and the
+        # server is unreachable anyway
+        ts = pymesync.TimeSync(baseurl="http://127.0.0.1:1/v0")
+        ts.token = "token"
+        ts.user = "userone"
+
+        try:
+            with patch("climesync.commands.ts", ts), \
+                    patch("climesync.commands.outbox_path", tempdir):
+                response = commands.create_time(["25h0m", "gwm", "dev"])
+
+                entries = commands.outbox.entries(path=tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+
+        assert response == [{"pymesync error":
+                             "time object: invalid duration string"}]
+        assert entries == []
+
+    @patch("climesync.util.clear_session")
+    @patch("climesync.util.read_session")
+    @patch("climesync.util.session_exists")
+    @patch("climesync.commands.ts")
+    def test_clock_out_invalid(self, mock_ts, mock_session_exists,
+                               mock_read_session, mock_clear_session):
+        tempdir = tempfile.mkdtemp()
+
+        mock_ts.baseurl = "ts_url"
+        mock_ts.user = "userone"
+        mock_ts.get_projects.return_value = [{"slugs": ["px"]}]
+        mock_ts.create_time.return_value = [
+            {"pymesync error": "time object: invalid duration string"}]
+        mock_session_exists.return_value = True
+        mock_read_session.return_value = {"start_date": "2015-03-14",
+                                          "start_time": "09:26",
+                                          "project": "px",
+                                          "user": "userone"}
+
+        try:
+            with patch("climesync.commands.outbox_path", tempdir):
+                response = commands.clock_out(["dev", "--duration=25h0m"])
+
+                entries = commands.outbox.entries(path=tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+
+        assert "pymesync error" in response[0]
+        assert entries == []
+        mock_clear_session.assert_not_called()
+
+    @patch("climesync.commands.max_workers", 1)
+    @patch("climesync.commands.ts")
+    def test_flush_outbox(self, mock_ts):
+        tempdir = tempfile.mkdtemp()
+
+        mock_ts.baseurl = "ts_url"
+        mock_ts.user = "userone"
+
+        time = {"duration": 3600, "project": "gwm", "activities": ["dev"],
+                "date_worked": "2016-05-04", "user": "userone"}
+
+        # Reached the server before the connection dropped
+        sent = commands.outbox.add(dict(time), "ts_url", "userone", tempdir)
+        commands.outbox.record_failure(sent, "timed out", True, now=0)
+        commands.outbox.save(sent, tempdir)
+
+        new = commands.outbox.add(dict(time, duration=60), "ts_url",
+                                  "userone", tempdir)
+        rejected = commands.outbox.add(dict(time, project="none"), "ts_url",
+                                       "userone", tempdir)
+        invalid = commands.outbox.add(dict(time, duration="25h0m"), "ts_url",
+                                      "userone", tempdir)
+
+        mock_ts.get_times.return_value = [dict(time, uuid="abc",
+                                               project=["gwm"])]
+
+        def create_time(time):
+            if time["project"] == "none":
+                return {"error": "Bad project", "status": 400}
+            elif time["duration"] == "25h0m":
+                return [{"pymesync error":
+                         "time object: invalid duration string"}]
+
+            return dict(time, uuid="def")
+
+        mock_ts.create_time.side_effect = create_time
+
+        try:
+            with patch("climesync.commands.outbox_path", tempdir):
+                response = commands.flush_outbox()
+
+                entries = commands.outbox.entries(path=tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+
+        # Neither rejected time is retried again
+        assert response == {"submitted": 2, "failed": 2}
+        assert mock_ts.create_time.call_count == 3
+        assert sorted(e["key"] for e in entries) == \
+            sorted([rejected["key"], invalid["key"]])
+        assert all(e["failed"] for e in entries)
+        assert new["key"] != rejected["key"]
+
+    @patch("climesync.commands.ts")
+    def test_flush_outbox_lookup_error(self, mock_ts):
+        tempdir = tempfile.mkdtemp()
+
+        mock_ts.baseurl = "ts_url"
+        mock_ts.user = "userone"
+        mock_ts.get_times.return_value = [{"error": "Service unavailable",
+                                           "status": 503}]
+
+        time = {"duration": 3600, "project": "gwm", "activities": ["dev"],
+                "date_worked": "2016-05-04", "user": "userone"}
+
+        sent = commands.outbox.add(time, "ts_url", "userone", tempdir)
+        commands.outbox.record_failure(sent, "timed out", True, now=0)
+        commands.outbox.save(sent, tempdir)
+
+        try:
+            with patch("climesync.commands.outbox_path", tempdir):
+                response = commands.flush_outbox()
+
+                entries = commands.outbox.entries(path=tempdir)
+        finally:
+            shutil.rmtree(tempdir)
+
+        # Sending the time again without knowing might create it twice
+        assert response == {"submitted": 0, "failed": 1}
+        assert not mock_ts.create_time.called
+        assert entries[0]["uncertain"] and not entries[0]["failed"]
+        assert entries[0]["attempts"] == 2
+        assert entries[0]["last_error"] == "Service unavailable"
+
     @test_command(data=test_data.create_time_data)
     def test_create_time(self, expected, result):
         assert result == expected
@@ -234,6 +703,178 @@ class CommandsTest(unittest.TestCase):
     def test_get_times_uuid(self, expected, result):
         assert result == expected
 
+    @patch("climesync.util.output_csv")
+    @patch("climesync.commands.ts")
+    def test_get_times_window_csv(self, mock_ts, mock_output_csv):
+        mock_ts.get_times.side_effect = lambda query_parameters: [
+            {"date_worked": query_parameters["start"][0]}
+        ]
+
+        argv = ["--start=2016-01-01", "--end=2016-01-10", "--window=4",
+                "--csv"]
+
+        response = commands.get_times(argv)
+
+        assert response == []
+        assert mock_ts.get_times.call_count == 0
+
+        # The times are only requested as the CSV writer consumes them
+        times = mock_output_csv.call_args[0][0]
+
+        assert [t["date_worked"] for t in times] == ["2016-01-01",
+                                                     "2016-01-05",
+                                                     "2016-01-09"]
+        assert mock_ts.get_times.call_count == 3
+
+    @patch("climesync.commands.ts")
+    def test_sum_times(self, mock_ts):
+        mock_ts.get_times.return_value = [
+            {"project": ["px"], "user": "userone", "activities": ["code"],
+             "duration": 3600, "date_worked": "2016-05-02"},
+            {"project": ["px"], "user": "usertwo", "activities": ["code"],
+             "duration": 1800, "date_worked": "2016-06-02"},
+        ]
+
+        response = commands.sum_times(["--group-by=user,month",
+                                       "--project=px"])
+
+        mock_ts.get_times.assert_called_with(query_parameters={
+            "project": ["px"]})
+        assert [(r["user"], r["month"], r["total"]) for r in response] == [
+            ("userone", "2016-05", "1h0m"),
+            ("usertwo", "2016-06", "0h30m"),
+            ("all", "all", "1h30m")
+        ]
+
+    @patch("climesync.commands.ts")
+    def test_sum_times_invalid_field(self, mock_ts):
+        response = commands.sum_times(["--group-by=user year"])
+
+        assert response == {"error": "Can't group times by year"}
+        assert not mock_ts.get_times.called
+
+    @patch("climesync.commands.max_workers", 3)
+    @patch("climesync.util.print_json")
+    @patch("climesync.commands.ts")
+    def test_get_times_window_concurrent(self, mock_ts, mock_print_json):
+        def get_times(query_parameters):
+            # The earliest window is the slowest to arrive
+            if query_parameters["start"][0] == "2016-01-01":
+                time.sleep(0.05)
+
+            return [{"date_worked": query_parameters["start"][0]}]
+
+        mock_ts.get_times.side_effect = get_times
+
+        argv = ["--start=2016-01-01", "--end=2016-01-10", "--window=4"]
+
+        response = commands.get_times(argv)
+
+        assert response == []
+
+        times = mock_print_json.call_args[0][0]
+
+        assert [t["date_worked"] for t in times] == ["2016-01-01",
+                                                     "2016-01-05",
+                                                     "2016-01-09"]
+
+    @patch("climesync.util.output_csv")
+    @patch("climesync.commands.ts")
+    def test_get_times_window_partial(self, mock_ts, mock_output_csv):
+        def get_times(query_parameters):
+            if query_parameters["start"][0] == "2016-01-05":
+                return [{"error": "Internal server error", "status": 500,
+                         "text": "Database unavailable"}]
+
+            return [{"date_worked": query_parameters["start"][0]}]
+
+        mock_ts.get_times.side_effect = get_times
+        mock_output_csv.side_effect = lambda times, *args: list(times)
+
+        argv = ["--start=2016-01-01", "--end=2016-01-10", "--window=4",
+                "--csv"]
+
+        response = commands.get_times(argv)
+
+        assert response == {"error": "Couldn't get every time: "
+                                     "Database unavailable"}
+
+        # Only the window before the one that failed was written
+        assert mock_output_csv.call_count == 1
+
+    @patch("climesync.commands.ts")
+    def test_sync_times(self, mock_ts):
+        tempdir = tempfile.mkdtemp()
+
+        mock_ts.baseurl = "ts_url"
+        mock_ts.user = "userone"
+        mock_ts.get_times.return_value = [
+            {"uuid": "a", "user": "userone", "project": ["gwm"],
+             "activities": ["dev"], "date_worked": "2016-05-01",
+             "updated_at": None, "deleted_at": None, "revision": 1},
+            {"uuid": "b", "user": "userone", "project": ["pymesync"],
+             "activities": ["docs"], "date_worked": "2016-05-02",
+             "updated_at": None, "deleted_at": "2016-05-03", "revision": 1}
+        ]
+
+        try:
+            with patch("climesync.commands.time_store_path",
+                       os.path.join(tempdir, "times.db")):
+                response = commands.sync_times([])
+
+                mock_ts.get_times.assert_called_with(
+                    query_parameters={"include_deleted": True})
+                assert response == {"received": 2, "added": 2, "updated": 0}
+
+                times = commands.get_times(["--project=gwm", "--local"])
+
+            # The second sync only requests recently worked times again
+            query = mock_ts.get_times.call_args[1]["query_parameters"]
+            start = datetime.date.today() - datetime.timedelta(days=31)
+
+            assert query == {"include_deleted": True,
+                             "start": [start.isoformat()]}
+            assert [t["uuid"] for t in times[:-1]] == ["a"]
+
+            # Once the last full sync is too old, every time is requested
+            with patch("climesync.commands.time_store_path",
+                       os.path.join(tempdir, "times.db")), \
+                    patch("climesync.commands.full_sync_days", 0):
+                commands.sync_times([])
+
+            mock_ts.get_times.assert_called_with(
+                query_parameters={"include_deleted": True})
+        finally:
+            shutil.rmtree(tempdir)
+
+    @patch("climesync.commands.ts")
+    def test_get_times_window_no_end(self, mock_ts):
+        response = commands.get_times(["--start=2016-01-01", "--window=4"])
+
+        assert "error" in response
+        mock_ts.get_times.assert_not_called()
+
+    @patch("climesync.commands.time_table_min_rows", 2)
+    @patch("climesync.commands.util")
+    @patch("climesync.commands.ts")
+    def test_get_times_interactive_table(self, mock_ts, mock_util):
+        times = [{"uuid": "a", "duration": 3600}, {"uuid": "b"}]
+
+        mock_ts.get_times.return_value = times
+        mock_util.check_token_expiration.return_value = False
+        mock_util.get_fields.return_value = {}
+        mock_util.ask_csv.return_value = None
+        mock_util.get_field.return_value = False
+
+        response = commands.get_times()
+
+        assert isinstance(response, TimeTable)
+        assert [row.to_dict() for row in response] == times
+
+        mock_ts.get_times.return_value = times[:1]
+
+        assert commands.get_times() == times[:1]
+
     @test_command(data=test_data.delete_time_no_data)
     def test_delete_time_no(self, expected, result):
         assert result == expected
@@ -250,6 +891,48 @@ class CommandsTest(unittest.TestCase):
     def test_update_project(self, expected, result):
         assert result == expected
 
+    @patch("climesync.commands.users", ["userone", "usertwo"])
+    @patch("climesync.commands.util")
+    @patch("climesync.commands.ts")
+    def test_update_project_users_fetches_once(self, mock_ts, mock_util):
+        mock_ts.get_projects.return_value = [
+            {"slugs": ["px"], "users": {"userone": {"member": True}}}
+        ]
+        mock_util.check_token_expiration.return_value = False
+        mock_util.get_field.return_value = "px"
+        mock_util.get_fields.return_value = {"users": {"usertwo": {
+            "member": True, "spectator": False, "manager": True}}}
+
+        commands.update_project_users()
+
+        mock_ts.get_projects.assert_called_once_with({"slug": "px"})
+        mock_ts.update_project.assert_called_with(project={"users": {
+            "userone": {"member": True},
+            "usertwo": {"member": True, "spectator": False, "manager": True}
+        }}, slug="px")
+
+        # The cached metadata is loaded again after a successful change
+        assert commands.users is None
+
+    @patch("climesync.commands.users", ["userone", "usertwo"])
+    @patch("climesync.commands.util")
+    @patch("climesync.commands.ts")
+    def test_remove_project_users_fetches_once(self, mock_ts, mock_util):
+        mock_ts.get_projects.return_value = [
+            {"slugs": ["px"], "users": {"userone": {"member": True},
+                                        "usertwo": {"member": True}}}
+        ]
+        mock_util.check_token_expiration.return_value = False
+        mock_util.get_field.return_value = "px"
+        mock_util.get_fields.return_value = {"users": ["usertwo"]}
+
+        commands.remove_project_users()
+
+        mock_ts.get_projects.assert_called_once_with({"slug": "px"})
+        mock_ts.update_project.assert_called_with(
+            project={"users": {"userone": {"member": True}}}, slug="px")
+        assert commands.users is None
+
     @test_command(data=test_data.get_projects_no_slug_data)
     def test_get_projects_no_slug(self, expected, result):
         assert result == expected
@@ -258,6 +941,28 @@ class CommandsTest(unittest.TestCase):
     def test_get_projects_slug(self, expected, result):
         assert result == expected
 
+    @patch("climesync.commands.summary_chunk_size", 2)
+    @patch("climesync.commands.ts")
+    def test_get_projects_summary_chunks(self, mock_ts):
+        mock_ts.get_projects.return_value = [
+            {"name": "Project {}".format(slug), "slugs": [slug]}
+            for slug in ("pa", "pb", "pc")
+        ]
+        mock_ts.get_times.return_value = [
+            {"project": ["pa"], "duration": 60, "date_worked": "2016-05-02"}
+        ]
+
+        response = commands.get_projects([])
+
+        assert mock_ts.get_times.call_count == 2
+        mock_ts.get_times.assert_any_call(query_parameters={"project":
+                                                            ["pa", "pb"]})
+        mock_ts.get_times.assert_any_call(query_parameters={"project":
+                                                            ["pc"]})
+
+        assert response[0]["time_total"] == "0h1m"
+        assert "time_total" not in response[1]
+
     @test_command(data=test_data.delete_project_no_data)
     def test_delete_project_no(self, expected, result):
         assert result == expected
@@ -0,0 +1,108 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from StringIO import StringIO
+from mock import patch
+
+from climesync import daemon
+
+
+class DaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tempdir, "climesync.sock")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def start_daemon(self, run):
+        thread = threading.Thread(target=daemon.serve,
+                                  args=(run, self.socket_path))
+        thread.daemon = True
+        thread.start()
+
+        for _ in range(100):
+            if daemon.send({"ping": True}, self.socket_path) is not None:
+                break
+
+            time.sleep(0.01)
+
+        return thread
+
+    def test_forward_not_running(self):
+        assert daemon.forward("get-times", [], self.socket_path) is None
+
+    def test_forward_stdin(self):
+        assert not daemon.forwardable(["--from-file=-"])
+        assert not daemon.forwardable(["--from-file", "-"])
+        assert daemon.forwardable(["--from-file=times.csv"])
+
+    @patch("climesync.daemon.sys.stderr", new_callable=StringIO)
+    @patch("climesync.daemon.sys.stdout", new_callable=StringIO)
+    def test_forward(self, mock_stdout, mock_stderr):
+        calls = []
+
+        def run(command, argv):
+            calls.append((command, argv, os.getcwd()))
+            print u"user: \xe9"
+            sys.stderr.write("progress\n")
+
+        thread = self.start_daemon(run)
+
+        try:
+            status = daemon.forward("get-users", ["--username=test"],
+                                    self.socket_path)
+        finally:
+            assert daemon.stop(self.socket_path)
+            thread.join(1)
+
+        assert status == 0
+        assert calls == [("get-users", ["--username=test"], os.getcwd())]
+        assert mock_stdout.getvalue() == u"user: \xe9\n".encode("utf-8")
+        assert mock_stderr.getvalue() == "progress\n"
+        assert not os.path.exists(self.socket_path)
+
+    @patch("climesync.daemon.sys.stderr", new_callable=StringIO)
+    @patch("climesync.daemon.sys.stdout", new_callable=StringIO)
+    def test_forward_usage_error(self, mock_stdout, mock_stderr):
+        def run(command, argv):
+            raise SystemExit("Usage: get-users [-h]")
+
+        thread = self.start_daemon(run)
+
+        try:
+            status = daemon.forward("get-users", ["--bad"], self.socket_path)
+        finally:
+            daemon.stop(self.socket_path)
+            thread.join(1)
+
+        assert status == 1
+        assert mock_stderr.getvalue() == "Usage: get-users [-h]\n"
+
+    @patch("climesync.daemon.sys.stdout", new_callable=StringIO)
+    def test_forward_status(self, mock_stdout):
+        thread = self.start_daemon(lambda command, argv: 1)
+
+        try:
+            status = daemon.forward("get-times", [], self.socket_path)
+        finally:
+            daemon.stop(self.socket_path)
+            thread.join(1)
+
+        assert status == 1
+
+    def test_serve_stale_socket(self):
+        open(self.socket_path, "w").close()
+
+        thread = self.start_daemon(lambda command, argv: None)
+
+        try:
+            assert daemon.send({"ping": True}, self.socket_path) == {}
+        finally:
+            daemon.stop(self.socket_path)
+            thread.join(1)
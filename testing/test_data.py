@@ -260,7 +260,7 @@ get_projects_no_slug_data = TestData(
         expected_response=[{
                 "time_total": "0h0m",
                 "first_time": "2014-04-17",
-                "num_times": 3,
+                "num_times": 2,
                 "latest_time": "2014-04-17",
                 "created_at": "2014-07-17",
                 "updated_at": "2014-07-20",
@@ -286,7 +286,7 @@ get_projects_no_slug_data = TestData(
             {
                 "time_total": "0h0m",
                 "first_time": "2014-04-17",
-                "num_times": 3,
+                "num_times": 1,
                 "latest_time": "2014-04-17",
                 "created_at": "2014-07-17",
                 "updated_at": "2014-07-20",
@@ -315,10 +315,6 @@ get_projects_no_slug_data = TestData(
                 }
             },
             {
-                "time_total": "0h0m",
-                "first_time": "2014-04-17",
-                "num_times": 3,
-                "latest_time": "2014-04-17",
                 "created_at": "2014-07-17",
                 "updated_at": "2014-07-20",
                 "deleted_at": None,
@@ -369,7 +365,7 @@ get_projects_slug_data = TestData(
         expected_response=[{
             "time_total": "0h0m",
             "first_time": "2014-04-17",
-            "num_times": 3,
+            "num_times": 2,
             "latest_time": "2014-04-17",
             "created_at": "2014-07-17",
             "updated_at": "2014-07-20",
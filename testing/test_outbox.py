@@ -0,0 +1,73 @@
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+from climesync import outbox
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "outbox")
+
+        self.time = {"duration": "1h30m", "project": "gwm",
+                     "activities": ["dev", "docs"],
+                     "date_worked": "2016-05-04", "user": "userone"}
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_add(self):
+        entry = outbox.add(self.time, "ts_url", "userone", path=self.path)
+        other = outbox.add(self.time, "other_url", "userone", path=self.path)
+
+        assert stat.S_IMODE(os.stat(self.path).st_mode) == stat.S_IRWXU
+        assert stat.S_IMODE(os.stat(outbox.entry_path(entry["key"],
+                                                      self.path)).st_mode) == \
+            stat.S_IRUSR | stat.S_IWUSR
+
+        assert outbox.entries(path=self.path) == [entry, other]
+        assert outbox.entries("ts_url", "userone", path=self.path) == [entry]
+        assert outbox.entries("ts_url", "usertwo", path=self.path) == []
+
+        assert outbox.remove(entry["key"], path=self.path)
+        assert not outbox.remove(entry["key"], path=self.path)
+        assert outbox.entries("ts_url", path=self.path) == []
+
+    def test_entries_no_outbox(self):
+        assert outbox.entries(path=self.path) == []
+
+    def test_record_failure(self):
+        entry = outbox.add(self.time, "ts_url", "userone", path=self.path)
+
+        assert outbox.is_due(entry, now=1000)
+
+        outbox.record_failure(entry, "timeout", True, now=1000)
+        outbox.record_failure(entry, "timeout", True, now=1000)
+
+        assert entry["uncertain"]
+        assert entry["next_attempt_at"] == 1000 + outbox.retry_delay * 2
+        assert not outbox.is_due(entry, now=1000)
+        assert outbox.is_due(entry, now=1000 + outbox.retry_delay * 2)
+
+        outbox.record_failure(entry, "Bad project", False, now=2000)
+
+        assert entry["failed"]
+        assert entry["attempts"] == 3
+        assert entry["last_error"] == "Bad project"
+        assert not outbox.is_due(entry, now=10 ** 10)
+
+    def test_matches(self):
+        entry = outbox.add(self.time, "ts_url", "userone", path=self.path)
+
+        time = {"uuid": "abc", "duration": 5400, "project": ["gwm", "ganeti"],
+                "activities": ["docs", "dev"], "date_worked": "2016-05-04",
+                "user": "userone", "notes": None, "issue_uri": None}
+
+        assert outbox.matches(entry, time)
+        assert not outbox.matches(entry, dict(time, duration=3600))
+        assert not outbox.matches(entry, dict(time, notes="Other notes"))
+        assert not outbox.matches(entry, dict(time, user="usertwo"))
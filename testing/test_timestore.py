@@ -0,0 +1,124 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import stat
+import tempfile
+import unittest
+
+from climesync import timestore
+
+
+def make_time(uuid, date_worked, revision=1, **fields):
+    time = {"uuid": uuid, "user": "userone", "project": ["gwm"],
+            "activities": ["dev"], "duration": 3600,
+            "date_worked": date_worked, "created_at": date_worked,
+            "updated_at": None, "deleted_at": None, "revision": revision}
+    time.update(fields)
+
+    return time
+
+
+class TimeStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "store", "times.db")
+        self.conn = timestore.open_store(self.path)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_open_store(self):
+        assert stat.S_IMODE(os.stat(self.path).st_mode) == \
+            stat.S_IRUSR | stat.S_IWUSR
+        assert stat.S_IMODE(os.stat(os.path.dirname(self.path)).st_mode) == \
+            stat.S_IRWXU
+
+    def test_store_times(self):
+        times = [make_time("a", "2016-05-01"), make_time("b", "2016-05-02")]
+
+        counts = timestore.store_times(self.conn, "src", times)
+
+        assert counts == {"added": 2, "updated": 0}
+
+        # Only times that changed since they were stored are replaced
+        times = [make_time("a", "2016-05-01"),
+                 make_time("b", "2016-05-03", revision=2,
+                           updated_at="2016-05-04")]
+
+        counts = timestore.store_times(self.conn, "src", times)
+
+        assert counts == {"added": 0, "updated": 1}
+        assert timestore.query_times(self.conn, "src", {}) == times
+
+    def test_query_times(self):
+        timestore.store_times(self.conn, "src", [
+            make_time("a", "2016-05-01"),
+            make_time("b", "2016-05-02", user="usertwo"),
+            make_time("c", "2016-05-03", project=["pymesync"]),
+            make_time("d", "2016-05-04", activities=["docs", "qa"]),
+            make_time("e", "2016-05-05", deleted_at="2016-05-06"),
+        ])
+        timestore.store_times(self.conn, "other", [
+            make_time("f", "2016-05-01"),
+        ])
+
+        def uuids(query):
+            return [t["uuid"] for t in timestore.query_times(self.conn, "src",
+                                                             query)]
+
+        assert uuids({}) == ["a", "b", "c", "d"]
+        assert uuids({"include_deleted": True}) == ["a", "b", "c", "d", "e"]
+        assert uuids({"user": ["usertwo"]}) == ["b"]
+        assert uuids({"project": ["gwm"]}) == ["a", "b", "d"]
+        assert uuids({"activity": ["qa", "code"]}) == ["d"]
+        assert uuids({"start": ["2016-05-02"], "end": ["2016-05-03"]}) == \
+            ["b", "c"]
+        assert uuids({"uuid": "c"}) == ["c"]
+
+    def test_sync_start(self):
+        assert timestore.sync_start(self.conn, "src", 31) is None
+
+        timestore.finish_sync(self.conn, "src", "2016-03-01")
+
+        assert timestore.sync_start(self.conn, "src", 31) == "2016-01-30"
+        assert timestore.sync_start(self.conn, "other", 31) is None
+
+    def test_sync_start_full_sync(self):
+        today = datetime.date(2016, 3, 10)
+
+        # Only a partial sync was ever made
+        timestore.finish_sync(self.conn, "src", "2016-03-01")
+
+        assert timestore.sync_start(self.conn, "src", 31, 7, today) is None
+
+        timestore.finish_sync(self.conn, "src", "2016-03-05", full=True)
+        timestore.finish_sync(self.conn, "src", "2016-03-09")
+
+        assert timestore.full_synced_on(self.conn, "src") == "2016-03-05"
+        assert timestore.sync_start(self.conn, "src", 31, 7, today) == \
+            "2016-02-07"
+
+        today = datetime.date(2016, 3, 12)
+
+        assert timestore.sync_start(self.conn, "src", 31, 7, today) is None
+
+    def test_open_old_store(self):
+        path = os.path.join(self.tempdir, "old.db")
+
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE syncs (source TEXT PRIMARY KEY, "
+                     "synced_through TEXT)")
+        conn.execute("INSERT INTO syncs VALUES ('src', '2016-03-01')")
+        conn.commit()
+        conn.close()
+
+        conn = timestore.open_store(path)
+
+        try:
+            assert timestore.synced_through(conn, "src") == "2016-03-01"
+            assert timestore.full_synced_on(conn, "src") is None
+        finally:
+            conn.close()
@@ -0,0 +1,83 @@
+import unittest
+
+from climesync.timetable import TimeRow, TimeTable
+
+
+def make_time(uuid, user="userone", project=None, duration=3600,
+              date_worked="2016-05-02", **fields):
+    time = {"uuid": uuid, "user": user, "project": project or ["gwm"],
+            "activities": ["code"], "duration": duration,
+            "date_worked": date_worked, "issue_uri": None, "notes": None,
+            "revision": 1, "created_at": "2016-05-02", "updated_at": None,
+            "deleted_at": None}
+    time.update(fields)
+
+    return time
+
+
+class TimeTableTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        times = [make_time("a"),
+                 make_time("b", user="usertwo", project=["gwm", "ganeti"],
+                           date_worked="2016-02-29", notes=u"N\xf6tes")]
+
+        table = TimeTable(times)
+
+        self.assertEqual(len(table), 2)
+        self.assertEqual([row.to_dict() for row in table], times)
+        self.assertEqual(table[1]["project"], ["gwm", "ganeti"])
+        self.assertEqual(table[-1]["date_worked"], "2016-02-29")
+        self.assertRaises(IndexError, table.__getitem__, 2)
+
+    def test_shares_strings(self):
+        table = TimeTable([make_time("a", user="user" + "one"),
+                           make_time("b", user="".join(["user", "one"]))])
+
+        self.assertIs(table[0]["user"], table[1]["user"])
+        self.assertIs(table[0]["project"][0], table[1]["project"][0])
+
+    def test_irregular_times(self):
+        times = [make_time("a", duration=None),
+                 make_time("b", parents=["a"]),
+                 make_time("c", date_worked="not a date"),
+                 make_time("d", project="gwm")]
+        del times[0]["notes"]
+
+        table = TimeTable(times)
+
+        self.assertEqual([row.to_dict() for row in table], times)
+        self.assertNotIn("notes", table[0])
+        self.assertIsNone(table[0].get("notes"))
+        self.assertRaises(KeyError, table[0].__getitem__, "notes")
+        self.assertEqual(table[1]["parents"], ["a"])
+
+    def test_extend_generator(self):
+        def times():
+            for i in range(2500):
+                yield make_time(str(i), duration=i)
+
+        table = TimeTable(times())
+
+        self.assertEqual(len(table), 2500)
+        self.assertEqual(sum(row["duration"] for row in table),
+                         sum(range(2500)))
+
+    def test_detail(self):
+        table = TimeTable([make_time("a")])
+
+        self.assertNotIn("detail", table)
+
+        table.append("detail")
+
+        self.assertIn("detail", table)
+        self.assertEqual(len(table), 1)
+
+    def test_row(self):
+        row = TimeTable([make_time("a")])[0]
+
+        self.assertIsInstance(row, TimeRow)
+        self.assertEqual(row, make_time("a"))
+        self.assertEqual(row.keys()[0], "uuid")
+        self.assertEqual(dict(row.iteritems()), make_time("a"))
+        self.assertRaises(AttributeError, setattr, row, "extra", 1)
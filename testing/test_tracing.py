@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+import pymesync
+
+from climesync import tracing
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.out = StringIO()
+        self.tracer = tracing.Tracer(out=self.out)
+
+        ts = pymesync.TimeSync(baseurl="ts_url", test=True)
+        self.ts = self.tracer.wrap(ts)
+
+        self.ts.authenticate(username="test", password="secret",
+                             auth_type="password")
+
+    def test_traces_requests(self):
+        projects = self.ts.get_projects({"include_revisions": True})
+
+        calls = self.tracer.calls
+
+        self.assertEqual([c["method"] for c in calls],
+                         ["authenticate", "get_projects"])
+        self.assertEqual(calls[1]["endpoint"], "GET /projects")
+        self.assertEqual(calls[1]["params"],
+                         {"args": [{"include_revisions": True}]})
+        self.assertEqual(calls[1]["results"], len(projects))
+        self.assertEqual(calls[1]["bytes"],
+                         len(json.dumps(projects, default=str)))
+        self.assertFalse(calls[1]["error"])
+
+    def test_hides_password(self):
+        self.assertEqual(self.tracer.calls[0]["params"]["password"], "...")
+
+    def test_hides_user_password(self):
+        self.ts.create_user(user={"username": "new", "password": "pw1"})
+        self.ts.update_user(user={"password": "pw2"}, username="new")
+        self.ts.create_user({"username": "other", "password": "pw3"})
+
+        params = [c["params"] for c in self.tracer.calls[1:]]
+
+        self.assertEqual(params[0]["user"],
+                         {"username": "new", "password": "..."})
+        self.assertEqual(params[1], {"user": {"password": "..."},
+                                     "username": "new"})
+        self.assertEqual(params[2]["args"][0]["password"], "...")
+        self.assertNotIn("pw", json.dumps(params))
+
+    def test_passes_attributes_through(self):
+        self.ts.token = "new_token"
+
+        self.assertEqual(self.ts._ts.token, "new_token")
+        self.assertEqual(self.ts.baseurl, "ts_url")
+
+        # Methods that don't send requests aren't traced
+        self.ts.token_expiration_time()
+        self.assertEqual(len(self.tracer.calls), 1)
+
+    def test_records_errors(self):
+        self.ts.project_users()
+
+        call = self.tracer.calls[1]
+
+        self.assertEqual(call["endpoint"], "GET /projects/:slug")
+        self.assertTrue(call["error"])
+        self.assertEqual(call["results"], 0)
+
+    def test_counts_project_users(self):
+        users = self.ts.project_users(project="gwm")
+
+        self.assertEqual(self.tracer.calls[1]["results"], len(users))
+        self.assertGreater(len(users), 1)
+
+    def test_summary(self):
+        self.ts.get_users()
+        self.ts.get_users({"username": "userone"})
+
+        summary = {t["method"]: t for t in self.tracer.summary()}
+
+        self.assertEqual(summary["get_users"]["calls"], 2)
+        self.assertEqual(summary["authenticate"]["calls"], 1)
+
+    def test_report(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+
+        self.tracer.path = os.path.join(tempdir, "trace.jsonl")
+
+        self.ts.get_activities()
+        self.tracer.report("get-activities")
+        self.ts.get_users()
+        self.tracer.report("get-users")
+
+        with open(self.tracer.path) as f:
+            traces = [json.loads(line) for line in f]
+
+        self.assertEqual([t["command"] for t in traces],
+                         ["get-activities", "get-users"])
+        self.assertEqual(len(traces[0]["calls"]), 2)
+        self.assertEqual(len(traces[1]["calls"]), 1)
+        self.assertIn("GET /activities", self.out.getvalue())
+        self.assertEqual(self.tracer.calls, [])
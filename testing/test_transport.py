@@ -0,0 +1,198 @@
+import unittest
+
+import pymesync
+import requests
+from mock import patch
+
+from benchmarks.stub_server import StubTimeSync, synthetic_data
+from climesync import transport, util
+
+
+class TransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubTimeSync(synthetic_data(times=20)).start()
+
+    def tearDown(self):
+        transport.uninstall()
+        self.server.stop()
+
+    def sign_in(self):
+        ts = pymesync.TimeSync(baseurl=self.server.url)
+        ts.authenticate(username="user0", password="password",
+                        auth_type="password")
+
+        return ts
+
+    def test_reuses_connection(self):
+        transport.install()
+
+        ts = self.sign_in()
+        ts.get_projects()
+        ts.get_activities()
+        self.sign_in().get_users()
+
+        self.assertEqual(self.server.request_count(), 5)
+        self.assertEqual(self.server.connection_count(), 1)
+
+    def test_without_transport(self):
+        ts = self.sign_in()
+        ts.get_projects()
+
+        self.assertEqual(self.server.connection_count(), 2)
+
+    def test_worker_threads(self):
+        transport.install(pool_size=4)
+
+        ts = self.sign_in()
+        slugs = ["p{}".format(i) for i in range(10)] * 4
+
+        projects = list(util.map_concurrently(
+            lambda slug: ts.get_projects({"slug": slug}), slugs, 4))
+
+        self.assertEqual([p[0]["slugs"] for p in projects],
+                         [[slug] for slug in slugs])
+        self.assertLessEqual(self.server.connection_count(), 4)
+
+    def test_install(self):
+        first = transport.install()
+
+        self.assertIs(pymesync.pymesync.requests, first)
+        self.assertIs(transport.install(), first)
+
+        second = transport.install(pool_size=2)
+
+        self.assertIsNot(second, first)
+        self.assertIs(pymesync.pymesync.requests, second)
+
+        transport.uninstall()
+
+        self.assertIs(pymesync.pymesync.requests, requests)
+
+    def test_timeouts(self):
+        pooled = transport.install(connect_timeout=5, read_timeout=0)
+
+        with patch.object(pooled.session, "request") as mock_request:
+            pooled.get("http://example.com")
+
+        mock_request.assert_called_with("GET", "http://example.com",
+                                        timeout=(5, None))
+
+    def test_read_timeout(self):
+        self.server.latency = 0.5
+
+        transport.install(read_timeout=0.1)
+
+        result = pymesync.TimeSync(baseurl=self.server.url).authenticate(
+            username="user0", password="password", auth_type="password")
+
+        self.assertIn("pymesync error", result)
+
+    def test_conditional_get(self):
+        pooled = transport.install()
+
+        ts = self.sign_in()
+        first = ts.get_projects()
+        second = ts.get_projects()
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.request_count(), 3)
+        self.assertEqual(self.server.not_modified, 1)
+        self.assertEqual(pooled.cache.counts["revalidated"], 1)
+
+        # The cached response outlives the token it was requested with
+        self.assertEqual(self.sign_in().get_projects(), first)
+        self.assertEqual(self.server.not_modified, 2)
+
+    def test_no_validators(self):
+        self.server.validators = False
+
+        pooled = transport.install(cache_ttl=60)
+
+        ts = self.sign_in()
+        first = ts.get_activities()
+
+        self.assertEqual(ts.get_activities(), first)
+        self.assertEqual(self.server.request_count(), 2)
+        self.assertEqual(pooled.cache.counts["fresh"], 1)
+
+        pooled.cache.ttl = 0
+        ts.get_activities()
+
+        self.assertEqual(self.server.request_count(), 3)
+
+    def test_write_invalidates(self):
+        self.server.validators = False
+
+        transport.install()
+
+        ts = self.sign_in()
+        ts.get_projects()
+        ts.create_project({"uri": "https://example.com/new",
+                           "name": "New project", "slugs": ["new"]})
+        ts.get_activities()
+
+        slugs = [p["slugs"][0] for p in ts.get_projects()]
+
+        self.assertIn("new", slugs)
+        self.assertEqual(self.server.request_count(), 5)
+
+        transport.clear_cache()
+        ts.get_activities()
+
+        self.assertEqual(self.server.request_count(), 6)
+
+    def test_cache_key(self):
+        ts = self.sign_in()
+        url = "{}/projects?include_deleted=true&token={}".format(
+            self.server.url, ts.token)
+
+        key = transport.cache_key(url)
+
+        self.assertEqual(key[0], "user0")
+        self.assertEqual(key[3], "include_deleted=true")
+        self.assertEqual(transport.request_endpoints(url), ("projects",))
+        self.assertEqual(transport.request_endpoints(
+            self.server.url + "/users/projects"), ("users",))
+        self.assertEqual(transport.request_endpoints(
+            self.server.url + "/projects/gwm/users?token=x"),
+            ("projects", "users"))
+        self.assertEqual(transport.request_endpoints(
+            self.server.url + "/times?token=x"), ())
+
+    def test_write_invalidates_project_users(self):
+        self.server.validators = False
+
+        transport.install()
+
+        ts = self.sign_in()
+        ts.project_users(project="p0")
+        ts.project_users(project="p0")
+
+        self.assertEqual(self.server.request_count(), 2)
+
+        # Changing the project's members and deleting a user both change
+        # its list of users
+        ts.update_project(project={"users": {}}, slug="p0")
+        ts.project_users(project="p0")
+
+        self.assertEqual(self.server.request_count(), 4)
+
+        ts.delete_user(username="user4")
+        ts.project_users(project="p0")
+
+        self.assertEqual(self.server.request_count(), 6)
+
+    def test_project_users_endpoint(self):
+        self.server.validators = False
+
+        pooled = transport.install()
+        pooled.get(self.server.url + "/projects/p0/users?token=x")
+        pooled.get(self.server.url + "/projects/p0/users?token=x")
+
+        self.assertEqual(self.server.request_count(), 1)
+
+        pooled.delete(self.server.url + "/users/user4?token=x")
+        pooled.get(self.server.url + "/projects/p0/users?token=x")
+
+        self.assertEqual(self.server.request_count(), 3)
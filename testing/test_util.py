@@ -1,13 +1,20 @@
 from datetime import datetime
+import os
+import shutil
 import stat
+import tempfile
+import time
 import ConfigParser
+import codecs
 from StringIO import StringIO
 
 import unittest
 
 from climesync import util
+from climesync.timetable import TimeTable
 
 from mock import patch, MagicMock
+from requests.exceptions import ConnectionError
 
 
 class UtilTest(unittest.TestCase):
@@ -22,6 +29,41 @@ class UtilTest(unittest.TestCase):
 
         assert util.ts_error(*ts_objects)
 
+    def test_map_concurrently(self):
+        items = range(20)
+
+        results = list(util.map_concurrently(lambda i: i * 2, items, 4))
+
+        assert results == [i * 2 for i in items]
+
+    def test_map_concurrently_stop_early(self):
+        results = util.map_concurrently(lambda i: i, range(20), 4)
+
+        assert next(results) == 0
+
+        results.close()
+
+        self.assertRaises(StopIteration, next, results)
+
+    def test_map_concurrently_bounded(self):
+        fetched = []
+
+        def fetch(i):
+            fetched.append(i)
+            return i
+
+        results = util.map_concurrently(fetch, range(200), 4)
+
+        # Give the workers time to run ahead of a slow consumer
+        for consumed in range(1, 11):
+            assert next(results) == consumed - 1
+
+            time.sleep(0.02)
+
+            assert len(fetched) - consumed <= 4
+
+        results.close()
+
     @patch("climesync.util.codecs.open")
     @patch("climesync.util.os.chmod")
     @patch("climesync.util.os.path")
@@ -106,9 +148,9 @@ class UtilTest(unittest.TestCase):
 
     @patch("climesync.util.create_config")
     @patch("climesync.util.read_config")
-    @patch("climesync.util.codecs.open")
-    def test_write_config_file_exists(self, mock_open, mock_read_config,
-                                      mock_create_config):
+    @patch("climesync.util.write_private_file")
+    def test_write_config_file_exists(self, mock_write_private_file,
+                                      mock_read_config, mock_create_config):
         section_name = "climesync"
         path = "~/.climesyncrc"
         key = "key"
@@ -116,10 +158,8 @@ class UtilTest(unittest.TestCase):
 
         mock_config = MagicMock()
         mock_config.sections.return_value = [section_name]
+        mock_config.write.side_effect = lambda f: f.write("key = value\n")
 
-        mock_file = MagicMock(spec=file)
-
-        mock_open.return_value.__enter__.return_value = mock_file
         mock_read_config.return_value = mock_config
 
         util.write_config(key, value, path=path)
@@ -127,12 +167,14 @@ class UtilTest(unittest.TestCase):
         mock_create_config.assert_not_called()
         mock_config.set.assert_called_with(section_name, key, value)
         mock_config.add_section.assert_not_called()
-        mock_config.write.assert_called_with(mock_file)
+        mock_write_private_file.assert_called_with(
+            path, "# Climesync configuration file\nkey = value\n")
 
     @patch("climesync.util.create_config")
     @patch("climesync.util.read_config")
-    @patch("climesync.util.codecs.open")
-    def test_write_config_file_not_exist(self, mock_open, mock_read_config,
+    @patch("climesync.util.write_private_file")
+    def test_write_config_file_not_exist(self, mock_write_private_file,
+                                         mock_read_config,
                                          mock_create_config):
         section_name = "climesync"
         path = "~/.climesyncrc"
@@ -164,6 +206,35 @@ class UtilTest(unittest.TestCase):
 
         mock_create_config.assert_not_called()
 
+    def test_read_config_cached(self):
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, "climesyncrc")
+
+        util.config_file = None
+
+        try:
+            util.write_config("username", "test", path=path)
+
+            with patch("climesync.util.codecs.open") as mock_open:
+                config = util.read_config(path)
+
+                mock_open.assert_not_called()
+
+            assert config.get("climesync", "username") == "test"
+            assert stat.S_IMODE(os.stat(path).st_mode) == \
+                stat.S_IRUSR | stat.S_IWUSR
+
+            # Edited by hand since it was last read
+            with open(path, "w") as f:
+                f.write("[climesync]\nusername = other\nldap = True\n")
+
+            config = util.read_config(path)
+
+            assert config.get("climesync", "username") == "other"
+        finally:
+            util.config_file = None
+            shutil.rmtree(tempdir)
+
     @patch("climesync.util.os.path.exists")
     def test_session_exists_true(self, mock_exists):
         mock_exists.return_value = True
@@ -265,6 +336,93 @@ class UtilTest(unittest.TestCase):
 
         assert not mock_remove.mock_calls
 
+    def test_metadata_cache(self):
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, "metadata")
+
+        metadata = {
+            "user": {"username": "test"},
+            "users": ["test"],
+            "projects": ["gwm"],
+            "activities": ["code"]
+        }
+
+        try:
+            util.write_metadata_cache("ts_url", "test", metadata, path=path)
+
+            assert stat.S_IMODE(os.stat(path).st_mode) == \
+                stat.S_IRUSR | stat.S_IWUSR
+            assert util.read_metadata_cache("ts_url", "test", 60,
+                                            path=path) == metadata
+            assert not util.read_metadata_cache("ts_url", "other", 60,
+                                                path=path)
+            assert not util.read_metadata_cache("other_url", "test", 60,
+                                                path=path)
+        finally:
+            shutil.rmtree(tempdir)
+
+    @patch("climesync.util.current_timestamp")
+    def test_metadata_cache_expired(self, mock_timestamp):
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, "metadata")
+
+        try:
+            mock_timestamp.return_value = 1000.0
+            util.write_metadata_cache("ts_url", "test", {}, path=path)
+
+            mock_timestamp.return_value = 1061.0
+            assert util.read_metadata_cache("ts_url", "test", 60,
+                                            path=path) is None
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_token_store(self):
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, "token")
+
+        try:
+            assert util.read_token("ts_url", "test", "ldap", path=path) is None
+
+            util.write_token("ts_url", "test", "ldap", "TOKEN", path=path)
+            util.write_token("ts_url", "other", "ldap", "OTHER", path=path)
+
+            assert stat.S_IMODE(os.stat(path).st_mode) == \
+                stat.S_IRUSR | stat.S_IWUSR
+            assert util.read_token("ts_url", "test", "ldap",
+                                   path=path) == "TOKEN"
+            assert util.read_token("ts_url", "test", "password",
+                                   path=path) is None
+
+            util.write_token("ts_url", "test", "ldap", None, path=path)
+
+            assert util.read_token("ts_url", "test", "ldap", path=path) is None
+            assert util.read_token("ts_url", "other", "ldap",
+                                   path=path) == "OTHER"
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_clear_metadata_cache(self):
+        tempdir = tempfile.mkdtemp()
+        path = os.path.join(tempdir, "metadata")
+
+        try:
+            util.write_metadata_cache("ts_url", "test", {"a": 1}, path=path)
+            util.write_metadata_cache("other_url", "test", {"b": 2},
+                                      path=path)
+
+            util.clear_metadata_cache("ts_url", path=path)
+
+            assert util.read_metadata_cache("ts_url", "test", 60,
+                                            path=path) is None
+            assert util.read_metadata_cache("other_url", "test", 60,
+                                            path=path) == {"b": 2}
+
+            util.clear_metadata_cache(path=path)
+
+            assert not os.path.exists(path)
+        finally:
+            shutil.rmtree(tempdir)
+
     def test_construct_clock_out_time(self):
         mocked_session = {
             "start_date": "2016-03-14",
@@ -398,6 +556,47 @@ class UtilTest(unittest.TestCase):
 
         assert result == {"error": "Invalid session date/time"}
 
+    def test_sum_times(self):
+        times = [
+            {"project": ["gwm", "ganeti-webmgr"], "user": "userone",
+             "activities": ["code", "docs"], "duration": 3600,
+             "date_worked": "2016-05-02"},
+            {"project": ["gwm"], "user": "usertwo", "activities": [],
+             "duration": 600, "date_worked": "2016-01-03"},
+            {"project": ["ts"], "user": "userone", "activities": ["code"],
+             "duration": 60, "date_worked": "2016-05-08"},
+        ]
+
+        rows = util.sum_times(times, ["week", "activity"])
+
+        assert [row.items() for row in rows] == [
+            [("week", "2015-W53"), ("activity", "-"), ("entries", 1),
+             ("seconds", 600), ("total", "0h10m")],
+            [("week", "2016-W18"), ("activity", "code"), ("entries", 2),
+             ("seconds", 3660), ("total", "1h1m")],
+            [("week", "2016-W18"), ("activity", "docs"), ("entries", 1),
+             ("seconds", 3600), ("total", "1h0m")],
+            [("week", "all"), ("activity", "all"), ("entries", 3),
+             ("seconds", 4260), ("total", "1h11m")],
+        ]
+
+    def test_sum_times_month(self):
+        times = [
+            {"project": ["gwm", "ganeti-webmgr"], "user": "userone",
+             "activities": ["code"], "duration": 3600,
+             "date_worked": "2016-05-02"},
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 600, "date_worked": "2016-05-30"},
+        ]
+
+        rows = util.sum_times(times, ["month", "project"])
+
+        # Both slugs belong to the same project
+        assert [(r["month"], r["project"], r["seconds"]) for r in rows] == [
+            ("2016-05", "gwm", 4200),
+            ("all", "all", 4200)
+        ]
+
     @patch("climesync.util.sys.stdout", new_callable=StringIO)
     def test_print_json_list(self, mock_stdout):
         key = "key"
@@ -409,6 +608,22 @@ class UtilTest(unittest.TestCase):
 
         assert "{}: {}".format(key, value) in mock_stdout.getvalue()
 
+    @patch("climesync.util.sys.stdout", new_callable=StringIO)
+    def test_print_json_generator(self, mock_stdout):
+        def times():
+            yield {"uuid": "abc"}
+            yield {"uuid": "def"}
+
+        util.print_json(times())
+
+        assert mock_stdout.getvalue() == "\nuuid: abc\n\nuuid: def\n\n"
+
+    @patch("climesync.util.sys.stdout", new_callable=StringIO)
+    def test_print_json_detail(self, mock_stdout):
+        util.print_json([{"uuid": "abc"}, "detail"])
+
+        assert mock_stdout.getvalue() == "\nuuid: abc\n\n"
+
     @patch("climesync.util.sys.stdout", new_callable=StringIO)
     def test_print_json_dict(self, mock_stdout):
         key = "key"
@@ -420,6 +635,249 @@ class UtilTest(unittest.TestCase):
 
         assert "{}: {}".format(key, value) in mock_stdout.getvalue()
 
+    @patch("climesync.util.sys.stdout", new_callable=StringIO)
+    def test_output_csv_generator(self, mock_stdout):
+        def times():
+            yield {"duration": 3600, "user": u"us\u00e9r",
+                   "project": ["gwm"], "activities": ["code", "docs"]}
+            yield {"duration": 60, "user": "usertwo", "notes": None}
+
+        util.output_csv(times(), "time")
+
+        lines = mock_stdout.getvalue().decode("utf-8").splitlines()
+
+        assert len(lines) == 3
+        assert lines[0].startswith(u'"duration","user","project"')
+        assert lines[1].startswith(u'"3600","us\u00e9r","[\'gwm\']",'
+                                   u'"[\'code\',\'docs\']"')
+        assert lines[2].startswith(u'"60","usertwo"')
+
+    @patch("climesync.util.sys.stdout", new_callable=StringIO)
+    def test_output_csv_error(self, mock_stdout):
+        util.output_csv([{"error": "Bad request"}], "time")
+
+        assert mock_stdout.getvalue() == ""
+
+    def test_read_times_file_csv(self):
+        times_file = StringIO(
+            '\xef\xbb\xbf"duration","project","activities","date_worked",'
+            '"notes","uuid"\r\n'
+            '"3600","[\'gwm\',\'ganeti-webmgr\']","[\'docs\',\'dev\']",'
+            '"2016-05-04","Caf\xc3\xa9","1234"\r\n'
+            '"1h30m","ts","dev plan","","",""\r\n')
+
+        rows = list(util.read_times_file(times_file, "csv"))
+
+        assert rows[0] == (2, {"duration": 3600, "project": "gwm",
+                               "activities": ["docs", "dev"],
+                               "date_worked": "2016-05-04",
+                               "notes": u"Caf\xe9"}, None)
+        assert rows[1][0] == 3
+        assert rows[1][1]["duration"] == "1h30m"
+        assert rows[1][1]["activities"] == ["dev", "plan"]
+        assert util.is_date(rows[1][1]["date_worked"])
+
+    def test_read_times_file_jsonl(self):
+        times_file = StringIO(
+            '{"duration": 60, "project": ["gwm"], "activities": ["dev"],'
+            ' "date_worked": "2016-05-04"}\n'
+            '\n'
+            'not json\n'
+            '[1, 2]\n')
+
+        rows = list(util.read_times_file(times_file, "jsonl"))
+
+        assert rows[0] == (1, {"duration": 60, "project": "gwm",
+                               "activities": ["dev"],
+                               "date_worked": "2016-05-04"}, None)
+        assert rows[1][0] == 3 and rows[1][1] is None and rows[1][2]
+        assert rows[2][0] == 4 and rows[2][1] is None and rows[2][2]
+
+    def test_read_uuids(self):
+        uuids_file = StringIO(codecs.BOM_UTF8 + "abc-123\n"
+                              "\n"
+                              "# Times from the bad import\n"
+                              "  def-456  \n")
+
+        assert list(util.read_uuids(uuids_file)) == ["abc-123", "def-456"]
+
+    @patch("climesync.util.sleep")
+    def test_call_with_retries(self, mock_sleep):
+        responses = [{"pymesync error": ConnectionError()},
+                     {"error": "Internal Server Error", "status": 502},
+                     {"uuid": "abc-123"}]
+        func = MagicMock(side_effect=responses)
+
+        assert util.call_with_retries(func, retries=2) == {"uuid": "abc-123"}
+        assert func.call_count == 3
+        assert mock_sleep.call_count == 2
+
+    def test_is_transient_error(self):
+        failed = "connection to TimeSync failed at baseurl x - response " \
+                 "status was {}"
+
+        assert util.is_transient_error({"pymesync error": ConnectionError()})
+        assert util.is_transient_error({"pymesync error": failed.format(502)})
+        assert util.is_transient_error({"error": "Bad Gateway",
+                                        "status": 502})
+
+        assert not util.is_transient_error({"pymesync error":
+                                            failed.format(404)})
+        assert not util.is_transient_error({"pymesync error":
+                                            "time object: invalid duration "
+                                            "string"})
+        assert not util.is_transient_error({"pymesync error":
+                                            "Not authenticated with "
+                                            "TimeSync, call "
+                                            "self.authenticate() first"})
+        assert not util.is_transient_error({"error": "Object not found",
+                                            "status": 404})
+
+    @patch("climesync.util.sleep")
+    def test_call_with_retries_permanent_error(self, mock_sleep):
+        error = {"pymesync error": "time object: invalid duration string"}
+        func = MagicMock(return_value=error)
+
+        assert util.call_with_retries(func, retries=2) == error
+        assert func.call_count == 1
+        mock_sleep.assert_not_called()
+
+    @patch("climesync.util.sleep")
+    def test_call_with_retries_not_found(self, mock_sleep):
+        error = {"error": "Object not found", "status": 404}
+        func = MagicMock(return_value=error)
+
+        assert util.call_with_retries(func, retries=2) == error
+        assert func.call_count == 1
+        mock_sleep.assert_not_called()
+
+    def test_date_windows(self):
+        windows = util.date_windows("2016-01-30", "2016-02-10", 5)
+
+        assert windows == [("2016-01-30", "2016-02-03"),
+                           ("2016-02-04", "2016-02-08"),
+                           ("2016-02-09", "2016-02-10")]
+
+        assert util.date_windows("2016-02-10", "2016-01-30", 5) == []
+
+    def test_sort_times(self):
+        times = [
+            {"uuid": "a", "date_worked": "2016-05-02"},
+            {"uuid": "b", "date_worked": "2015-12-31"},
+            {"uuid": "c", "date_worked": "2016-05-02"},
+            {"uuid": "d", "date_worked": "2016-01-15"},
+        ]
+
+        sorted_times = util.sort_times(times)
+
+        assert [t["uuid"] for t in sorted_times] == ["b", "d", "a", "c"]
+
+    @patch("climesync.util.sys.stdout", new_callable=StringIO)
+    def test_print_pretty_time_sorted(self, mock_stdout):
+        times = [
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 60, "date_worked": "2016-05-03"},
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 60, "date_worked": "2016-04-30"},
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 60, "date_worked": "2016-05-01"},
+        ]
+
+        util.print_pretty_time(times)
+
+        assert "gwm - 3 entries (2016-04-30 - 2016-05-03)" in \
+            mock_stdout.getvalue()
+
+    def test_aggregate_project_times(self):
+        times = [
+            {"project": ["gwm", "ganeti-webmgr"], "user": "userone",
+             "activities": ["code", "docs"], "duration": 3600,
+             "date_worked": "2016-05-02"},
+            {"project": ["gwm"], "user": "usertwo", "activities": [],
+             "duration": 600, "date_worked": "2016-04-30"},
+            {"project": ["ts"], "user": "userone", "activities": ["code"],
+             "duration": 60, "date_worked": "2016-04-01"},
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 1200, "date_worked": "2016-03-14"},
+        ]
+
+        summaries = util.aggregate_project_times(times, ["gwm", "ts"])
+
+        assert summaries["gwm"] == {
+            "entries": 3,
+            "first_date": "2016-05-02",
+            "last_date": "2016-03-14",
+            "total": 5400,
+            "activities": {"code": 4800, "docs": 3600},
+            "users": {
+                "userone": {"total": 4800,
+                            "activities": {"code": 4800, "docs": 3600}},
+                "usertwo": {"total": 600, "activities": {}}
+            }
+        }
+        assert summaries["ts"]["total"] == 60
+        assert summaries["ts"]["users"].keys() == ["userone"]
+
+    @patch("climesync.util.sys.stdout", new_callable=StringIO)
+    def test_print_pretty_time(self, mock_stdout):
+        times = [
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 3600, "date_worked": "2016-05-02"},
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 1260, "date_worked": "2016-05-03"},
+        ]
+
+        util.print_pretty_time(times)
+
+        assert mock_stdout.getvalue() == (
+            "\n"
+            "gwm - 2 entries (2016-05-02 - 2016-05-03)\n"
+            "         code      \n"
+            "userone  1h21m     Total: 1h21m\n"
+            "Totals:  1h21m     Total: 1h21m\n"
+            "\n")
+
+    @patch("climesync.util.sys.stdout", new_callable=StringIO)
+    def test_print_pretty_time_table(self, mock_stdout):
+        times = [
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 3600, "date_worked": "2016-05-02",
+             "created_at": "2016-05-02", "uuid": "a"},
+            {"project": ["gwm"], "user": "userone", "activities": ["code"],
+             "duration": 1260, "date_worked": "2016-05-03",
+             "created_at": "2016-05-03", "uuid": "b"},
+        ]
+
+        util.print_pretty(TimeTable(times))
+        summary = mock_stdout.getvalue()
+
+        mock_stdout.truncate(0)
+
+        util.print_pretty(times)
+        assert summary == mock_stdout.getvalue()
+
+        table = TimeTable(times)
+        table.append("detail")
+
+        mock_stdout.truncate(0)
+
+        util.print_pretty(table)
+        assert "uuid: b" in mock_stdout.getvalue()
+        assert "issue_uri: \n" in mock_stdout.getvalue()
+
+    @patch("climesync.util.sys.stdout", new_callable=StringIO)
+    def test_output_csv_table(self, mock_stdout):
+        times = [{"duration": 3600, "user": u"us\u00e9r", "project": ["gwm"],
+                  "activities": ["code", "docs"], "uuid": "a"}]
+
+        util.output_csv(TimeTable(times), "time")
+        table_csv = mock_stdout.getvalue()
+
+        mock_stdout.truncate(0)
+
+        util.output_csv(times, "time")
+        assert table_csv == mock_stdout.getvalue()
+
     def test_is_time(self):
         self.assertFalse(util.is_time("AhBm"))
         self.assertFalse(util.is_time("hm"))
@@ -441,6 +899,37 @@ class UtilTest(unittest.TestCase):
         self.assertEqual(util.to_readable_time(3600), "1h0m")
         self.assertEqual(util.to_readable_time(1000), "0h16m")
 
+    def test_summarize_project_times(self):
+        times = [
+            {"project": ["gwm", "ganeti-webmgr"], "duration": 3600,
+             "date_worked": "2016-05-02"},
+            {"project": ["ts"], "duration": 1800,
+             "date_worked": "2016-04-30"},
+            {"project": ["gwm"], "duration": 600,
+             "date_worked": "2016-04-01"},
+            {"project": ["other"], "duration": 60,
+             "date_worked": "2016-01-01"},
+        ]
+
+        expected_summaries = {
+            "gwm": {
+                "time_total": "1h10m",
+                "num_times": 2,
+                "latest_time": "2016-05-02",
+                "first_time": "2016-04-01"
+            },
+            "ts": {
+                "time_total": "0h30m",
+                "num_times": 1,
+                "latest_time": "2016-04-30",
+                "first_time": "2016-04-30"
+            }
+        }
+
+        summaries = util.summarize_project_times(times, ["gwm", "ts", "ps"])
+
+        assert summaries == expected_summaries
+
     @patch("climesync.util.raw_input")
     def test_get_field_string(self, mock_raw_input):
         prompt = "Prompt"